@@ -4,62 +4,183 @@ PDF OCR API Server - Flask-based API wrapper for pdf_ocr_client.py
 
 This server provides a REST API endpoint to process PDF files using OCR.
 It returns a zip file containing markdown results, extracted images, and log files.
+Long documents should go through the asynchronous job endpoints instead, which
+queue the work on a bounded worker pool and return immediately. Progress is
+kept per document (keyed by the PDF content hash), so resubmitting a PDF whose
+earlier request or job failed resumes from the last completed page.
 
 Usage:
-    python api_server.py [--port PORT] [--host HOST]
+    python api_server.py [--port PORT] [--host HOST] [--job-workers N]
 
-API Endpoint:
+    The synchronous endpoint is safe to serve from several threads or worker
+    processes, e.g. ``gunicorn -w 4 --threads 4 api_server:app``: runs for the
+    same document are serialized with an ``flock`` on its lock file in the
+    state directory, which must therefore be on a local file system (without
+    ``fcntl``, i.e. on Windows, use a single process). Jobs live in the memory
+    of the process that accepted them, so the job endpoints need a single
+    (multi-threaded) process.
+
+API Endpoints:
     POST /api/ocr
 
     Request:
         - Multipart form data with:
           - pdf_file: PDF file to process
-          - api_base: (optional) OCR API base URL (default: http://localhost:5123)
+          - api_base: (optional) OCR API base URL, or a comma-separated list of
+            base URLs (default: the server's --ocr-api-base)
 
     Response:
-        - ZIP file containing:
+        - ZIP file, streamed while it is being compressed, containing:
           - *.md: Markdown output
           - *.png: Extracted images
           - stdout.log.txt: Standard output log
           - stderr.log.txt: Standard error log
+
+    POST /api/jobs
+        Same form fields as /api/ocr. Returns 202 with the job id and URLs.
+
+    GET /api/jobs/<job_id>
+        Job state (queued, running, succeeded, failed) and per-page progress.
+
+    GET /api/jobs/<job_id>/events[?format=sse]
+        Stream of per-page results as NDJSON (or server-sent events): one
+        event per page with its cleaned layout blocks and markdown fragment,
+        published in page order as soon as the page is recognized, then a
+        final summary event. Footnote markers in a fragment are resolved
+        against its own page only, so use /result for the exact exported
+        markdown.
+
+    GET /api/jobs/<job_id>/result
+        The result zip (same content as /api/ocr) once the job has finished.
+
+    DELETE /api/jobs/<job_id>
+        Remove a finished or queued job and its files.
 """
 
 import os
 import sys
 import io
+import json
 import tempfile
 import shutil
 import zipfile
 import argparse
+import threading
+from collections import OrderedDict
 from pathlib import Path
-from contextlib import redirect_stdout, redirect_stderr
-from flask import Flask, request, send_file, jsonify
+from flask import Flask, Response, request, send_file, jsonify, stream_with_context, url_for
 from werkzeug.utils import secure_filename
 
 # Import PDFOCRClient
 from pdf_ocr_client import PDFOCRClient
+from ocr_backend import EndpointPool, OCRTransport
+from ocr_jobs import DocumentStateStore, JobManager, JobQueueFullError, file_sha256
+from ocr_cache import DEFAULT_CACHE_PATH, PageCache
+from ocr_raster import create_render_pool
+from ocr_utils import parse_image_encoding
 
 app = Flask(__name__)
 app.config['MAX_CONTENT_LENGTH'] = 100 * 1024 * 1024  # 100MB max file size
+app.config['OCR_API_BASE'] = os.environ.get('DOTS_OCR_API_BASE', 'http://localhost:5123')
+app.config['JOBS_DIR'] = os.path.join(tempfile.gettempdir(), 'pdf_ocr_jobs')
+app.config['JOB_WORKERS'] = 2
+app.config['MAX_PENDING_JOBS'] = 100
+app.config['JOB_RETENTION_SECONDS'] = 24 * 3600
+app.config['STATE_DIR'] = os.path.join(tempfile.gettempdir(), 'pdf_ocr_state')
+app.config['STATE_RETENTION_SECONDS'] = 72 * 3600
+app.config['PAGE_CACHE_PATH'] = str(DEFAULT_CACHE_PATH)  # None disables the page cache
+app.config['PAGE_CACHE_MAX_BYTES'] = 2 * 1024 * 1024 * 1024
+app.config['IMAGE_ENCODING'] = 'png'  # Wire encoding of page images, see ocr_utils.IMAGE_ENCODINGS
+app.config['TEXT_LAYER'] = False  # Read born-digital pages from their text layer, see ocr_text_layer.py
+app.config['TEXT_LAYER_OCR'] = False  # ... and recognize their formula and table regions
+app.config['RENDER_WORKERS'] = 0  # Processes rendering the pages of all documents, 0: a thread per document
+
+# OCR transports shared by all requests, keyed by the api_base string, so that
+# keep-alive connections, in-flight counts, latencies and drained endpoints are
+# shared across requests. api_base comes from the client, so only the most
+# recently used ones are kept besides the configured default.
+MAX_OCR_TRANSPORTS = 8
+_ocr_transports = OrderedDict()
+_ocr_transports_lock = threading.Lock()
+
+
+_page_cache = None
+_page_cache_lock = threading.Lock()
+
+_state_store = None
+_state_store_lock = threading.Lock()
+
+_render_pool = None
+_render_pool_lock = threading.Lock()
+
+
+def get_state_store():
+    """Return the per-document progress store, creating it from the app config on first use"""
+    global _state_store
+    with _state_store_lock:
+        if _state_store is None:
+            _state_store = DocumentStateStore(app.config['STATE_DIR'],
+                                              retention_seconds=app.config['STATE_RETENTION_SECONDS'])
+        return _state_store
+
+
+def get_page_cache():
+    """Return the page cache shared by all requests, or None if disabled"""
+    global _page_cache
+    with _page_cache_lock:
+        if _page_cache is None and app.config['PAGE_CACHE_PATH']:
+            _page_cache = PageCache(app.config['PAGE_CACHE_PATH'], max_bytes=app.config['PAGE_CACHE_MAX_BYTES'])
+        return _page_cache
+
+
+def get_render_pool():
+    """Return the render process pool shared by all requests, or None if pages are rendered in threads"""
+    global _render_pool
+    with _render_pool_lock:
+        if _render_pool is None and app.config['RENDER_WORKERS'] > 0:
+            _render_pool = create_render_pool(app.config['RENDER_WORKERS'])
+        return _render_pool
+
+
+def get_ocr_transport(api_base):
+    """Return the shared OCRTransport for a comma-separated list of base URLs"""
+    def normalize(value):
+        return ','.join(url.strip().rstrip('/') for url in value.split(',') if url.strip())
+
+    key = normalize(api_base)
+    default_key = normalize(app.config['OCR_API_BASE'])
+    with _ocr_transports_lock:
+        transport = _ocr_transports.get(key)
+        if transport is None:
+            transport = _ocr_transports[key] = OCRTransport(EndpointPool.from_string(key))
+        _ocr_transports.move_to_end(key)
+        # Evict least recently used client-supplied bases, closing their sessions
+        evictable = [k for k in _ocr_transports if k not in (key, default_key)]
+        for old_key in evictable[:max(0, len(_ocr_transports) - MAX_OCR_TRANSPORTS)]:
+            _ocr_transports.pop(old_key).close()
+        return transport
 
 
 class OutputCapture:
-    """Context manager to capture stdout and stderr"""
+    """
+    Per-request log buffers
+
+    The buffers are handed to PDFOCRClient as its output streams instead of
+    redirecting the process-wide sys.stdout/sys.stderr, so concurrent requests
+    and jobs each get their own logs.
+    """
 
     def __init__(self):
         self.stdout_buffer = io.StringIO()
         self.stderr_buffer = io.StringIO()
 
-    def __enter__(self):
-        self.stdout_redirect = redirect_stdout(self.stdout_buffer)
-        self.stderr_redirect = redirect_stderr(self.stderr_buffer)
-        self.stdout_redirect.__enter__()
-        self.stderr_redirect.__enter__()
-        return self
-
-    def __exit__(self, exc_type, exc_val, exc_tb):
-        self.stdout_redirect.__exit__(exc_type, exc_val, exc_tb)
-        self.stderr_redirect.__exit__(exc_type, exc_val, exc_tb)
+    def create_client(self, pdf_path, output_folder, **kwargs):
+        """Create a PDFOCRClient that logs into these buffers and uses the shared page cache"""
+        return PDFOCRClient(pdf_path, output_folder, stdout=self.stdout_buffer,
+                            stderr=self.stderr_buffer, cache=get_page_cache(),
+                            image_encoding=app.config['IMAGE_ENCODING'], text_layer=app.config['TEXT_LAYER'],
+                            text_layer_ocr=app.config['TEXT_LAYER_OCR'], render_pool=get_render_pool(),
+                            render_workers=app.config['RENDER_WORKERS'], **kwargs)
 
     def get_stdout(self):
         return self.stdout_buffer.getvalue()
@@ -68,7 +189,21 @@ class OutputCapture:
         return self.stderr_buffer.getvalue()
 
 
-def create_zip_from_folder(folder_path, stdout_log, stderr_log):
+# Files that are already compressed are stored in the zip instead of deflated again
+PRECOMPRESSED_SUFFIXES = {'.png', '.jpg', '.jpeg', '.webp', '.gif', '.zip', '.gz'}
+
+# Size of the pieces a streamed zip is sent in
+ZIP_STREAM_CHUNK_SIZE = 256 * 1024
+
+
+def zip_compress_type(file_path):
+    """Choose the zip compression method for a file"""
+    if Path(file_path).suffix.lower() in PRECOMPRESSED_SUFFIXES:
+        return zipfile.ZIP_STORED
+    return zipfile.ZIP_DEFLATED
+
+
+def create_zip_from_folder(folder_path, stdout_log, stderr_log, target=None):
     """
     Create a zip file from a folder and add log files
 
@@ -76,34 +211,175 @@ def create_zip_from_folder(folder_path, stdout_log, stderr_log):
         folder_path: Path to the folder containing results
         stdout_log: Standard output log content
         stderr_log: Standard error log content
+        target: Optional file path to write the zip to instead of memory
 
     Returns:
-        BytesIO object containing the zip file
+        BytesIO object containing the zip file, or ``target`` if given
     """
-    zip_buffer = io.BytesIO()
+    zip_buffer = target if target is not None else io.BytesIO()
 
     with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
         # Add all files from the output folder
         folder = Path(folder_path)
-        for file_path in folder.rglob('*'):
+        for file_path in sorted(folder.rglob('*')):
             if file_path.is_file():
                 arcname = file_path.relative_to(folder)
-                zip_file.write(file_path, arcname)
+                zip_file.write(file_path, arcname, compress_type=zip_compress_type(file_path))
 
         # Add log files
         zip_file.writestr('stdout.log.txt', stdout_log)
         zip_file.writestr('stderr.log.txt', stderr_log)
 
-    zip_buffer.seek(0)
+    if target is None:
+        zip_buffer.seek(0)
     return zip_buffer
 
 
+class ZipStreamBuffer(io.RawIOBase):
+    """Unseekable sink collecting the bytes zipfile writes until they are sent"""
+
+    def __init__(self):
+        self._chunks = []
+        self._size = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._size += len(data)
+        return len(data)
+
+    def __len__(self):
+        return self._size
+
+    def drain(self):
+        """Return and forget the bytes written so far"""
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        self._size = 0
+        return data
+
+
+def iter_zip_from_folder(folder_path, stdout_log, stderr_log, chunk_size=ZIP_STREAM_CHUNK_SIZE):
+    """
+    Generate a zip of a folder plus log files, chunk by chunk
+
+    The archive is never held in memory as a whole: zipfile writes to an
+    unseekable buffer (using data descriptors instead of seeking back to patch
+    headers) which is drained every ``chunk_size`` bytes, so the client gets
+    the first bytes while later files are still being compressed.
+
+    Args:
+        folder_path: Path to the folder containing results
+        stdout_log: Standard output log content
+        stderr_log: Standard error log content
+        chunk_size: Approximate size of the yielded chunks
+
+    Yields:
+        Consecutive pieces of the zip file
+    """
+    buffer = ZipStreamBuffer()
+
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
+        folder = Path(folder_path)
+        for file_path in sorted(folder.rglob('*')):
+            if not file_path.is_file():
+                continue
+            zip_info = zipfile.ZipInfo.from_file(file_path, file_path.relative_to(folder))
+            zip_info.compress_type = zip_compress_type(file_path)
+            with open(file_path, 'rb') as src, zip_file.open(zip_info, 'w') as dest:
+                while True:
+                    data = src.read(chunk_size)
+                    if not data:
+                        break
+                    dest.write(data)
+                    if len(buffer) >= chunk_size:
+                        yield buffer.drain()
+
+        zip_file.writestr('stdout.log.txt', stdout_log)
+        zip_file.writestr('stderr.log.txt', stderr_log)
+
+    yield buffer.drain()
+
+
+def remove_temp_dir(temp_dir):
+    """Remove a request's temporary directory, logging failures"""
+    if temp_dir and os.path.exists(temp_dir):
+        try:
+            shutil.rmtree(temp_dir)
+        except Exception as e:
+            print(f"Warning: Failed to clean up temporary directory: {e}", file=sys.stderr)
+
+
+_job_manager = None
+_job_manager_lock = threading.Lock()
+
+
+def get_job_manager():
+    """Return the job manager, creating it from the app config on first use"""
+    global _job_manager
+    with _job_manager_lock:
+        if _job_manager is None:
+            _job_manager = JobManager(
+                app.config['JOBS_DIR'],
+                run_ocr_job,
+                max_workers=app.config['JOB_WORKERS'],
+                max_pending=app.config['MAX_PENDING_JOBS'],
+                retention_seconds=app.config['JOB_RETENTION_SECONDS']
+            )
+        return _job_manager
+
+
+def run_ocr_job(job):
+    """Run a queued OCR job on a worker thread and write its result zip"""
+    capture = OutputCapture()
+    with get_state_store().use(file_sha256(job.pdf_path)) as progress_file:
+        client = capture.create_client(str(job.pdf_path), str(job.output_folder),
+                                       transport=get_ocr_transport(job.api_base),
+                                       on_page_result=job.events.page_finished,
+                                       progress_file=progress_file)
+        job.events.start(client.render_page_markdown, client.apply_footnote_references)
+        job.client = client
+        success = client.run()
+
+    # Keep the logs with partial results even if the job failed
+    create_zip_from_folder(job.output_folder, capture.get_stdout(), capture.get_stderr(),
+                           target=job.result_path)
+    if not success:
+        raise RuntimeError('OCR processing failed')
+
+
+def validate_pdf_upload():
+    """
+    Return the uploaded PDF file of the current request
+
+    Returns:
+        Tuple of (file, None) or (None, error response)
+    """
+    if 'pdf_file' not in request.files:
+        return None, (jsonify({'error': 'No pdf_file provided'}), 400)
+
+    pdf_file = request.files['pdf_file']
+
+    if pdf_file.filename == '':
+        return None, (jsonify({'error': 'Empty filename'}), 400)
+
+    if not pdf_file.filename.lower().endswith('.pdf'):
+        return None, (jsonify({'error': 'File must be a PDF'}), 400)
+
+    return pdf_file, None
+
+
 @app.route('/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
+    cache = get_page_cache()
     return jsonify({
         'status': 'healthy',
-        'service': 'PDF OCR API Server'
+        'service': 'PDF OCR API Server',
+        'ocr_endpoints': get_ocr_transport(app.config['OCR_API_BASE']).pool.status(),
+        'page_cache': cache.stats() if cache else None
     })
 
 
@@ -115,30 +391,25 @@ def process_pdf():
     Request:
         - Multipart form data with:
           - pdf_file: PDF file to process
-          - api_base: (optional) OCR API base URL
+          - api_base: (optional) OCR API base URL(s), comma-separated
 
     Response:
         - ZIP file containing results and logs
     """
     # Check if file is present
-    if 'pdf_file' not in request.files:
-        return jsonify({'error': 'No pdf_file provided'}), 400
-
-    pdf_file = request.files['pdf_file']
-
-    if pdf_file.filename == '':
-        return jsonify({'error': 'Empty filename'}), 400
-
-    if not pdf_file.filename.lower().endswith('.pdf'):
-        return jsonify({'error': 'File must be a PDF'}), 400
+    pdf_file, error = validate_pdf_upload()
+    if error:
+        return error
 
     # Get optional parameters
-    api_base = request.form.get('api_base', 'http://localhost:5123')
+    api_base = request.form.get('api_base') or app.config['OCR_API_BASE']
 
     # Create temporary directories
     temp_dir = tempfile.mkdtemp(prefix='pdf_ocr_api_')
     pdf_path = None
     output_folder = None
+    # Once the zip is being streamed, the stream removes the directory
+    streaming = False
 
     try:
         # Save uploaded PDF to temporary location
@@ -150,35 +421,40 @@ def process_pdf():
         output_folder = os.path.join(temp_dir, 'output')
         os.makedirs(output_folder, exist_ok=True)
 
-        # Capture stdout and stderr
-        with OutputCapture() as capture:
-            # Create client and run OCR
-            client = PDFOCRClient(pdf_path, output_folder, api_base)
+        # Capture this request's stdout and stderr
+        capture = OutputCapture()
+
+        # Create client and run OCR, resuming from earlier attempts on the same PDF
+        with get_state_store().use(file_sha256(pdf_path)) as progress_file:
+            client = capture.create_client(pdf_path, output_folder, transport=get_ocr_transport(api_base),
+                                           progress_file=progress_file)
             success = client.run()
 
-            if not success:
-                stderr_content = capture.get_stderr()
-                stdout_content = capture.get_stdout()
-                return jsonify({
-                    'error': 'OCR processing failed',
-                    'stdout': stdout_content,
-                    'stderr': stderr_content
-                }), 500
+        if not success:
+            stderr_content = capture.get_stderr()
+            stdout_content = capture.get_stdout()
+            return jsonify({
+                'error': 'OCR processing failed',
+                'stdout': stdout_content,
+                'stderr': stderr_content
+            }), 500
 
         # Get captured logs
         stdout_log = capture.get_stdout()
         stderr_log = capture.get_stderr()
 
-        # Create zip file with results and logs
-        zip_buffer = create_zip_from_folder(output_folder, stdout_log, stderr_log)
+        # Stream the zip file with results and logs while it is created
+        def generate():
+            try:
+                yield from iter_zip_from_folder(output_folder, stdout_log, stderr_log)
+            finally:
+                remove_temp_dir(temp_dir)
 
-        # Send zip file
-        return send_file(
-            zip_buffer,
-            mimetype='application/zip',
-            as_attachment=True,
-            download_name=f'{Path(filename).stem}_ocr_results.zip'
-        )
+        response = Response(stream_with_context(generate()), mimetype='application/zip')
+        download_name = f'{Path(filename).stem}_ocr_results.zip'
+        response.headers['Content-Disposition'] = f'attachment; filename="{download_name}"'
+        streaming = True
+        return response
 
     except Exception as e:
         import traceback
@@ -190,11 +466,129 @@ def process_pdf():
 
     finally:
         # Clean up temporary directory
-        if temp_dir and os.path.exists(temp_dir):
-            try:
-                shutil.rmtree(temp_dir)
-            except Exception as e:
-                print(f"Warning: Failed to clean up temporary directory: {e}", file=sys.stderr)
+        if not streaming:
+            remove_temp_dir(temp_dir)
+
+
+@app.route('/api/jobs', methods=['POST'])
+def submit_job():
+    """
+    Queue a PDF for OCR and return immediately
+
+    Request:
+        - Multipart form data, same fields as /api/ocr
+
+    Response:
+        - 202 with the job id, status URL and result URL
+    """
+    pdf_file, error = validate_pdf_upload()
+    if error:
+        return error
+
+    api_base = request.form.get('api_base') or app.config['OCR_API_BASE']
+    filename = secure_filename(pdf_file.filename)
+
+    try:
+        job = get_job_manager().submit(filename, api_base, lambda path: pdf_file.save(str(path)))
+    except JobQueueFullError as e:
+        return jsonify({'error': str(e)}), 503
+    except Exception as e:
+        return jsonify({'error': f'Failed to create job: {e}'}), 400
+
+    return jsonify({
+        'job_id': job.job_id,
+        'state': job.state,
+        'total_pages': job.total_pages,
+        'status_url': url_for('job_status', job_id=job.job_id),
+        'events_url': url_for('job_events', job_id=job.job_id),
+        'result_url': url_for('job_result', job_id=job.job_id)
+    }), 202
+
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    """Return the state and per-page progress of a job"""
+    manager = get_job_manager()
+    job = manager.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+
+    status = job.status()
+    status['queue_position'] = manager.queue_position(job)
+    status['events_url'] = url_for('job_events', job_id=job_id)
+    if job.finished and job.result_path.exists():
+        status['result_url'] = url_for('job_result', job_id=job_id)
+    return jsonify(status)
+
+
+@app.route('/api/jobs/<job_id>/events', methods=['GET'])
+def job_events(job_id):
+    """
+    Stream per-page results of a job
+
+    Query parameters:
+        - format: 'ndjson' (default) or 'sse'
+        - since: number of events already received, to resume a stream
+    """
+    job = get_job_manager().get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+
+    use_sse = request.args.get('format', 'ndjson') == 'sse'
+    cursor = request.args.get('since', 0, type=int)
+
+    def generate():
+        nonlocal cursor
+        while True:
+            events, finished = job.events.wait(cursor)
+            cursor += len(events)
+            for event in events:
+                data = json.dumps(event, ensure_ascii=False)
+                if use_sse:
+                    yield f"event: {event['event']}\ndata: {data}\n\n"
+                else:
+                    yield data + '\n'
+            if finished and not events:
+                break
+            if not events and use_sse:
+                yield ': keep-alive\n\n'
+
+    mimetype = 'text/event-stream' if use_sse else 'application/x-ndjson'
+    response = Response(stream_with_context(generate()), mimetype=mimetype)
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@app.route('/api/jobs/<job_id>/result', methods=['GET'])
+def job_result(job_id):
+    """Download the result zip of a finished job"""
+    job = get_job_manager().get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    if not job.finished:
+        return jsonify({'error': f'Job is {job.state}', 'state': job.state}), 409
+    if not job.result_path.exists():
+        return jsonify({'error': job.error or 'No result available', 'state': job.state}), 500
+
+    return send_file(
+        str(job.result_path),
+        mimetype='application/zip',
+        as_attachment=True,
+        download_name=f'{Path(job.filename).stem}_ocr_results.zip'
+    )
+
+
+@app.route('/api/jobs/<job_id>', methods=['DELETE'])
+def delete_job(job_id):
+    """Remove a queued or finished job and its files"""
+    manager = get_job_manager()
+    job = manager.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    if not manager.delete(job_id):
+        return jsonify({'error': 'Running jobs cannot be deleted'}), 409
+    return jsonify({'job_id': job_id, 'deleted': True})
 
 
 def main():
@@ -213,9 +607,18 @@ Examples:
   # Start server on all interfaces
   python api_server.py --host 0.0.0.0 --port 8080
 
+  # Route pages over several OCR servers
+  python api_server.py --ocr-api-base http://gpu1:5123,http://gpu2:5123
+
 API Usage:
   curl -X POST -F "pdf_file=@document.pdf" -F "api_base=http://localhost:5123" \\
        http://localhost:5000/api/ocr -o results.zip
+
+  # Asynchronous: submit, poll or stream per-page results, download
+  curl -X POST -F "pdf_file=@document.pdf" http://localhost:5000/api/jobs
+  curl http://localhost:5000/api/jobs/<job_id>
+  curl -N http://localhost:5000/api/jobs/<job_id>/events
+  curl http://localhost:5000/api/jobs/<job_id>/result -o results.zip
         """
     )
 
@@ -225,14 +628,66 @@ API Usage:
                         help='Host to bind to (default: 127.0.0.1)')
     parser.add_argument('--debug', action='store_true',
                         help='Run in debug mode')
+    parser.add_argument('--ocr-api-base', default=app.config['OCR_API_BASE'],
+                        help='Default OCR API base URL, or a comma-separated list of base URLs '
+                             '(default: $DOTS_OCR_API_BASE or http://localhost:5123)')
+    parser.add_argument('--cache-path', default=app.config['PAGE_CACHE_PATH'],
+                        help='Page result cache shared by all requests (default: %(default)s)')
+    parser.add_argument('--cache-size-mb', type=int, default=app.config['PAGE_CACHE_MAX_BYTES'] // (1024 * 1024),
+                        help='Size limit of the page cache in MB (default: %(default)s)')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='Disable the page result cache')
+    parser.add_argument('--image-encoding', default=app.config['IMAGE_ENCODING'],
+                        help='Wire encoding of page images sent to the OCR API, e.g. png, png:1, gray, '
+                             'bilevel, webp or jpeg:90 (default: %(default)s)')
+    parser.add_argument('--text-layer', action='store_true',
+                        help='Read pages with a trustworthy text layer directly instead of sending them to OCR')
+    parser.add_argument('--text-layer-ocr', action='store_true',
+                        help='With --text-layer, recognize formula and table regions of those pages with OCR')
+    parser.add_argument('--render-workers', type=int, default=app.config['RENDER_WORKERS'],
+                        help='Processes rendering and encoding the pages of all documents; 0 renders each '
+                             'document in a thread of its own (default: %(default)s)')
+    parser.add_argument('--state-dir', default=app.config['STATE_DIR'],
+                        help='Directory for per-document progress used to resume failed requests '
+                             '(default: %(default)s)')
+    parser.add_argument('--state-retention', type=float, default=app.config['STATE_RETENTION_SECONDS'] / 3600,
+                        help='Hours to keep unused per-document progress (default: %(default)s)')
+    parser.add_argument('--jobs-dir', default=app.config['JOBS_DIR'],
+                        help='Directory for queued job files (default: %(default)s)')
+    parser.add_argument('--job-workers', type=int, default=app.config['JOB_WORKERS'],
+                        help='Number of jobs processed at the same time (default: %(default)s)')
+    parser.add_argument('--max-pending-jobs', type=int, default=app.config['MAX_PENDING_JOBS'],
+                        help='Maximum number of queued and running jobs (default: %(default)s)')
+    parser.add_argument('--job-retention', type=float, default=app.config['JOB_RETENTION_SECONDS'] / 3600,
+                        help='Hours to keep finished jobs and their results (default: %(default)s)')
 
     args = parser.parse_args()
+    try:
+        parse_image_encoding(args.image_encoding)
+    except ValueError as e:
+        parser.error(str(e))
+    app.config['OCR_API_BASE'] = args.ocr_api_base
+    app.config['PAGE_CACHE_PATH'] = None if args.no_cache else args.cache_path
+    app.config['PAGE_CACHE_MAX_BYTES'] = args.cache_size_mb * 1024 * 1024
+    app.config['IMAGE_ENCODING'] = args.image_encoding
+    app.config['TEXT_LAYER'] = args.text_layer
+    app.config['TEXT_LAYER_OCR'] = args.text_layer_ocr
+    app.config['RENDER_WORKERS'] = args.render_workers
+    app.config['JOBS_DIR'] = args.jobs_dir
+    app.config['STATE_DIR'] = args.state_dir
+    app.config['STATE_RETENTION_SECONDS'] = args.state_retention * 3600
+    app.config['JOB_WORKERS'] = args.job_workers
+    app.config['MAX_PENDING_JOBS'] = args.max_pending_jobs
+    app.config['JOB_RETENTION_SECONDS'] = args.job_retention * 3600
 
     print(f"Starting PDF OCR API Server on {args.host}:{args.port}")
     print(f"Health check: http://{args.host}:{args.port}/health")
     print(f"OCR endpoint: http://{args.host}:{args.port}/api/ocr")
+    print(f"Job endpoint: http://{args.host}:{args.port}/api/jobs")
 
-    app.run(host=args.host, port=args.port, debug=args.debug)
+    # Requests and jobs log into their own buffers, so the server can handle
+    # them concurrently
+    app.run(host=args.host, port=args.port, debug=args.debug, threaded=True)
 
 
 if __name__ == '__main__':
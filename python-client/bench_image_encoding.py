@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Benchmark the wire encodings of page images sent to the OCR API.
+
+For every encoding the pages of a PDF are rendered once, encoded, and the
+encode time and payload size are reported. With --api-base the pages are
+also recognized and the recognized text is compared with the result of the
+reference encoding (the first one given, png by default), so a cheaper
+encoding can be chosen without losing accuracy.
+
+Usage:
+    python bench_image_encoding.py <pdf_path> [--pages 1-5] [--encodings png,png:1,gray,webp,jpeg]
+                                   [--api-base <url>]
+"""
+
+import argparse
+import difflib
+import io
+import sys
+import time
+from typing import Dict, List, Optional
+
+import fitz  # PyMuPDF
+
+from ocr_backend import EndpointPool, OCRTransport
+from ocr_utils import encode_image_data_url, parse_image_encoding
+from pdf_ocr_client import PDFOCRClient
+
+DEFAULT_ENCODINGS = 'png,png:1,gray:1,bilevel,webp,webp:0,jpeg'
+
+
+def parse_pages(spec: Optional[str], page_count: int) -> List[int]:
+    """Parse a page selection like '1-3,7' into 1-based page numbers"""
+    if not spec:
+        return list(range(1, page_count + 1))
+    pages = []
+    for part in spec.split(','):
+        start, _, end = part.partition('-')
+        pages.extend(range(int(start), int(end or start) + 1))
+    return [page for page in pages if 1 <= page <= page_count]
+
+
+def blocks_text(blocks: Optional[List[Dict]]) -> str:
+    return '\n'.join(block.get('text', '') for block in blocks or [])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark OCR image wire encodings')
+    parser.add_argument('pdf_path', help='PDF file to benchmark with')
+    parser.add_argument('--pages', help='Pages to use, e.g. 1-5,9 (default: all)')
+    parser.add_argument('--encodings', default=DEFAULT_ENCODINGS,
+                        help='Comma-separated encodings; the first one is the accuracy reference '
+                             '(default: %(default)s)')
+    parser.add_argument('--api-base',
+                        help='OCR API base URL(s); when given, the pages are recognized with every '
+                             'encoding and compared with the reference')
+    args = parser.parse_args()
+
+    encodings = [encoding.strip() for encoding in args.encodings.split(',') if encoding.strip()]
+    try:
+        for encoding in encodings:
+            parse_image_encoding(encoding)
+    except ValueError as e:
+        parser.error(str(e))
+
+    # Render every page once; only the encoding is measured
+    client = PDFOCRClient(args.pdf_path, '.', stdout=io.StringIO())
+    with fitz.open(args.pdf_path) as doc:
+        pages = parse_pages(args.pages, doc.page_count)
+        images = {}
+        for page_num in pages:
+            images[page_num], _ = client.convert_page_to_image(doc[page_num - 1])
+
+    transport = None
+    if args.api_base:
+        pool = EndpointPool.from_string(args.api_base)
+        if not pool.check_health():
+            print(f"❌ No healthy OCR endpoint at {args.api_base}")
+            sys.exit(1)
+        transport = OCRTransport(pool)
+        # concurrency > 1 keeps the streamed chunks out of the (discarded) log
+        client = PDFOCRClient(args.pdf_path, '.', api_base=pool, transport=transport,
+                              stdout=io.StringIO(), concurrency=2)
+
+    print(f"📄 {args.pdf_path}: {len(pages)} pages, reference encoding {encodings[0]}")
+    reference_text: Dict[int, str] = {}
+    results = []
+    for encoding in encodings:
+        encode_seconds = 0.0
+        payload_bytes = 0
+        similarities = []
+        failed = 0
+        for page_num in pages:
+            start = time.perf_counter()
+            image_base64 = encode_image_data_url(images[page_num], encoding)
+            encode_seconds += time.perf_counter() - start
+            payload_bytes += len(image_base64)
+
+            if transport is None:
+                continue
+            blocks = client.recognize_encoded_page(page_num, image_base64)
+            if blocks is None:
+                failed += 1
+                continue
+            text = blocks_text(blocks)
+            if encoding == encodings[0]:
+                reference_text[page_num] = text
+            if page_num in reference_text:
+                similarities.append(difflib.SequenceMatcher(None, reference_text[page_num], text).ratio())
+
+        results.append((encoding, encode_seconds, payload_bytes, similarities, failed))
+
+    base_bytes = results[0][2] or 1
+    print(f"\n{'encoding':<12} {'encode ms/page':>15} {'KB/page':>10} {'size':>7} {'text match':>11}")
+    print("-" * 59)
+    for encoding, encode_seconds, payload_bytes, similarities, failed in results:
+        if transport is None:
+            accuracy = '-'
+        elif similarities:
+            accuracy = f"{100 * sum(similarities) / len(similarities):.1f}%"
+        else:
+            accuracy = 'n/a'
+        if failed:
+            accuracy += f" ({failed} failed)"
+        print(f"{encoding:<12} {1000 * encode_seconds / len(pages):>15.1f} "
+              f"{payload_bytes / 1024 / len(pages):>10.1f} {payload_bytes / base_bytes:>6.0%} {accuracy:>11}")
+
+
+if __name__ == '__main__':
+    main()
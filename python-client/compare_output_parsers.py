@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Compare StreamingLayoutParser with OutputCleaner on raw OCR outputs.
+
+Every file in the corpus directory is one raw model response, as written by
+``pdf_ocr_client.py --dump-raw <dir>``. A small corpus of malformed and
+truncated responses is kept in testdata/ocr_outputs and checked by
+test_output_parsers.py. Each response is cleaned with
+OutputCleaner.clean_model_output and fed to StreamingLayoutParser in small
+chunks, like a streamed response. The results are compared and both are
+timed. The parser's time is split into the time spent on the chunks, which
+overlaps with the model still generating, and the time ``finish`` takes
+after the last chunk; the cleaner's time is all spent after the last chunk.
+
+Known OutputCleaner artifacts are reported separately from regressions:
+a comma inserted between brace pairs inside the text (``\\frac{a}{b}`` ->
+``\\frac{a},{b}``), and blocks containing braces dropped when duplicates
+are removed.
+
+Usage:
+    python compare_output_parsers.py [corpus_dir] [--chunk-size 16] [--show-diffs]
+"""
+
+import argparse
+import json
+import random
+import sys
+import time
+from pathlib import Path
+
+from ocr_utils import OutputCleaner, StreamingLayoutParser
+
+
+def quiet(*args, **kwargs):
+    pass
+
+
+def chunked(text: str, max_size: int, rng: random.Random):
+    """Split text into chunks of 1..max_size characters"""
+    i = 0
+    while i < len(text):
+        size = rng.randint(1, max_size)
+        yield text[i:i + size]
+        i += size
+
+
+def with_cleaner_artifacts(blocks, cleaner: OutputCleaner):
+    """Apply OutputCleaner's missing-delimiter rewrite to the serialized blocks"""
+    return [json.loads(cleaner.missing_delimiter_pattern.sub('},{', json.dumps(block, ensure_ascii=False)))
+            for block in blocks]
+
+
+def without_brace_blocks(blocks, expected):
+    """Drop the blocks with braces that OutputCleaner's deduplication loses"""
+    if len(blocks) == len(expected):
+        return blocks
+    return [block for block in blocks if block in expected or '{' not in json.dumps(block)]
+
+
+def classify(actual, expected, cleaner: OutputCleaner) -> str:
+    if actual == expected:
+        return 'identical'
+    if with_cleaner_artifacts(actual, cleaner) == expected or without_brace_blocks(actual, expected) == expected:
+        return 'cleaner artifact'
+    return 'different'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the streaming OCR output parser with OutputCleaner')
+    parser.add_argument('corpus_dir', nargs='?', default=str(Path(__file__).parent / 'testdata' / 'ocr_outputs'),
+                        help='Directory with one raw OCR response per file (default: testdata/ocr_outputs)')
+    parser.add_argument('--chunk-size', type=int, default=16,
+                        help='Maximum size of the simulated stream chunks (default: %(default)s)')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='Timing repetitions per file, the fastest is used (default: %(default)s)')
+    parser.add_argument('--show-diffs', action='store_true',
+                        help='Print both results for files that differ')
+    args = parser.parse_args()
+
+    files = sorted(path for path in Path(args.corpus_dir).iterdir() if path.is_file())
+    if not files:
+        print(f"❌ No files in {args.corpus_dir}")
+        sys.exit(1)
+
+    cleaner = OutputCleaner(log=quiet)
+    rng = random.Random(0)
+    counts = {'identical': 0, 'cleaner artifact': 0, 'different': 0}
+    cleaner_seconds = feed_seconds = finish_seconds = 0.0
+    total_chars = 0
+
+    print(f"{'file':<36} {'chars':>9} {'cleaner ms':>11} {'feed ms':>8} {'finish ms':>10} {'blocks':>8}  result")
+    print("-" * 100)
+    for path in files:
+        raw = path.read_text(encoding='utf-8', errors='replace')
+        chunks = list(chunked(raw, args.chunk_size, rng))
+        total_chars += len(raw)
+
+        best_cleaner = best_feed = best_finish = float('inf')
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            expected = cleaner.clean_model_output(raw)
+            best_cleaner = min(best_cleaner, time.perf_counter() - start)
+
+            start = time.perf_counter()
+            stream_parser = StreamingLayoutParser(cleaner)
+            for chunk in chunks:
+                stream_parser.feed(chunk)
+            fed = time.perf_counter()
+            actual = stream_parser.finish()
+            best_feed = min(best_feed, fed - start)
+            best_finish = min(best_finish, time.perf_counter() - fed)
+        cleaner_seconds += best_cleaner
+        feed_seconds += best_feed
+        finish_seconds += best_finish
+
+        outcome = classify(actual, expected, cleaner)
+        counts[outcome] += 1
+
+        blocks = f"{len(expected)}/{len(actual)}"
+        print(f"{path.name[:36]:<36} {len(raw):>9,} {1000 * best_cleaner:>11.2f} {1000 * best_feed:>8.2f} "
+              f"{1000 * best_finish:>10.2f} {blocks:>8}  {outcome}")
+        if outcome == 'different' and args.show_diffs:
+            print(f"  cleaner: {json.dumps(expected, ensure_ascii=False)[:2000]}")
+            print(f"  parser:  {json.dumps(actual, ensure_ascii=False)[:2000]}")
+
+    print("-" * 100)
+    print(f"📊 {len(files)} files, {total_chars:,} characters")
+    print(f"   identical: {counts['identical']}, differing only by cleaner artifacts: "
+          f"{counts['cleaner artifact']}, different: {counts['different']}")
+    print(f"⏱️  After the last chunk: OutputCleaner {1000 * cleaner_seconds:.1f} ms, "
+          f"StreamingLayoutParser {1000 * finish_seconds:.1f} ms "
+          f"(+{1000 * feed_seconds:.1f} ms while streaming)")
+    sys.exit(1 if counts['different'] else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,383 @@
+"""
+OCR backend pool for PDF OCR Client.
+
+Keeps track of one or more DotsOCR servers, health-checks them through their
+``/health`` endpoint (``model_loaded`` flag) and routes each page to the
+healthy endpoint with the lowest expected completion time, i.e. the fewest
+requests in flight weighted by the observed per-page latency. Endpoints that
+keep failing are drained for a while and re-probed before they get traffic
+again, which acts as a per-endpoint circuit breaker.
+
+OCRTransport sends the streaming ``/ocr`` requests through the pool over a
+pooled keep-alive session, with separate connect, first-token and total
+timeouts and retries with exponential backoff and jitter.
+
+Usage:
+    pool = EndpointPool.from_string("http://gpu1:5123,http://gpu2:5123")
+    pool.check_health()
+    transport = OCRTransport(pool)
+    text = transport.stream_ocr(payload, on_chunk=print)
+"""
+
+import json
+import random
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Union
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+@dataclass
+class OCREndpoint:
+    """Routing state of a single OCR server"""
+    url: str
+    healthy: bool = True
+    model_loaded: Optional[bool] = None
+    in_flight: int = 0
+    latency: Optional[float] = None  # EWMA of seconds per page
+    consecutive_failures: int = 0
+    drained_until: float = 0.0
+    completed: int = 0
+    failed: int = 0
+
+    def status(self) -> Dict:
+        return {
+            'url': self.url,
+            'healthy': self.healthy,
+            'model_loaded': self.model_loaded,
+            'in_flight': self.in_flight,
+            'latency': round(self.latency, 3) if self.latency is not None else None,
+            'completed': self.completed,
+            'failed': self.failed,
+        }
+
+
+class NoHealthyEndpointError(RuntimeError):
+    """Raised when every endpoint of the pool is drained or unhealthy"""
+
+
+class EndpointPool:
+    """Thread-safe pool of OCR endpoints with latency-aware routing"""
+
+    def __init__(self, urls: List[str], health_timeout: float = 20, failure_threshold: int = 3,
+                 drain_seconds: float = 30, latency_smoothing: float = 0.3):
+        """
+        Initialize the endpoint pool
+
+        Args:
+            urls: Base URLs of the OCR servers
+            health_timeout: Timeout in seconds for ``/health`` probes
+            failure_threshold: Consecutive failures after which an endpoint is drained
+            drain_seconds: How long a drained endpoint is kept out of rotation
+                before it is re-probed
+            latency_smoothing: Weight of the newest sample in the latency EWMA
+        """
+        urls = [url.strip().rstrip('/') for url in urls if url.strip()]
+        if not urls:
+            raise ValueError("At least one OCR endpoint is required")
+
+        self.endpoints = [OCREndpoint(url) for url in dict.fromkeys(urls)]
+        self.health_timeout = health_timeout
+        self.failure_threshold = failure_threshold
+        self.drain_seconds = drain_seconds
+        self.latency_smoothing = latency_smoothing
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_string(cls, api_base: str, **kwargs) -> 'EndpointPool':
+        """Create a pool from a comma-separated list of base URLs"""
+        return cls(api_base.split(','), **kwargs)
+
+    @property
+    def urls(self) -> List[str]:
+        return [endpoint.url for endpoint in self.endpoints]
+
+    def __str__(self) -> str:
+        return ', '.join(self.urls)
+
+    def probe(self, endpoint: OCREndpoint) -> bool:
+        """Check one endpoint's ``/health`` and update its state"""
+        try:
+            response = requests.get(f"{endpoint.url}/health", timeout=self.health_timeout)
+            model_loaded = response.status_code == 200 and bool(response.json().get('model_loaded', False))
+        except Exception:
+            model_loaded = False
+
+        with self._lock:
+            endpoint.model_loaded = model_loaded
+            endpoint.healthy = model_loaded
+            if model_loaded:
+                endpoint.consecutive_failures = 0
+                endpoint.drained_until = 0.0
+            else:
+                endpoint.drained_until = time.monotonic() + self.drain_seconds
+        return model_loaded
+
+    def check_health(self) -> int:
+        """
+        Probe every endpoint
+
+        Returns:
+            Number of healthy endpoints
+        """
+        return sum(1 for endpoint in self.endpoints if self.probe(endpoint))
+
+    def acquire(self) -> OCREndpoint:
+        """
+        Pick the endpoint for the next request and count it as in flight
+
+        Drained endpoints whose drain period is over are re-probed first.
+
+        Raises:
+            NoHealthyEndpointError: If no endpoint can take the request
+        """
+        now = time.monotonic()
+        with self._lock:
+            due = [endpoint for endpoint in self.endpoints
+                   if not endpoint.healthy and endpoint.drained_until <= now]
+        # Probes do network I/O, so they run without holding the lock
+        for endpoint in due:
+            self.probe(endpoint)
+
+        with self._lock:
+            candidates = [endpoint for endpoint in self.endpoints if endpoint.healthy]
+            if not candidates:
+                raise NoHealthyEndpointError(f"No healthy OCR endpoint available ({self})")
+
+            # Endpoints without a latency sample yet are assumed to be as fast
+            # as the fastest known one, so that they get tried; ties go to the
+            # endpoint that has served fewer pages.
+            known = [endpoint.latency for endpoint in candidates if endpoint.latency is not None]
+            default_latency = min(known) if known else 1.0
+
+            def expected_completion(endpoint: OCREndpoint):
+                latency = endpoint.latency if endpoint.latency is not None else default_latency
+                return (endpoint.in_flight + 1) * latency, endpoint.completed
+
+            endpoint = min(candidates, key=expected_completion)
+            endpoint.in_flight += 1
+            return endpoint
+
+    def release(self, endpoint: OCREndpoint, success: bool, elapsed: Optional[float] = None,
+                rejected: bool = False):
+        """
+        Return an endpoint after a request and record the outcome
+
+        Args:
+            endpoint: Endpoint returned by ``acquire``
+            success: Whether the request succeeded
+            elapsed: Request duration in seconds, used for routing when successful
+            rejected: The server answered but refused the request itself (4xx);
+                neither a success nor a failure of the endpoint
+        """
+        with self._lock:
+            endpoint.in_flight = max(0, endpoint.in_flight - 1)
+            if rejected:
+                return
+            if success:
+                endpoint.completed += 1
+                endpoint.consecutive_failures = 0
+                if elapsed is not None:
+                    if endpoint.latency is None:
+                        endpoint.latency = elapsed
+                    else:
+                        alpha = self.latency_smoothing
+                        endpoint.latency = alpha * elapsed + (1 - alpha) * endpoint.latency
+            else:
+                endpoint.failed += 1
+                endpoint.consecutive_failures += 1
+                if endpoint.consecutive_failures >= self.failure_threshold:
+                    endpoint.healthy = False
+                    endpoint.drained_until = time.monotonic() + self.drain_seconds
+
+    @contextmanager
+    def lease(self):
+        """
+        Context manager around ``acquire``/``release``
+
+        The request counts as failed if the block raises or calls neither
+        ``mark_success`` nor ``mark_rejected`` on the yielded lease.
+        """
+        endpoint = self.acquire()
+        lease = EndpointLease(endpoint)
+        try:
+            yield lease
+        finally:
+            self.release(endpoint, lease.success, time.monotonic() - lease.started, lease.rejected)
+
+    def status(self) -> List[Dict]:
+        with self._lock:
+            return [endpoint.status() for endpoint in self.endpoints]
+
+    def seconds_until_probe(self) -> float:
+        """Time until the next drained endpoint may be re-probed (0 if one is healthy)"""
+        with self._lock:
+            if any(endpoint.healthy for endpoint in self.endpoints):
+                return 0.0
+            next_probe = min(endpoint.drained_until for endpoint in self.endpoints)
+        return max(0.0, next_probe - time.monotonic())
+
+
+class EndpointLease:
+    """An endpoint handed out by ``EndpointPool.lease``"""
+
+    def __init__(self, endpoint: OCREndpoint):
+        self.endpoint = endpoint
+        self.url = endpoint.url
+        self.started = time.monotonic()
+        self.success = False
+        self.rejected = False
+
+    def mark_success(self):
+        self.success = True
+
+    def mark_rejected(self):
+        """The request was refused (4xx): release without a failure or latency sample"""
+        self.rejected = True
+
+
+def as_endpoint_pool(api_base: Union[str, EndpointPool]) -> EndpointPool:
+    """Accept either a pool or a comma-separated list of base URLs"""
+    if isinstance(api_base, EndpointPool):
+        return api_base
+    return EndpointPool.from_string(api_base)
+
+
+class OCRRequestError(RuntimeError):
+    """An OCR request failed
+
+    Attributes:
+        retryable: Whether sending the same request again may succeed
+    """
+
+    def __init__(self, message: str, retryable: bool = True):
+        super().__init__(message)
+        self.retryable = retryable
+
+
+class OCRTransport:
+    """Pooled, retrying transport for the streaming ``/ocr`` API"""
+
+    def __init__(self, pool: EndpointPool, connect_timeout: float = 10, first_token_timeout: float = 300,
+                 total_timeout: float = 1800, max_retries: int = 4, backoff_base: float = 1.0,
+                 backoff_max: float = 60.0, pool_maxsize: int = 16):
+        """
+        Initialize the transport
+
+        Args:
+            pool: Endpoints to send requests to
+            connect_timeout: Seconds to establish a connection
+            first_token_timeout: Seconds to wait for the response headers and
+                the first streamed chunk; also bounds stalls between chunks
+            total_timeout: Seconds allowed for a whole streamed response
+            max_retries: Retries after the first attempt for connection
+                errors, timeouts and 5xx responses
+            backoff_base: Base delay in seconds of the exponential backoff
+            backoff_max: Upper bound of a single backoff delay
+            pool_maxsize: Keep-alive connections kept per endpoint; should be at
+                least the number of requests in flight
+        """
+        self.pool = pool
+        self.connect_timeout = connect_timeout
+        self.first_token_timeout = first_token_timeout
+        self.total_timeout = total_timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=max(1, len(pool.endpoints)), pool_maxsize=pool_maxsize)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def close(self):
+        """Close the pooled connections; requests still in flight finish normally"""
+        self.session.close()
+
+    def backoff_delay(self, attempt: int) -> float:
+        """Exponential backoff with full jitter for the given retry attempt (1-based)"""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** (attempt - 1)))
+
+    def stream_ocr(self, payload: Dict, on_chunk: Optional[Callable[[str], Optional[bool]]] = None,
+                   on_retry: Optional[Callable[[int, Exception, float], None]] = None) -> str:
+        """
+        Send an OCR request and collect the streamed response text
+
+        A failed attempt is retried from scratch on whichever endpoint the pool
+        picks next. When every endpoint is drained, the transport waits for
+        the next re-probe instead of sending requests to a dead server.
+
+        Args:
+            payload: JSON body for ``/ocr``
+            on_chunk: Called with each text chunk as it arrives; returning True
+                stops the response early and closes the connection, so the
+                server stops generating
+            on_retry: Called with (attempt, error, delay) before a retry; a
+                restarted response is streamed to ``on_chunk`` from the start
+
+        Returns:
+            Full response text (up to the stop, if stopped by ``on_chunk``)
+
+        Raises:
+            OCRRequestError: If the request failed and cannot be retried
+        """
+        attempt = 0
+        while True:
+            try:
+                return self._stream_once(payload, on_chunk)
+            except (NoHealthyEndpointError, OCRRequestError, requests.RequestException) as e:
+                retryable = getattr(e, 'retryable', True)
+                if not retryable or attempt >= self.max_retries:
+                    if isinstance(e, OCRRequestError):
+                        raise
+                    raise OCRRequestError(str(e), retryable=False) from e
+                attempt += 1
+                delay = self.backoff_delay(attempt)
+                if isinstance(e, NoHealthyEndpointError):
+                    delay = max(delay, self.pool.seconds_until_probe())
+                if on_retry:
+                    on_retry(attempt, e, delay)
+                time.sleep(delay)
+
+    def _stream_once(self, payload: Dict, on_chunk: Optional[Callable[[str], Optional[bool]]]) -> str:
+        with self.pool.lease() as endpoint:
+            started = time.monotonic()
+            with self.session.post(f"{endpoint.url}/ocr", json=payload, stream=True,
+                                   timeout=(self.connect_timeout, self.first_token_timeout)) as response:
+                if response.status_code != 200:
+                    if response.status_code < 500:
+                        # The server is alive, the request itself was rejected; a
+                        # bad request must neither drain the endpoint nor feed the
+                        # latency estimate with its quick round trip
+                        endpoint.mark_rejected()
+                    raise OCRRequestError(f"{endpoint.url} returned HTTP {response.status_code}",
+                                          retryable=response.status_code >= 500)
+
+                chunks = []
+                for line in response.iter_lines():
+                    if time.monotonic() - started > self.total_timeout:
+                        raise OCRRequestError(
+                            f"{endpoint.url} exceeded the total timeout of {self.total_timeout}s",
+                            retryable=False)
+                    if not line:
+                        continue
+                    try:
+                        data = json.loads(line.decode('utf-8'))
+                    except json.JSONDecodeError:
+                        continue
+                    if 'response' in data:
+                        chunk = data['response']
+                        chunks.append(chunk)
+                        if on_chunk and on_chunk(chunk):
+                            # Leaving the block closes the unfinished response;
+                            # the dropped connection ends the generation
+                            break
+                    if data.get('done', False):
+                        break
+
+            endpoint.mark_success()
+            return ''.join(chunks)
@@ -0,0 +1,138 @@
+"""
+Content-addressed cache of page OCR results.
+
+Results are keyed by a hash of the encoded page image sent to the OCR API
+plus the OCR parameters, so a page is only recognized once no matter which
+document, request or server process it comes from (re-submitted PDFs, cover
+sheets, boilerplate appendices). Entries live in a SQLite database that can
+be shared by several processes and are evicted least-recently-used once the
+stored results exceed a size limit.
+"""
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+DEFAULT_CACHE_PATH = Path.home() / '.cache' / 'pdf_ocr' / 'page_cache.sqlite'
+
+
+class PageCache:
+    """SQLite-backed LRU cache of OCR results keyed by page content"""
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_bytes: int = 512 * 1024 * 1024):
+        """
+        Open (or create) the cache
+
+        Args:
+            path: SQLite database file
+            max_bytes: Size limit of the stored results; least recently used
+                entries are evicted beyond it
+        """
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, timeout=30)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS pages (
+                key TEXT PRIMARY KEY,
+                result TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created REAL NOT NULL,
+                last_access REAL NOT NULL
+            )
+        ''')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS pages_last_access ON pages (last_access)')
+        self._conn.commit()
+        self._total_bytes = self._stored_bytes()
+
+    @staticmethod
+    def make_key(image_base64: str, params: Dict) -> str:
+        """
+        Hash an encoded page image together with the OCR parameters
+
+        Args:
+            image_base64: Image data URL exactly as sent to the OCR API
+            params: Every other request parameter that affects the result
+        """
+        digest = hashlib.sha256()
+        digest.update(json.dumps(params, sort_keys=True).encode('utf-8'))
+        digest.update(b'\0')
+        digest.update(image_base64.encode('ascii'))
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[List[Dict]]:
+        """Return the cached blocks for a key, or None"""
+        with self._lock:
+            row = self._conn.execute('SELECT result FROM pages WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._conn.execute('UPDATE pages SET last_access = ? WHERE key = ?', (time.time(), key))
+            self._conn.commit()
+        return json.loads(row[0])
+
+    def put(self, key: str, blocks: List[Dict]):
+        """Store the blocks for a key and evict old entries if needed"""
+        result = json.dumps(blocks, ensure_ascii=False)
+        size = len(result.encode('utf-8'))
+        now = time.time()
+        with self._lock:
+            old = self._conn.execute('SELECT size FROM pages WHERE key = ?', (key,)).fetchone()
+            self._conn.execute(
+                'INSERT OR REPLACE INTO pages (key, result, size, created, last_access) VALUES (?, ?, ?, ?, ?)',
+                (key, result, size, now, now))
+            self._conn.commit()
+            self._total_bytes += size - (old[0] if old else 0)
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+
+    def _stored_bytes(self) -> int:
+        return self._conn.execute('SELECT COALESCE(SUM(size), 0) FROM pages').fetchone()[0]
+
+    def _evict(self):
+        """Delete least recently used entries until the size limit is met"""
+        # Other processes may have added or evicted entries meanwhile
+        self._total_bytes = self._stored_bytes()
+        excess = self._total_bytes - self.max_bytes
+        if excess <= 0:
+            return
+
+        freed = 0
+        victims = []
+        for key, size in self._conn.execute('SELECT key, size FROM pages ORDER BY last_access'):
+            victims.append((key,))
+            freed += size
+            if freed >= excess:
+                break
+        self._conn.executemany('DELETE FROM pages WHERE key = ?', victims)
+        self._conn.commit()
+        self._total_bytes -= freed
+
+    def stats(self) -> Dict:
+        """Hit rate of this cache object and size of the shared store"""
+        with self._lock:
+            entries = self._conn.execute('SELECT COUNT(*) FROM pages').fetchone()[0]
+            lookups = self.hits + self.misses
+            return {
+                'path': str(self.path),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'entries': entries,
+                'bytes': self._total_bytes,
+                'max_bytes': self.max_bytes,
+            }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
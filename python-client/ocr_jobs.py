@@ -0,0 +1,440 @@
+"""
+Asynchronous OCR jobs for the PDF OCR API Server.
+
+A job owns a directory holding the uploaded PDF, the OCR output folder and,
+once finished, the result zip. Jobs are queued and run on a bounded worker
+pool, so the server can accept many more submissions than it has worker
+threads while clients poll for progress instead of holding a request open
+for the whole document.
+
+Job states: queued -> running -> succeeded | failed
+
+Recognition progress is kept per document, keyed by the PDF content hash, in
+a DocumentStateStore outside the per-request directories, so a retried
+request or job for the same PDF resumes from the last completed page.
+
+While a job runs, every recognized page is published on the job's
+PageEventStream as soon as it, and every page before it, is finished, so
+consumers can process page 1 while later pages are still being recognized.
+"""
+
+import hashlib
+import os
+import shutil
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+import fitz  # PyMuPDF
+
+try:
+    import fcntl
+except ImportError:  # Windows: state is only locked within one process
+    fcntl = None
+
+
+class JobQueueFullError(RuntimeError):
+    """Raised when the job queue cannot accept another submission"""
+
+
+def file_sha256(path) -> str:
+    """SHA-256 hex digest of a file's content"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class DocumentStateStore:
+    """
+    Per-document OCR progress that outlives requests and jobs
+
+    Each document gets a ``<sha256>.ocr_progress.json`` file in the same format
+    as the one pdf_ocr_client.py keeps next to a PDF, plus its page journal
+    while a run is unfinished. State that has not been used for
+    ``retention_seconds`` is removed.
+
+    A run holds the document's ``<sha256>.lock`` file with ``flock``, so runs
+    for the same document are serialized across the threads and the worker
+    processes sharing ``state_dir`` (on platforms without ``fcntl``, only
+    within one process).
+    """
+
+    def __init__(self, state_dir, retention_seconds: float = 72 * 3600):
+        self.state_dir = Path(state_dir)
+        self.state_dir.mkdir(parents=True, exist_ok=True)
+        self.retention_seconds = retention_seconds
+        self._locks: Dict[str, threading.Lock] = {}
+        self._in_use: Dict[str, int] = {}
+        self._locks_lock = threading.Lock()
+        self._last_sweep = 0.0
+
+    def progress_file(self, doc_hash: str) -> Path:
+        return self.state_dir / f"{doc_hash}.ocr_progress.json"
+
+    def lock_file(self, doc_hash: str) -> Path:
+        return self.state_dir / f"{doc_hash}.lock"
+
+    @contextmanager
+    def use(self, doc_hash: str):
+        """
+        Hold the document's state for one OCR run
+
+        Runs for the same document are serialized so they never write the same
+        progress file at once; the second run then resumes from the first.
+
+        Yields:
+            Path of the document's progress file
+        """
+        self.remove_stale()
+        with self._locks_lock:
+            lock = self._locks.setdefault(doc_hash, threading.Lock())
+            self._in_use[doc_hash] = self._in_use.get(doc_hash, 0) + 1
+        try:
+            with lock, self._file_lock(doc_hash, blocking=True):
+                progress_file = self.progress_file(doc_hash)
+                try:
+                    yield progress_file
+                finally:
+                    if progress_file.exists():
+                        # Retention counts from the last use
+                        os.utime(progress_file)
+        finally:
+            with self._locks_lock:
+                self._in_use[doc_hash] -= 1
+                if not self._in_use[doc_hash]:
+                    del self._in_use[doc_hash]
+
+    @contextmanager
+    def _file_lock(self, doc_hash: str, blocking: bool):
+        """
+        Hold the document's lock file; yields False if ``blocking`` is off and
+        another process holds it
+        """
+        if fcntl is None:
+            yield True
+            return
+
+        path = self.lock_file(doc_hash)
+        while True:
+            fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+            except BlockingIOError:
+                os.close(fd)
+                yield False
+                return
+            # remove_stale may have deleted the file while we waited for it;
+            # the lock only counts if it is still the file at that path
+            try:
+                same_file = os.path.samestat(os.fstat(fd), os.stat(path))
+            except FileNotFoundError:
+                same_file = False
+            if same_file:
+                break
+            os.close(fd)
+        try:
+            yield True
+        finally:
+            os.close(fd)
+
+    def remove_stale(self, min_interval: float = 600):
+        """
+        Remove state unused for longer than the retention period
+
+        A document is skipped while a run holds it, in this process or any
+        other, and only if all its files are older than the retention period.
+        """
+        now = time.time()
+        if now - self._last_sweep < min_interval:
+            return
+        self._last_sweep = now
+
+        cutoff = now - self.retention_seconds
+        documents: Dict[str, List[Tuple[Path, float]]] = {}
+        for path in self.state_dir.iterdir():
+            try:
+                mtime = path.stat().st_mtime
+            except OSError:
+                continue
+            # Temporary files of atomic writes are named .<sha256>.ocr_progress.json.*.tmp
+            documents.setdefault(path.name.lstrip('.').split('.')[0], []).append((path, mtime))
+
+        for doc_hash, files in documents.items():
+            if max(mtime for _, mtime in files) >= cutoff:
+                continue
+            with self._locks_lock:
+                if doc_hash in self._in_use:
+                    continue
+            with self._file_lock(doc_hash, blocking=False) as locked:
+                if not locked:
+                    continue
+                for path, _ in files:
+                    try:
+                        path.unlink()
+                    except OSError:
+                        continue
+
+
+class PageEventStream:
+    """
+    Ordered stream of per-page results of one job
+
+    Pages may finish in any order; they are published in page order so that
+    footnote definitions are numbered consecutively across the fragments of
+    consecutive events. Superscript markers are resolved against the
+    footnotes defined on the same page, since later pages are not known yet.
+    ``export_to_markdown`` resolves them once against the whole document, so
+    the joined fragments differ from the exported markdown when a marker is
+    defined on more than one page, or is used on a page other than the one
+    defining it. Each event is a dict:
+
+        {"event": "page", "page": 3, "status": "recognized", "blocks": [...], "markdown": "..."}
+        {"event": "page", "page": 4, "status": "failed", "blocks": [], "markdown": ""}
+        {"event": "summary", ...job status...}
+
+    The summary is always the last event.
+    """
+
+    def __init__(self):
+        self.events: List[Dict] = []
+        self.finished = False
+        self._render_markdown = None
+        self._pending: Dict[int, Optional[List[Dict]]] = {}
+        self._next_page = 1
+        self._footnote_counter = 1
+        self._condition = threading.Condition()
+
+    def start(self, render_markdown: Callable[[int, List[Dict], int], Tuple[str, List[Dict], Dict[str, int], int]],
+              apply_footnote_references: Callable[[str, Dict[str, int]], str]):
+        """
+        Set the markdown renderer, normally ``PDFOCRClient.render_page_markdown``
+        and ``PDFOCRClient.apply_footnote_references``
+        """
+        self._render_markdown = render_markdown
+        self._apply_footnote_references = apply_footnote_references
+
+    def page_finished(self, page_num: int, blocks: Optional[List[Dict]]):
+        """Record a page outcome (``None`` for a failed page); usable as on_page_result"""
+        with self._condition:
+            if page_num < self._next_page:
+                return
+            self._pending[page_num] = blocks
+            while self._next_page in self._pending:
+                self._publish(self._next_page, self._pending.pop(self._next_page))
+                self._next_page += 1
+            self._condition.notify_all()
+
+    def _publish(self, page_num: int, blocks: Optional[List[Dict]]):
+        if blocks is None:
+            self.events.append({'event': 'page', 'page': page_num, 'status': 'failed',
+                                'blocks': [], 'markdown': ''})
+            return
+
+        markdown, _, footnote_map, self._footnote_counter = self._render_markdown(
+            page_num, blocks, self._footnote_counter)
+        markdown = self._apply_footnote_references(markdown, footnote_map)
+        self.events.append({'event': 'page', 'page': page_num, 'status': 'recognized',
+                            'blocks': blocks, 'markdown': markdown})
+
+    def finish(self, summary: Dict):
+        """Publish the pages still held back and the final summary event"""
+        with self._condition:
+            for page_num in sorted(self._pending):
+                self._publish(page_num, self._pending[page_num])
+            self._pending.clear()
+            self.events.append(dict(summary, event='summary'))
+            self.finished = True
+            self._condition.notify_all()
+
+    def wait(self, cursor: int, timeout: float = 15) -> Tuple[List[Dict], bool]:
+        """
+        Wait for events after ``cursor``
+
+        Returns:
+            Tuple of (new events, whether the stream is complete after them)
+        """
+        with self._condition:
+            if cursor >= len(self.events) and not self.finished:
+                self._condition.wait(timeout)
+            return self.events[cursor:], self.finished
+
+
+@dataclass
+class OCRJob:
+    """State of a single OCR job"""
+    job_id: str
+    filename: str
+    api_base: str
+    job_dir: Path
+    state: str = 'queued'
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    total_pages: Optional[int] = None
+    error: Optional[str] = None
+    client: Optional[object] = None  # PDFOCRClient while the job runs
+    completed_pages: List[int] = field(default_factory=list)
+    failed_pages: List[int] = field(default_factory=list)
+    events: PageEventStream = field(default_factory=PageEventStream)
+
+    @property
+    def pdf_path(self) -> Path:
+        return self.job_dir / self.filename
+
+    @property
+    def output_folder(self) -> Path:
+        return self.job_dir / 'output'
+
+    @property
+    def result_path(self) -> Path:
+        return self.job_dir / 'result.zip'
+
+    @property
+    def finished(self) -> bool:
+        return self.state in ('succeeded', 'failed')
+
+    def status(self) -> Dict:
+        """Return the job status with per-page progress"""
+        completed_pages = self.completed_pages
+        failed_pages = self.failed_pages
+        total_pages = self.total_pages
+        if self.client is not None:
+            snapshot = self.client.progress_snapshot()
+            completed_pages = snapshot['completed_pages']
+            failed_pages = snapshot['failed_pages']
+            total_pages = snapshot['total_pages'] or total_pages
+
+        return {
+            'job_id': self.job_id,
+            'filename': self.filename,
+            'state': self.state,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+            'total_pages': total_pages,
+            'completed_pages': completed_pages,
+            'failed_pages': failed_pages,
+            'progress': round(len(completed_pages) / total_pages, 4) if total_pages else 0.0,
+            'error': self.error,
+        }
+
+
+class JobManager:
+    """Queue of OCR jobs executed on a bounded worker pool"""
+
+    def __init__(self, jobs_dir: str, run_job: Callable[[OCRJob], None], max_workers: int = 1,
+                 max_pending: int = 100, retention_seconds: float = 24 * 3600):
+        """
+        Initialize the job manager
+
+        Args:
+            jobs_dir: Directory in which one subdirectory per job is created
+            run_job: Called on a worker thread to process a job; it must write
+                ``job.result_path`` and raise on failure
+            max_workers: Number of jobs processed at the same time
+            max_pending: Maximum number of queued and running jobs
+            retention_seconds: Finished jobs and their files are removed after this long
+        """
+        self.jobs_dir = Path(jobs_dir)
+        self.jobs_dir.mkdir(parents=True, exist_ok=True)
+        self.run_job = run_job
+        self.max_pending = max_pending
+        self.retention_seconds = retention_seconds
+        self.jobs: Dict[str, OCRJob] = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='ocr-job')
+
+    def submit(self, filename: str, api_base: str, save_pdf: Callable[[Path], None]) -> OCRJob:
+        """
+        Create a job and queue it
+
+        Args:
+            filename: Sanitized PDF filename
+            api_base: OCR API base URL(s) for this job
+            save_pdf: Called with the destination path to store the uploaded PDF
+
+        Raises:
+            JobQueueFullError: If ``max_pending`` jobs are already queued or running
+        """
+        self.remove_expired()
+
+        with self._lock:
+            pending = sum(1 for job in self.jobs.values() if not job.finished)
+            if pending >= self.max_pending:
+                raise JobQueueFullError(f"Too many pending jobs ({pending})")
+
+            job_id = uuid.uuid4().hex
+            job = OCRJob(job_id, filename, api_base, self.jobs_dir / job_id)
+            job.job_dir.mkdir(parents=True)
+            self.jobs[job_id] = job
+
+        try:
+            save_pdf(job.pdf_path)
+            with fitz.open(job.pdf_path) as doc:
+                job.total_pages = doc.page_count
+        except Exception:
+            self.delete(job_id)
+            raise
+
+        self._executor.submit(self._run, job)
+        return job
+
+    def _run(self, job: OCRJob):
+        with self._lock:
+            if job.job_id not in self.jobs:
+                return  # Deleted while queued
+            job.state = 'running'
+            job.started_at = time.time()
+        try:
+            job.output_folder.mkdir(parents=True, exist_ok=True)
+            self.run_job(job)
+            job.state = 'succeeded'
+        except Exception as e:
+            job.error = str(e)
+            job.state = 'failed'
+        finally:
+            if job.client is not None:
+                snapshot = job.client.progress_snapshot()
+                job.completed_pages = snapshot['completed_pages']
+                job.failed_pages = snapshot['failed_pages']
+                job.client = None
+            job.finished_at = time.time()
+            job.events.finish(job.status())
+
+    def get(self, job_id: str) -> Optional[OCRJob]:
+        with self._lock:
+            return self.jobs.get(job_id)
+
+    def queue_position(self, job: OCRJob) -> Optional[int]:
+        """1-based position of a queued job among the queued jobs"""
+        if job.state != 'queued':
+            return None
+        with self._lock:
+            queued = sorted((j for j in self.jobs.values() if j.state == 'queued'), key=lambda j: j.created_at)
+        return next((i + 1 for i, j in enumerate(queued) if j.job_id == job.job_id), None)
+
+    def delete(self, job_id: str) -> bool:
+        """Forget a job and remove its files; running jobs cannot be deleted"""
+        with self._lock:
+            job = self.jobs.get(job_id)
+            if job is None or job.state == 'running':
+                return False
+            del self.jobs[job_id]
+        shutil.rmtree(job.job_dir, ignore_errors=True)
+        return True
+
+    def remove_expired(self):
+        """Remove finished jobs older than the retention period"""
+        cutoff = time.time() - self.retention_seconds
+        with self._lock:
+            expired = [job.job_id for job in self.jobs.values()
+                       if job.finished and job.finished_at is not None and job.finished_at < cutoff]
+        for job_id in expired:
+            self.delete(job_id)
@@ -0,0 +1,213 @@
+"""
+Crash-safe OCR progress storage for PDF OCR Client.
+
+The progress of a document is kept in two files:
+
+- the snapshot, ``<pdf>.ocr_progress.json``, in exactly the format pdfocr.js
+  ``saveProgress``/``loadProgress`` use::
+
+      {"filename": "paper.pdf", "pages": {"1": [...blocks...], "2": [...]}}
+
+- the journal, ``<snapshot>.journal``, to which every recognized page is
+  appended as one JSON line ``{"page": 3, "blocks": [...]}``.
+
+Saving a page therefore costs one small append instead of rewriting the whole
+document. Once the journal outgrows the snapshot it is compacted into a new
+snapshot, which is written to a temporary file and atomically moved into
+place, so the snapshot is never half-written and the total amount written
+stays linear in the document size. On load the journal is replayed on top of
+the snapshot; a line torn by a crash is dropped.
+
+Snapshots can optionally be gzip-compressed; compressed snapshots are
+recognized by their content, and ``export_json`` writes the plain format for
+the web version. A progress file saved by the web version can be used as a
+snapshot as is.
+
+Usage:
+    python ocr_progress.py <progress_file> <output.json>   # export for pdfocr.js
+"""
+
+import gzip
+import json
+import os
+import sys
+import tempfile
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional
+
+GZIP_MAGIC = b'\x1f\x8b'
+
+
+def read_progress_file(path) -> Dict:
+    """
+    Read a progress snapshot, plain or gzip-compressed
+
+    Raises:
+        ValueError: If the file is not in the .ocr_progress.json format
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    if data[:2] == GZIP_MAGIC:
+        data = gzip.decompress(data)
+    progress_data = json.loads(data.decode('utf-8'))
+    if not isinstance(progress_data, dict) or 'filename' not in progress_data or 'pages' not in progress_data:
+        raise ValueError("Invalid progress file format")
+    return progress_data
+
+
+def write_atomic(path, data: bytes):
+    """Write a file through a temporary file in the same directory and os.replace"""
+    path = Path(path)
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+class ProgressStore:
+    """Per-page progress journal with atomic compaction into a snapshot"""
+
+    def __init__(self, path, filename: str, compress: bool = False,
+                 min_compact_bytes: int = 1024 * 1024):
+        """
+        Initialize the progress store
+
+        Args:
+            path: Snapshot file; the journal is kept next to it
+            filename: PDF filename recorded in the snapshot
+            compress: Write gzip-compressed snapshots
+            min_compact_bytes: The journal is compacted once it is larger than
+                both this and the snapshot
+        """
+        self.path = Path(path)
+        self.journal_path = self.path.with_name(self.path.name + '.journal')
+        self.filename = filename
+        self.compress = compress
+        self.min_compact_bytes = min_compact_bytes
+        self.pages: Dict[int, List[Dict]] = {}
+        self._snapshot_bytes = 0
+        self._journal_bytes = 0
+        self._lock = threading.Lock()
+
+    def exists(self) -> bool:
+        return self.path.exists() or self.journal_path.exists()
+
+    def load(self) -> Dict[int, List[Dict]]:
+        """
+        Load the snapshot and replay the journal on top of it
+
+        Returns:
+            Page results by page number
+
+        Raises:
+            ValueError: If the snapshot is not in the .ocr_progress.json format
+        """
+        with self._lock:
+            self.pages = {}
+            self._snapshot_bytes = 0
+            self._journal_bytes = 0
+
+            if self.path.exists():
+                progress_data = read_progress_file(self.path)
+                self.pages = {int(page_num): blocks for page_num, blocks in progress_data['pages'].items()}
+                self._snapshot_bytes = self.path.stat().st_size
+
+            if self.journal_path.exists():
+                with open(self.journal_path, 'r+b') as f:
+                    for line in f:
+                        if not line.endswith(b'\n'):
+                            # Torn last line of an interrupted append; cut it
+                            # off so the next entry starts on a fresh line
+                            f.truncate(self._journal_bytes)
+                            break
+                        entry = json.loads(line.decode('utf-8'))
+                        self.pages[int(entry['page'])] = entry['blocks']
+                        self._journal_bytes += len(line)
+
+            return dict(self.pages)
+
+    def append(self, page_num: int, blocks: List[Dict]):
+        """Record a recognized page, compacting the journal when it has grown too large"""
+        line = json.dumps({'page': page_num, 'blocks': blocks}, ensure_ascii=False) + '\n'
+        data = line.encode('utf-8')
+        with self._lock:
+            self.pages[page_num] = blocks
+            with open(self.journal_path, 'ab') as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            self._journal_bytes += len(data)
+            if self._journal_bytes > max(self.min_compact_bytes, self._snapshot_bytes):
+                self._compact()
+
+    def compact(self, pages: Optional[Dict[int, List[Dict]]] = None):
+        """
+        Write all pages to the snapshot and clear the journal
+
+        Args:
+            pages: Replace the stored pages with these first
+        """
+        with self._lock:
+            if pages is not None:
+                self.pages = dict(pages)
+            self._compact()
+
+    def _compact(self):
+        data = self._serialize(self.pages, indent=None if self.compress else 2)
+        if self.compress:
+            data = gzip.compress(data, compresslevel=6)
+        write_atomic(self.path, data)
+        self._snapshot_bytes = len(data)
+
+        # Entries in the journal are now in the snapshot; replaying them after
+        # a crash right here would be harmless
+        try:
+            self.journal_path.unlink()
+        except FileNotFoundError:
+            pass
+        self._journal_bytes = 0
+
+    def _serialize(self, pages: Dict[int, List[Dict]], indent: Optional[int]) -> bytes:
+        progress_data = {
+            "filename": self.filename,
+            "pages": {str(k): v for k, v in sorted(pages.items())}
+        }
+        return json.dumps(progress_data, ensure_ascii=False, indent=indent).encode('utf-8')
+
+    def export_json(self, path):
+        """Write the pages as an uncompressed .ocr_progress.json for the web version"""
+        with self._lock:
+            data = self._serialize(self.pages, indent=2)
+        write_atomic(path, data)
+
+
+def main():
+    if len(sys.argv) != 3:
+        print(__doc__)
+        sys.exit(1)
+    progress_file, output_path = sys.argv[1:]
+    # Without a snapshot, fall back to the PDF name the progress file is named after
+    store = ProgressStore(progress_file, filename=Path(progress_file).name.split('.ocr_progress.json')[0])
+    try:
+        if store.path.exists():
+            store.filename = read_progress_file(store.path)['filename']
+        pages = store.load()
+    except (OSError, ValueError) as e:
+        print(f"❌ Failed to load progress: {e}")
+        sys.exit(1)
+    store.export_json(output_path)
+    print(f"💾 Exported {len(pages)} pages to {output_path}")
+
+
+if __name__ == '__main__':
+    main()
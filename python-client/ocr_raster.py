@@ -0,0 +1,89 @@
+"""
+Process-pool page rasterizer for PDF OCR Client.
+
+Rendering a page (``get_pixmap``), converting it to a PIL image and encoding
+it are CPU-bound, and the render and encode threads of the pipeline share
+one core between them. With a render pool, pages are rasterized, screened
+and encoded in worker processes instead:
+
+- every worker opens the document itself and keeps the last few documents
+  open, so only the file name and page number are sent to it;
+- the raw pixels never leave the worker; only the compressed image comes
+  back, and the data URL is built from it in one base64 pass;
+- the blank check and the duplicate hash (``screen_page_image``) run in the
+  worker on the image it already has.
+
+One pool can be shared by several clients, e.g. by all documents processed
+at once in api_server.py. Workers are started with 'spawn' because the
+processes creating the pool run threads, which must not be forked.
+"""
+
+import multiprocessing
+import os
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+import fitz  # PyMuPDF
+
+from ocr_utils import encode_image_bytes, fitz_page_to_target_image, screen_page_image
+
+# Documents kept open by each worker process
+MAX_OPEN_DOCUMENTS = 4
+
+# Open documents of this worker process, keyed by (path, modification time)
+_documents: "OrderedDict[Tuple[str, int], fitz.Document]" = OrderedDict()
+
+
+@dataclass
+class RasterizedPage:
+    """A page rendered, screened and encoded by a worker process"""
+    page_num: int
+    target_size: Tuple[int, int]
+    mime: str = ''
+    data: bytes = b''  # Compressed image, empty for blank pages
+    blank: bool = False
+    page_hash: Optional[int] = None
+
+
+def create_render_pool(workers: int) -> ProcessPoolExecutor:
+    """Create a pool of ``workers`` rasterizer processes"""
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+
+
+def _open_document(pdf_path: str):
+    """Open a document in this worker, reusing it for the following pages"""
+    key = (pdf_path, os.stat(pdf_path).st_mtime_ns)
+    doc = _documents.pop(key, None)
+    if doc is None:
+        doc = fitz.open(pdf_path)
+        while len(_documents) >= MAX_OPEN_DOCUMENTS:
+            _documents.popitem(last=False)[1].close()
+    _documents[key] = doc
+    return doc
+
+
+def rasterize_page(pdf_path: str, page_num: int, target_size: Tuple[int, int], image_encoding: str,
+                   skip_blank: bool = True, dedup: bool = True) -> RasterizedPage:
+    """
+    Render, screen and encode one page (runs in a worker process)
+
+    Args:
+        pdf_path: Path to the PDF file
+        page_num: Page number (1-based)
+        target_size: Size the page is sent to the OCR model at
+        image_encoding: Wire encoding, see ocr_utils.IMAGE_ENCODINGS
+        skip_blank: Check whether the page is blank; blank pages are not encoded
+        dedup: Compute the hash for duplicate detection
+
+    Returns:
+        RasterizedPage
+    """
+    page = _open_document(pdf_path)[page_num - 1]
+    image = fitz_page_to_target_image(page, target_size)
+    blank, page_hash = screen_page_image(image, skip_blank, dedup)
+    if blank:
+        return RasterizedPage(page_num, target_size, blank=True)
+    mime, data = encode_image_bytes(image, image_encoding)
+    return RasterizedPage(page_num, target_size, mime, data, page_hash=page_hash)
@@ -0,0 +1,321 @@
+"""
+Text-layer fast path for PDF OCR Client.
+
+Born-digital PDFs already carry their text. ``read_text_layer`` turns the text
+layer of a page into blocks of the same shape the OCR model returns::
+
+    {"bbox": [x1, y1, x2, y2], "category": "Text", "text": "..."}
+
+with bboxes in pixels of the page image the model would have been sent
+(``fitz_page_target_size``), so the blocks are rendered to markdown, and
+their images extracted, exactly like OCR results. Categories are inferred
+from position and typography:
+
+- Page-header / Page-footer: short blocks within the top or bottom margin
+- Title / Section-header: font size relative to the body text, or all bold
+- Caption, List-item, Footnote: leading "Figure 1:", bullets, small print
+  in the lower part of the page
+- Picture: placed images and clusters of vector drawings
+- Table: PyMuPDF's table finder, written as HTML like the model does
+- Formula: blocks set mostly in math fonts
+
+A page is only read from its text layer when the layer can be trusted; pages
+without text, scanned pages (a full-page image, usually under an invisible
+text layer left by an earlier OCR run) and pages whose fonts do not map to
+Unicode are left to the OCR model. Formulas and tables are what a text layer
+represents worst, so they are also reported as regions the OCR model can
+recognize on their own.
+"""
+
+import html
+import re
+import unicodedata
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Dict, List, Tuple
+
+import fitz
+
+# Text extraction flags: no images in the text dict, text outside the page is ignored
+TEXT_FLAGS = fitz.TEXT_PRESERVE_LIGATURES | fitz.TEXT_PRESERVE_WHITESPACE | fitz.TEXT_MEDIABOX_CLIP
+
+# Fonts used for mathematics (TeX, AMS, STIX, MathType, Office)
+MATH_FONT_PATTERN = re.compile(r'CMMI|CMSY|CMEX|CMBSY|MSAM|MSBM|EUFM|RSFS|ESINT|STIX|MTMI|MTSY|MTEX|Math|Symbol',
+                               re.IGNORECASE)
+BULLET_PATTERN = re.compile(r'\s*([•◦▪▫‣⁃∙·●○■□–—*-]|\(?\d{1,2}[.)]|\(?[a-z][.)]|\([ivx]+\))\s')
+CAPTION_PATTERN = re.compile(r'\s*(Figure|Fig\.|Table|Tab\.|Algorithm|Listing|图|表)\s*[A-Z]?\d+(\.\d+)*\s*[:.|—–-]')
+PAGE_NUMBER_PATTERN = re.compile(r'(page\s*)?(\d+|[ivxlc]+)(\s*(/|of)\s*\d+)?', re.IGNORECASE)
+FOOTNOTE_LEADS = '⁰¹²³⁴⁵⁶⁷⁸⁹0123456789*†‡§'
+SUPERSCRIPT_DIGITS = str.maketrans('0123456789', '⁰¹²³⁴⁵⁶⁷⁸⁹')
+
+
+@dataclass
+class TextLayerRegion:
+    """Blocks of a text-layer page that the OCR model may recognize better"""
+    rect: Tuple[float, float, float, float]  # Region in page points
+    blocks: List[int]  # Indexes of the blocks an OCR result of the region replaces
+
+
+@dataclass
+class TextLayerPage:
+    """The text layer of a page converted to OCR blocks"""
+    trusted: bool
+    reason: str = ''  # Why the text layer is not trusted
+    blocks: List[Dict] = field(default_factory=list)
+    regions: List[TextLayerRegion] = field(default_factory=list)
+    chars: int = 0
+
+
+@dataclass
+class _Paragraph:
+    rect: fitz.Rect
+    lines: List[str]
+    size: float  # Largest font size
+    bold: float  # Fraction of characters in bold
+    math: float  # Fraction of characters in math fonts
+
+
+def _is_cjk(char: str) -> bool:
+    return '\u3000' <= char <= '\u9fff' or '\uac00' <= char <= '\ud7af' or '\uff00' <= char <= '\uffef'
+
+
+def _join_lines(lines: List[str]) -> str:
+    """Join the lines of a paragraph, undoing hyphenation at line ends"""
+    text = ''
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        if not text:
+            text = line
+        elif text[-1] == '\u00ad' or (text[-1] == '-' and len(text) > 1 and text[-2].isalpha()
+                                       and line[0].islower()):
+            text = text[:-1] + line
+        elif _is_cjk(text[-1]) and _is_cjk(line[0]):
+            text += line
+        else:
+            text += ' ' + line
+    return text
+
+
+def _span_text(span: Dict) -> str:
+    """Text of a span; superscript numbers become superscript digits, like the model writes them"""
+    text = span['text']
+    if span['flags'] & fitz.TEXT_FONT_SUPERSCRIPT and text.strip().isdigit():
+        return text.strip().translate(SUPERSCRIPT_DIGITS)
+    return text
+
+
+def _untrusted_reason(page, text: str, min_chars: int) -> str:
+    """Why the text layer of a page cannot be used instead of OCR ('' if it can)"""
+    visible = [c for c in text if not c.isspace()]
+    if len(visible) < min_chars:
+        return 'too little text' if visible else 'no text layer'
+    # Glyphs without a Unicode mapping come out as U+FFFD, private use or control characters
+    unmapped = sum(1 for c in visible if c == '\ufffd' or unicodedata.category(c) in ('Co', 'Cc', 'Cs'))
+    if unmapped > 0.01 * len(visible):
+        return f'{unmapped} glyphs without Unicode mapping'
+    if sum(1 for c in visible if c.isalnum()) < 0.5 * len(visible):
+        return 'garbled text'
+
+    page_area = abs(page.rect)
+    for info in page.get_image_info():
+        if abs(fitz.Rect(info['bbox']) & page.rect) > 0.85 * page_area:
+            return 'scanned page'
+    if hasattr(page, 'get_texttrace'):
+        total = invisible = 0
+        for span in page.get_texttrace():
+            total += len(span['chars'])
+            if span['type'] == 3 or span['opacity'] == 0:
+                invisible += len(span['chars'])
+        if total and invisible > 0.5 * total:
+            return 'invisible text layer'
+    return ''
+
+
+def _paragraphs(text_blocks: List[Dict]) -> List[_Paragraph]:
+    """Convert text dict blocks to paragraphs; lists are split into one paragraph per item"""
+    paragraphs = []
+    for block in text_blocks:
+        current = None
+        for line in block['lines']:
+            spans = [span for span in line['spans'] if span['text'].strip()]
+            if not spans:
+                continue
+            line_text = ''.join(_span_text(span) for span in line['spans'])
+            if current is None or BULLET_PATTERN.match(line_text):
+                current = {'rect': fitz.Rect(line['bbox']), 'lines': [], 'spans': []}
+                paragraphs.append(current)
+            current['rect'] |= line['bbox']
+            current['lines'].append(line_text)
+            current['spans'].extend(spans)
+
+    result = []
+    for paragraph in paragraphs:
+        chars = sum(len(span['text']) for span in paragraph['spans']) or 1
+        bold = sum(len(span['text']) for span in paragraph['spans']
+                   if span['flags'] & fitz.TEXT_FONT_BOLD or 'bold' in span['font'].lower())
+        math = sum(len(span['text']) for span in paragraph['spans'] if MATH_FONT_PATTERN.search(span['font']))
+        result.append(_Paragraph(paragraph['rect'], paragraph['lines'],
+                                 max(span['size'] for span in paragraph['spans']), bold / chars, math / chars))
+    return result
+
+
+def _classify(paragraph: _Paragraph, text: str, page_rect, body_size: float) -> str:
+    """Infer the layout category of a paragraph"""
+    rect = paragraph.rect
+    margin = 0.07 * page_rect.height
+    if len(text) < 150 and len(paragraph.lines) <= 2:
+        if rect.y1 <= page_rect.y0 + margin:
+            return 'Page-header'
+        if rect.y0 >= page_rect.y1 - margin:
+            return 'Page-footer'
+        # Page numbers sit further from the edge than running heads
+        if PAGE_NUMBER_PATTERN.fullmatch(text):
+            if rect.y1 <= page_rect.y0 + 2 * margin:
+                return 'Page-header'
+            if rect.y0 >= page_rect.y1 - 2 * margin:
+                return 'Page-footer'
+    if paragraph.math >= 0.4:
+        return 'Formula'
+    if CAPTION_PATTERN.match(text):
+        return 'Caption'
+    if len(text) < 200 and paragraph.size >= 1.5 * body_size:
+        return 'Title'
+    if (len(text) < 120 and len(paragraph.lines) <= 3 and
+            (paragraph.size >= 1.15 * body_size or paragraph.bold >= 0.9)):
+        return 'Section-header'
+    if (rect.y0 > page_rect.y0 + 0.6 * page_rect.height and paragraph.size <= 0.9 * body_size
+            and text[0] in FOOTNOTE_LEADS):
+        return 'Footnote'
+    if BULLET_PATTERN.match(text):
+        return 'List-item'
+    return 'Text'
+
+
+def _table_html(rows: List[List]) -> str:
+    """Write extracted table cells as an HTML table, the format the model uses for tables"""
+    def cells(row):
+        return ''.join(f"<td>{html.escape(' '.join((cell or '').split()))}</td>" for cell in row)
+    return '<table>' + ''.join(f'<tr>{cells(row)}</tr>' for row in rows) + '</table>'
+
+
+def _union_overlapping(rects: List[fitz.Rect]) -> List[fitz.Rect]:
+    """Merge rectangles that intersect into their union"""
+    merged = []
+    for rect in rects:
+        rect = fitz.Rect(rect)
+        changed = True
+        while changed:
+            changed = False
+            for other in merged:
+                if rect.intersects(other):
+                    rect |= other
+                    merged.remove(other)
+                    changed = True
+                    break
+        merged.append(rect)
+    return merged
+
+
+def read_text_layer(page, target_size: Tuple[int, int], min_chars: int = 20) -> TextLayerPage:
+    """
+    Convert the text layer of a page to OCR blocks
+
+    Args:
+        page: fitz page object
+        target_size: (width, height) the page would be sent to the OCR model
+            at; the bboxes are in these pixels
+        min_chars: Pages with fewer non-space characters go to OCR
+
+    Returns:
+        TextLayerPage; only ``trusted`` and ``reason`` are set if the text
+        layer cannot be used
+    """
+    page_rect = page.rect
+    text_blocks = [block for block in page.get_text('dict', flags=TEXT_FLAGS)['blocks'] if block['type'] == 0]
+    spans = [span for block in text_blocks for line in block['lines'] for span in line['spans']]
+    text = ''.join(span['text'] for span in spans)
+    reason = _untrusted_reason(page, text, min_chars)
+    if reason:
+        return TextLayerPage(False, reason, chars=len(text))
+
+    # Body text size: the size most characters are set in
+    sizes = Counter()
+    for span in spans:
+        sizes[round(span['size'] * 2) / 2] += len(span['text'])
+    body_size = sizes.most_common(1)[0][0]
+
+    paragraphs = [paragraph for paragraph in _paragraphs(text_blocks) if _join_lines(paragraph.lines)]
+
+    def text_coverage(rect: fitz.Rect) -> float:
+        covered = sum(abs(paragraph.rect & rect) for paragraph in paragraphs)
+        return covered / abs(rect) if abs(rect) else 1.0
+
+    # Ruled tables, then figures: placed images and drawings that are not mostly text
+    drawings = page.get_drawings()
+    tables = []
+    if drawings and hasattr(page, 'find_tables'):
+        try:
+            tables = [(fitz.Rect(table.bbox), _table_html(table.extract())) for table in page.find_tables().tables]
+        except Exception:
+            tables = []  # The table finder is a heuristic; a page it fails on keeps its text
+    table_rects = [rect for rect, _ in tables]
+
+    page_area = abs(page_rect)
+    figure_rects = [fitz.Rect(info['bbox']) & page_rect for info in page.get_image_info()]
+    if drawings and hasattr(page, 'cluster_drawings'):
+        figure_rects += [rect for rect in page.cluster_drawings(drawings=drawings)
+                         if rect.width >= 0.1 * page_rect.width and rect.height >= 0.05 * page_rect.height]
+    figure_rects = [rect for rect in figure_rects
+                    if rect.width >= 24 and rect.height >= 24 and abs(rect) >= 0.005 * page_area
+                    and not any(rect.intersects(table) for table in table_rects) and text_coverage(rect) < 0.4]
+    figure_rects = _union_overlapping(figure_rects)
+
+    def inside(rect: fitz.Rect, containers: List[fitz.Rect]) -> bool:
+        center = fitz.Point((rect.x0 + rect.x1) / 2, (rect.y0 + rect.y1) / 2)
+        return any(center in container + (-2, -2, 2, 2) for container in containers)
+
+    # Paragraphs in content stream order, which is the reading order of most
+    # generators; text inside figures (labels) and tables is dropped
+    items = []  # (rect, block)
+    for paragraph in paragraphs:
+        if inside(paragraph.rect, figure_rects + table_rects):
+            continue
+        paragraph_text = _join_lines(paragraph.lines)
+        items.append((paragraph.rect, {'category': _classify(paragraph, paragraph_text, page_rect, body_size),
+                                       'text': paragraph_text}))
+
+    # Figures and tables go before the first paragraph below them in the same column
+    for rect, block in ([(rect, {'category': 'Picture'}) for rect in figure_rects] +
+                        [(rect, {'category': 'Table', 'text': table}) for rect, table in tables]):
+        position = next((i for i, (other, _) in enumerate(items)
+                         if other.y0 >= rect.y0 - 1 and min(other.x1, rect.x1) > max(other.x0, rect.x0)),
+                        len(items))
+        items.insert(position, (rect, block))
+
+    scale_x = target_size[0] / page_rect.width
+    scale_y = target_size[1] / page_rect.height
+    blocks = []
+    regions = []
+    for i, (rect, block) in enumerate(items):
+        bbox = [
+            max(0, min(target_size[0], round((rect.x0 - page_rect.x0) * scale_x))),
+            max(0, min(target_size[1], round((rect.y0 - page_rect.y0) * scale_y))),
+            max(0, min(target_size[0], round((rect.x1 - page_rect.x0) * scale_x))),
+            max(0, min(target_size[1], round((rect.y1 - page_rect.y0) * scale_y))),
+        ]
+        blocks.append({'bbox': bbox, **block})
+
+        if block['category'] in ('Formula', 'Table'):
+            padded = (rect + (-4, -4, 4, 4)) & page_rect
+            previous = regions[-1] if regions else None
+            # Lines of a display formula often come as separate blocks
+            if (previous and previous.blocks[-1] == i - 1 and block['category'] == 'Formula'
+                    and blocks[i - 1]['category'] == 'Formula' and padded.intersects(previous.rect)):
+                previous.rect = tuple(fitz.Rect(previous.rect) | padded)
+                previous.blocks.append(i)
+            else:
+                regions.append(TextLayerRegion(tuple(padded), [i]))
+
+    return TextLayerPage(True, blocks=blocks, regions=regions, chars=len(text))
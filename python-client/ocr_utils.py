@@ -2,9 +2,14 @@
 OCR utility functions for PDF OCR Client.
 
 Includes:
-- Image resizing (smart_resize, PILimage_to_base64)
-- PDF page to image conversion (fitz_doc_to_image)
-- OCR output cleaning (OutputCleaner)
+- Image resizing and encoding (smart_resize, PILimage_to_base64, encode_image_data_url,
+  encode_image_bytes, image_data_url)
+- PDF page to image conversion (fitz_page_target_size, fitz_page_to_target_image,
+  fitz_clip_to_image, fitz_doc_to_image, estimate_page_complexity)
+- Page tiling for dense pages (fitz_page_tiles, fitz_clip_tile, merge_tile_blocks)
+- Blank and duplicate page detection (screen_page_image, is_blank_image, image_dhash,
+  image_difference_fraction)
+- OCR output cleaning (OutputCleaner, StreamingLayoutParser, RepetitionDetector)
 """
 
 import math
@@ -12,11 +17,11 @@ import base64
 import json
 import re
 from io import BytesIO
-from typing import Dict, List, Tuple, Optional, Any
+from typing import Any, Callable, Dict, List, Tuple, Optional
 from dataclasses import dataclass
 
 import fitz
-from PIL import Image
+from PIL import Image, ImageChops
 
 
 # ---------------------------------------------------------------------------
@@ -75,10 +80,164 @@ def smart_resize(
 def PILimage_to_base64(image, format='PNG'):
     buffered = BytesIO()
     image.save(buffered, format=format)
-    base64_str = base64.b64encode(buffered.getvalue()).decode('utf-8')
+    base64_str = base64.b64encode(buffered.getbuffer()).decode('ascii')
     return f"data:image/{format.lower()};base64,{base64_str}"
 
 
+# Wire encodings for page images sent to the OCR API, as "name" or "name:param":
+#   png[:level]    lossless PNG, zlib level 0-9 (default 6, same as PILimage_to_base64)
+#   gray[:level]   8-bit grayscale PNG, for scans without meaningful color
+#   bilevel        1-bit PNG thresholded at 50%, for clean black-and-white text scans
+#   webp[:method]  lossless WebP, method 0 (fast) - 6 (small), default 2
+#   jpeg[:quality] JPEG without chroma subsampling, quality default 95
+IMAGE_ENCODINGS = ('png', 'gray', 'bilevel', 'webp', 'jpeg')
+
+
+def parse_image_encoding(encoding: str) -> Tuple[str, Optional[int]]:
+    """Split and validate an encoding spec like 'png:1' into ('png', 1)."""
+    name, _, param = encoding.strip().lower().partition(':')
+    if name not in IMAGE_ENCODINGS:
+        raise ValueError(f"Unknown image encoding '{encoding}', expected one of {', '.join(IMAGE_ENCODINGS)}")
+    if param and name == 'bilevel':
+        raise ValueError("The bilevel encoding takes no parameter")
+    try:
+        return name, int(param) if param else None
+    except ValueError:
+        raise ValueError(f"Invalid parameter in image encoding '{encoding}'") from None
+
+
+def encode_image_data_url(image: Image.Image, encoding: str = 'png') -> str:
+    """Encode an image as a base64 data URL for the OCR API.
+
+    The encoder writes into one buffer that is base64-encoded in place
+    (``getbuffer`` instead of ``getvalue``), so the compressed image is not
+    copied before the data URL is built.
+
+    Args:
+        image: PIL image.
+        encoding: Wire encoding, see ``IMAGE_ENCODINGS``.
+
+    Returns:
+        'data:image/<type>;base64,...' string.
+    """
+    mime, buffered = _encode_image(image, encoding)
+    return image_data_url(mime, buffered.getbuffer())
+
+
+def encode_image_bytes(image: Image.Image, encoding: str = 'png') -> Tuple[str, bytes]:
+    """Encode an image like ``encode_image_data_url``, returning (image type, compressed bytes).
+
+    For encoding in another process: the compressed bytes are smaller than
+    the data URL, and ``image_data_url`` builds the data URL from them in
+    one base64 pass.
+    """
+    mime, buffered = _encode_image(image, encoding)
+    return mime, buffered.getvalue()
+
+
+def image_data_url(mime: str, data) -> str:
+    """Build a base64 data URL from an image type and compressed image bytes (or buffer)."""
+    return f"data:image/{mime};base64," + base64.b64encode(data).decode('ascii')
+
+
+def _encode_image(image: Image.Image, encoding: str) -> Tuple[str, BytesIO]:
+    name, param = parse_image_encoding(encoding)
+    buffered = BytesIO()
+
+    if name == 'png':
+        image.save(buffered, format='PNG', compress_level=6 if param is None else param)
+        mime = 'png'
+    elif name == 'gray':
+        image.convert('L').save(buffered, format='PNG', compress_level=6 if param is None else param)
+        mime = 'png'
+    elif name == 'bilevel':
+        image.convert('L').point(lambda v: 255 if v >= 128 else 0, mode='1').save(buffered, format='PNG')
+        mime = 'png'
+    elif name == 'webp':
+        image.save(buffered, format='WEBP', lossless=True, method=2 if param is None else param)
+        mime = 'webp'
+    else:
+        image.convert('RGB').save(buffered, format='JPEG', quality=95 if param is None else param, subsampling=0)
+        mime = 'jpeg'
+    return mime, buffered
+
+
+# ---------------------------------------------------------------------------
+# Page screening
+# ---------------------------------------------------------------------------
+
+def is_blank_image(image: Image.Image, ink_threshold: int = 48, max_ink_fraction: float = 0.0005,
+                   margin: float = 0.025) -> bool:
+    """Tell whether a page image is blank, e.g. a separator page or an empty scan.
+
+    The image is reduced 4x in grayscale, which averages out scanner noise,
+    and the margins, where scans tend to have shadows, are ignored. Pixels
+    that differ from the background (the median gray value) by more than
+    ``ink_threshold`` count as ink. A page with nothing but a page number is
+    blank at the default ``max_ink_fraction``.
+
+    Args:
+        image: PIL page image.
+        ink_threshold: Gray level difference from the background that is ink.
+        max_ink_fraction: Largest fraction of ink pixels of a blank page.
+        margin: Fraction of the width/height ignored on every side.
+
+    Returns:
+        True if the page is blank.
+    """
+    gray = image.convert('L').reduce(4)
+    dx, dy = round(gray.width * margin), round(gray.height * margin)
+    histogram = gray.crop((dx, dy, gray.width - dx, gray.height - dy)).histogram()
+    total = sum(histogram)
+    if not total:
+        return True
+    count = 0
+    for background, pixels in enumerate(histogram):
+        count += pixels
+        if count * 2 >= total:
+            break
+    ink = sum(pixels for value, pixels in enumerate(histogram) if abs(value - background) > ink_threshold)
+    return ink <= max_ink_fraction * total
+
+
+def image_dhash(image: Image.Image, size: int = 32) -> int:
+    """Difference hash of an image: one bit per horizontal gradient of a size x size thumbnail.
+
+    Similar images have hashes that differ in few bits. The hash only finds
+    candidates; pages of the same layout can hash alike, so duplicates are
+    confirmed with ``image_difference_fraction``.
+    """
+    gray = image.convert('L').resize((size + 1, size), Image.BOX)
+    pixels = list(gray.getdata())
+    value = 0
+    for y in range(size):
+        row = pixels[y * (size + 1):(y + 1) * (size + 1)]
+        for x in range(size):
+            value = value << 1 | (row[x] > row[x + 1])
+    return value
+
+
+def screen_page_image(image: Image.Image, skip_blank: bool = True,
+                      dedup: bool = True) -> Tuple[bool, Optional[int]]:
+    """Run the pre-OCR checks on a page image.
+
+    Returns:
+        Tuple of (whether the page is blank, ``image_dhash`` for duplicate
+        detection or None). A check that is off reports False / None.
+    """
+    blank = skip_blank and is_blank_image(image)
+    return blank, image_dhash(image) if dedup and not blank else None
+
+
+def image_difference_fraction(a: Image.Image, b: Image.Image, threshold: int = 64) -> float:
+    """Fraction of pixels whose gray levels differ by more than ``threshold`` (1.0 if the sizes differ)."""
+    if a.size != b.size:
+        return 1.0
+    difference = ImageChops.difference(a.convert('L'), b.convert('L'))
+    histogram = difference.histogram()
+    return sum(histogram[threshold + 1:]) / (a.width * a.height)
+
+
 # ---------------------------------------------------------------------------
 # PDF / fitz utilities
 # ---------------------------------------------------------------------------
@@ -105,6 +264,268 @@ def fitz_doc_to_image(doc, target_dpi=200, origin_dpi=None) -> Image.Image:
     return image
 
 
+def fitz_page_target_size(
+    page,
+    target_dpi: int = 200,
+    max_side: int = 4500,
+    factor: int = 28,
+    min_pixels: int = 3136,
+    max_pixels: int = 11289600,
+) -> Tuple[int, int]:
+    """Compute the size a page is sent to the OCR model at, without rendering it.
+
+    The page is nominally rendered at ``target_dpi``, capped so that neither
+    side exceeds ``max_side`` pixels, and then fitted to the ``smart_resize``
+    constraints.
+
+    Args:
+        page: PyMuPDF page object.
+        target_dpi: Nominal rendering resolution.
+        max_side: Upper bound for either side before ``smart_resize``.
+        factor, min_pixels, max_pixels: ``smart_resize`` constraints.
+
+    Returns:
+        Target (width, height) in pixels.
+    """
+    return fitz_rect_target_size(page.rect, target_dpi, max_side, factor, min_pixels, max_pixels)
+
+
+def fitz_rect_target_size(
+    rect,
+    target_dpi: int = 200,
+    max_side: int = 4500,
+    factor: int = 28,
+    min_pixels: int = 3136,
+    max_pixels: int = 11289600,
+) -> Tuple[int, int]:
+    """Like ``fitz_page_target_size`` for any rectangle of a page, e.g. a tile."""
+    scale = min(target_dpi / 72, max_side / max(rect.width, rect.height))
+    height, width = smart_resize(
+        max(1, round(rect.height * scale)),
+        max(1, round(rect.width * scale)),
+        factor=factor,
+        min_pixels=min_pixels,
+        max_pixels=max_pixels
+    )
+    return width, height
+
+
+def _fit_pixmap_to_size(pm, size: Tuple[int, int]) -> Image.Image:
+    """Convert a pixmap to a PIL image of exactly ``size``.
+
+    The pixmap bounds are rounded outwards by MuPDF, so they can exceed the
+    requested size by a pixel; that pixel is cropped rather than resampled.
+    """
+    image = Image.frombytes('RGB', (pm.width, pm.height), pm.samples)
+    if image.size == size:
+        return image
+    if image.width >= size[0] and image.height >= size[1]:
+        return image.crop((0, 0, size[0], size[1]))
+    return image.resize(size)
+
+
+def fitz_page_to_target_image(page, target_size: Tuple[int, int]) -> Image.Image:
+    """Rasterize a page once, directly at the size sent to the OCR model.
+
+    Args:
+        page: PyMuPDF page object.
+        target_size: (width, height), e.g. from ``fitz_page_target_size``.
+
+    Returns:
+        PIL Image in RGB mode of exactly ``target_size``.
+    """
+    width, height = target_size
+    mat = fitz.Matrix(width / page.rect.width, height / page.rect.height)
+    pm = page.get_pixmap(matrix=mat, alpha=False)
+    return _fit_pixmap_to_size(pm, target_size)
+
+
+def fitz_clip_to_image(page, bbox, target_size: Tuple[int, int]) -> Image.Image:
+    """Render only a region of a page.
+
+    Produces the same pixels as cropping ``bbox`` out of the page rendered by
+    ``fitz_page_to_target_image``, without rasterizing the rest of the page.
+
+    Args:
+        page: PyMuPDF page object.
+        bbox: (x1, y1, x2, y2) in pixels of the page rendered at ``target_size``,
+            i.e. in the coordinates of the OCR result.
+        target_size: (width, height) the page was sent to the OCR model at.
+
+    Returns:
+        PIL Image in RGB mode.
+    """
+    x1, y1, x2, y2 = bbox
+    rect = page.rect
+    scale_x = target_size[0] / rect.width
+    scale_y = target_size[1] / rect.height
+    clip = fitz.Rect(rect.x0 + x1 / scale_x, rect.y0 + y1 / scale_y,
+                     rect.x0 + x2 / scale_x, rect.y0 + y2 / scale_y)
+    pm = page.get_pixmap(matrix=fitz.Matrix(scale_x, scale_y), clip=clip, alpha=False)
+    return _fit_pixmap_to_size(pm, (round(x2 - x1), round(y2 - y1)))
+
+
+@dataclass
+class PageTile:
+    """A horizontal band of a page that is recognized on its own"""
+    index: int
+    rect: Tuple[float, float, float, float]  # Band in page points (PDF coordinates)
+    core: Tuple[float, float]  # y range (points) whose blocks belong to this band
+    target_size: Tuple[int, int]  # (width, height) the band is sent to the OCR model at
+    image: Optional[Image.Image] = None
+
+
+def fitz_page_tiles(page, count: int, overlap: float = 0.08, target_dpi: int = 200) -> List[PageTile]:
+    """Split a page into overlapping horizontal bands and render each one.
+
+    Every band is rendered at ``target_dpi`` within the ``smart_resize``
+    limits on its own, so a band gets more pixels per point than the whole
+    page when the page size is capped by ``max_pixels``, and the model
+    generates a shorter output for it. Neighbouring bands overlap by
+    ``overlap`` of the page height so that a line cut by one band edge is
+    seen whole in the other band; the middle of the overlap separates the
+    cores the bands own in ``merge_tile_blocks``.
+
+    Args:
+        page: PyMuPDF page object.
+        count: Number of bands.
+        overlap: Overlap of neighbouring bands as a fraction of the page height.
+        target_dpi: Nominal rendering resolution of the bands.
+
+    Returns:
+        List of PageTile with rendered images, top to bottom.
+    """
+    rect = page.rect
+    band = rect.height / count
+    margin = rect.height * overlap / 2
+    tiles = []
+    for i in range(count):
+        core = (rect.y0 + i * band, rect.y0 + (i + 1) * band)
+        clip = fitz.Rect(rect.x0, max(rect.y0, core[0] - margin), rect.x1, min(rect.y1, core[1] + margin))
+        tiles.append(fitz_clip_tile(page, i, clip, core, target_dpi=target_dpi))
+    return tiles
+
+
+def fitz_clip_tile(page, index: int, clip, core: Optional[Tuple[float, float]] = None,
+                   target_dpi: int = 200) -> PageTile:
+    """Render a rectangle of a page as a PageTile at its own target size.
+
+    Args:
+        page: PyMuPDF page object.
+        index: Index of the tile.
+        clip: Rectangle in page points.
+        core: y range owned by the tile in ``merge_tile_blocks`` (default: all of it).
+        target_dpi: Nominal rendering resolution.
+
+    Returns:
+        PageTile with the rendered image.
+    """
+    clip = fitz.Rect(clip)
+    target_size = fitz_rect_target_size(clip, target_dpi=target_dpi)
+    mat = fitz.Matrix(target_size[0] / clip.width, target_size[1] / clip.height)
+    pm = page.get_pixmap(matrix=mat, clip=clip, alpha=False)
+    return PageTile(index, (clip.x0, clip.y0, clip.x1, clip.y1), core or (clip.y0, clip.y1), target_size,
+                    _fit_pixmap_to_size(pm, target_size))
+
+
+def merge_tile_blocks(tiles: List[PageTile], tile_blocks: List[List[Dict]], page_rect,
+                      page_target_size: Tuple[int, int]) -> List[Dict]:
+    """Merge the blocks recognized on the bands of a page.
+
+    Bboxes are mapped from band pixels to the pixels of the whole page at
+    ``page_target_size``, i.e. the coordinates a full-page OCR result would
+    have. A block in an overlap is usually recognized on both bands; of the
+    copies that cover the same area, an uncut copy wins over one cut off by
+    a band edge, then the copy from the band whose core contains the block
+    center.
+
+    Args:
+        tiles: Bands from ``fitz_page_tiles``.
+        tile_blocks: Cleaned OCR blocks of each band.
+        page_rect: ``page.rect`` of the page.
+        page_target_size: (width, height) of the page in OCR result coordinates.
+
+    Returns:
+        Blocks of the page in band order.
+    """
+    candidates = []  # (tile index, block, bbox in page points or None, cut off by a band edge)
+    for tile, blocks in zip(tiles, tile_blocks):
+        x0, y0, x1, y1 = tile.rect
+        scale_x = tile.target_size[0] / (x1 - x0)
+        scale_y = tile.target_size[1] / (y1 - y0)
+        edge = 0.005 * tile.target_size[1] + 2  # Pixels from a band edge that count as touching it
+        for block in blocks:
+            bbox = block.get('bbox') if isinstance(block, dict) else None
+            if not (isinstance(bbox, list) and len(bbox) == 4):
+                candidates.append((tile.index, block, None, False))
+                continue
+            points = (x0 + bbox[0] / scale_x, y0 + bbox[1] / scale_y,
+                      x0 + bbox[2] / scale_x, y0 + bbox[3] / scale_y)
+            cut = ((y0 > page_rect.y0 and bbox[1] <= edge) or
+                   (y1 < page_rect.y1 and bbox[3] >= tile.target_size[1] - edge))
+            candidates.append((tile.index, block, points, cut))
+
+    def covers_same_area(a, b) -> bool:
+        width = min(a[2], b[2]) - max(a[0], b[0])
+        height = min(a[3], b[3]) - max(a[1], b[1])
+        smaller = min((a[2] - a[0]) * (a[3] - a[1]), (b[2] - b[0]) * (b[3] - b[1]))
+        return width > 0 and height > 0 and smaller > 0 and width * height / smaller > 0.5
+
+    def in_own_core(candidate) -> bool:
+        index, _, points, _ = candidate
+        core = tiles[index].core
+        center_y = (points[1] + points[3]) / 2
+        return core[0] <= center_y < core[1]
+
+    placed = [i for i, candidate in enumerate(candidates) if candidate[2] is not None]
+    placed.sort(key=lambda i: (candidates[i][3], not in_own_core(candidates[i])))
+    accepted = set()
+    for i in placed:
+        index, _, points, _ = candidates[i]
+        if not any(candidates[j][0] != index and covers_same_area(points, candidates[j][2]) for j in accepted):
+            accepted.add(i)
+
+    scale_x = page_target_size[0] / page_rect.width
+    scale_y = page_target_size[1] / page_rect.height
+    merged = []
+    for i, (index, block, points, _) in enumerate(candidates):
+        if points is None:
+            # Blocks without a bbox cannot be placed; keep them once
+            if block not in merged:
+                merged.append(block)
+            continue
+        if i not in accepted:
+            continue
+        block = dict(block)
+        block['bbox'] = [
+            round((points[0] - page_rect.x0) * scale_x),
+            round((points[1] - page_rect.y0) * scale_y),
+            round((points[2] - page_rect.x0) * scale_x),
+            round((points[3] - page_rect.y0) * scale_y),
+        ]
+        merged.append(block)
+    return merged
+
+
+def estimate_page_complexity(page, dpi: int = 18) -> int:
+    """Cheaply estimate how expensive a page is to OCR.
+
+    Renders a tiny grayscale thumbnail and returns its PNG-compressed size:
+    dense text, tables and figures compress poorly, blank areas compress to
+    almost nothing. Only the relative order of the values is meaningful.
+
+    Args:
+        page: PyMuPDF page object.
+        dpi: Thumbnail resolution.
+
+    Returns:
+        Complexity score (compressed thumbnail size in bytes).
+    """
+    mat = fitz.Matrix(dpi / 72, dpi / 72)
+    pm = page.get_pixmap(matrix=mat, colorspace=fitz.csGRAY, alpha=False)
+    return len(pm.tobytes("png"))
+
+
 # ---------------------------------------------------------------------------
 # Output cleaner
 # ---------------------------------------------------------------------------
@@ -123,14 +544,19 @@ class CleanedData:
 class OutputCleaner:
     """Data Cleaner - Based on a simplified regex method"""
 
-    def __init__(self):
+    def __init__(self, log: Callable[..., None] = print):
+        """
+        Args:
+            log: print-compatible function receiving the cleaning diagnostics
+        """
+        self.log = log
         self.dict_pattern = re.compile(r'\{[^{}]*?"bbox"\s*:\s*\[[^\]]*?\][^{}]*?\}', re.DOTALL)
         self.bbox_pattern = re.compile(r'"bbox"\s*:\s*\[([^\]]+)\]')
         self.missing_delimiter_pattern = re.compile(r'\}\s*\{(?!")')
 
     def clean_list_data(self, data: List[Dict], case_id: int) -> CleanedData:
-        print(f"🔧 Cleaning List data - Case {case_id}")
-        print(f"  Original items: {len(data)}")
+        self.log(f"🔧 Cleaning List data - Case {case_id}")
+        self.log(f"  Original items: {len(data)}")
 
         cleaned_data = []
         operations = {
@@ -148,7 +574,7 @@ class OutputCleaner:
             if 'bbox' in item:
                 bbox = item['bbox']
                 if isinstance(bbox, list) and len(bbox) == 3:
-                    print(f"  ⚠️ Item {i}: bbox has only 3 coordinates. Removing bbox, keeping category and text.")
+                    self.log(f"  ⚠️ Item {i}: bbox has only 3 coordinates. Removing bbox, keeping category and text.")
                     new_item = {}
                     if 'category' in item:
                         new_item['category'] = item['category']
@@ -164,7 +590,7 @@ class OutputCleaner:
                     cleaned_data.append(item.copy())
                     continue
                 else:
-                    print(f"  ❌ Item {i}: Abnormal bbox format, skipping.")
+                    self.log(f"  ❌ Item {i}: Abnormal bbox format, skipping.")
                     operations['removed_items'] += 1
                     continue
             else:
@@ -175,7 +601,7 @@ class OutputCleaner:
                     operations['removed_items'] += 1
 
         operations['final_count'] = len(cleaned_data)
-        print(f"  ✅ Cleaning complete: {len(cleaned_data)} items, {operations['bbox_fixes']} bbox fixes, {operations['removed_items']} items removed")
+        self.log(f"  ✅ Cleaning complete: {len(cleaned_data)} items, {operations['bbox_fixes']} bbox fixes, {operations['removed_items']} items removed")
 
         return CleanedData(
             case_id=case_id,
@@ -187,8 +613,8 @@ class OutputCleaner:
         )
 
     def clean_string_data(self, data_str: str, case_id: int) -> CleanedData:
-        print(f"🔧 Cleaning String data - Case {case_id}")
-        print(f"  Original length: {len(data_str):,}")
+        self.log(f"🔧 Cleaning String data - Case {case_id}")
+        self.log(f"  Original length: {len(data_str):,}")
 
         operations = {
             'type': 'str',
@@ -217,7 +643,7 @@ class OutputCleaner:
 
             if final_data is not None:
                 operations['final_objects'] = len(final_data)
-                print(f"  ✅ Cleaning complete: {len(final_data)} objects")
+                self.log(f"  ✅ Cleaning complete: {len(final_data)} objects")
                 return CleanedData(
                     case_id=case_id,
                     original_type='str',
@@ -230,7 +656,7 @@ class OutputCleaner:
                 raise Exception("Could not parse the cleaned data")
 
         except Exception as e:
-            print(f"  ❌ Cleaning failed: {e}")
+            self.log(f"  ❌ Cleaning failed: {e}")
             return CleanedData(
                 case_id=case_id,
                 original_type='str',
@@ -250,7 +676,7 @@ class OutputCleaner:
 
         text = self.missing_delimiter_pattern.sub(replace_delimiter, text)
         if fixes > 0:
-            print(f"    ✅ Fixed {fixes} missing delimiters")
+            self.log(f"    ✅ Fixed {fixes} missing delimiters")
         return text, fixes
 
     def _truncate_last_incomplete_element(self, text: str) -> Tuple[str, bool]:
@@ -262,7 +688,7 @@ class OutputCleaner:
         if needs_truncation:
             bbox_count = text.count('{"bbox":')
             if bbox_count <= 1:
-                print(f"    ⚠️ Only {bbox_count} dict objects found, skipping truncation to avoid deleting all content")
+                self.log(f"    ⚠️ Only {bbox_count} dict objects found, skipping truncation to avoid deleting all content")
                 return text, False
 
             last_bbox_pos = text.rfind('{"bbox":')
@@ -270,7 +696,7 @@ class OutputCleaner:
                 truncated_text = text[:last_bbox_pos].rstrip()
                 if truncated_text.endswith(','):
                     truncated_text = truncated_text[:-1]
-                print(f"    ✂️ Truncated the last incomplete element, length reduced from {len(text):,} to {len(truncated_text):,}")
+                self.log(f"    ✂️ Truncated the last incomplete element, length reduced from {len(text):,} to {len(truncated_text):,}")
                 return truncated_text, True
 
         return text, False
@@ -280,7 +706,7 @@ class OutputCleaner:
         if not dict_matches:
             return text, 0
 
-        print(f"    📊 Found {len(dict_matches)} dict objects")
+        self.log(f"    📊 Found {len(dict_matches)} dict objects")
 
         unique_dicts = []
         seen_dict_strings = set()
@@ -296,10 +722,10 @@ class OutputCleaner:
 
         if total_duplicates > 0:
             new_text = '[' + ', '.join(unique_dicts) + ']'
-            print(f"    ✅ Removed {total_duplicates} duplicate dicts, keeping {len(unique_dicts)} unique dicts (order preserved)")
+            self.log(f"    ✅ Removed {total_duplicates} duplicate dicts, keeping {len(unique_dicts)} unique dicts (order preserved)")
             return new_text, total_duplicates
         else:
-            print(f"    ✅ No duplicate dict objects found")
+            self.log(f"    ✅ No duplicate dict objects found")
             return text, 0
 
     def _ensure_json_format(self, text: str) -> str:
@@ -317,7 +743,7 @@ class OutputCleaner:
             if isinstance(data, list):
                 return data
         except json.JSONDecodeError as e:
-            print(f"    ❌ JSON parsing failed: {e}")
+            self.log(f"    ❌ JSON parsing failed: {e}")
 
             valid_dicts = []
             for match in self.dict_pattern.finditer(text):
@@ -329,7 +755,7 @@ class OutputCleaner:
                     continue
 
             if valid_dicts:
-                print(f"    ✅ Extracted {len(valid_dicts)} valid dicts")
+                self.log(f"    ✅ Extracted {len(valid_dicts)} valid dicts")
                 return valid_dicts
 
             return self._handle_single_incomplete_dict(text)
@@ -363,19 +789,19 @@ class OutputCleaner:
             if text_content:
                 fixed_dict["text"] = text_content
 
-            print(f"    🔧 Special fix: single incomplete dict → {fixed_dict}")
+            self.log(f"    🔧 Special fix: single incomplete dict → {fixed_dict}")
             return [fixed_dict]
 
         except Exception as e:
-            print(f"    ❌ Special fix failed: {e}")
+            self.log(f"    ❌ Special fix failed: {e}")
             return None
 
     def remove_duplicate_category_text_pairs_and_bbox(self, data_list: List[dict], case_id: int) -> List[dict]:
         if not data_list or len(data_list) <= 1:
-            print(f"    📊 Data length {len(data_list)} <= 1, skipping deduplication check")
+            self.log(f"    📊 Data length {len(data_list)} <= 1, skipping deduplication check")
             return data_list
 
-        print(f"    📊 Original data length: {len(data_list)}")
+        self.log(f"    📊 Original data length: {len(data_list)}")
 
         category_text_pairs = {}
         for i, item in enumerate(data_list):
@@ -402,18 +828,18 @@ class OutputCleaner:
                 category, text = pair_key
                 positions_to_remove = positions[1:]
                 duplicates_to_remove.update(positions_to_remove)
-                print(f"    🔍 Found duplicate category-text pair: category='{category}', first 50 chars of text='{text[:50]}...'")
-                print(f"        Count: {len(positions)}, removing at positions: {positions_to_remove}")
+                self.log(f"    🔍 Found duplicate category-text pair: category='{category}', first 50 chars of text='{text[:50]}...'")
+                self.log(f"        Count: {len(positions)}, removing at positions: {positions_to_remove}")
 
         for bbox_key, positions in bbox_pairs.items():
             if len(positions) >= 2:
                 positions_to_remove = positions[1:]
                 duplicates_to_remove.update(positions_to_remove)
-                print(f"    🔍 Found duplicate bbox: {list(bbox_key)}")
-                print(f"        Count: {len(positions)}, removing at positions: {positions_to_remove}")
+                self.log(f"    🔍 Found duplicate bbox: {list(bbox_key)}")
+                self.log(f"        Count: {len(positions)}, removing at positions: {positions_to_remove}")
 
         if not duplicates_to_remove:
-            print(f"    ✅ No category-text pairs or bboxes found exceeding the duplication threshold")
+            self.log(f"    ✅ No category-text pairs or bboxes found exceeding the duplication threshold")
             return data_list
 
         cleaned_data = []
@@ -424,8 +850,8 @@ class OutputCleaner:
             else:
                 removed_count += 1
 
-        print(f"    ✅ Deduplication complete: Removed {removed_count} duplicate items")
-        print(f"    📊 Cleaned data length: {len(cleaned_data)}")
+        self.log(f"    ✅ Deduplication complete: Removed {removed_count} duplicate items")
+        self.log(f"    📊 Cleaned data length: {len(cleaned_data)}")
         return cleaned_data
 
     def clean_model_output(self, model_output):
@@ -441,5 +867,318 @@ class OutputCleaner:
                 result.cleaned_data = deduplicated_data
             return result.cleaned_data
         except Exception as e:
-            print(f"❌ Case cleaning failed: {e}")
+            self.log(f"❌ Case cleaning failed: {e}")
             return model_output
+
+
+class StreamingLayoutParser:
+    """
+    Incremental parser for the streamed DotsOCR layout output
+
+    Feed the response chunks as they arrive; every layout object is parsed
+    as soon as its closing brace is seen and passed to ``on_block``. The scan
+    is a single forward pass that jumps between structural characters and
+    only keeps the object currently being read, so its cost is linear in the
+    output length. ``finish`` returns the same cleaned blocks as
+    ``OutputCleaner.clean_model_output`` on the full response:
+
+    - objects are separated by braces, so missing commas need no fixing;
+    - exact duplicate objects are dropped;
+    - an object that is not valid JSON is dropped;
+    - an object interrupted by the next ``{"bbox":`` is dropped;
+    - if the output is longer than 50,000 characters or does not end with
+      ``]`` and contains more than one object, the last object is dropped, so
+      an already emitted block can still be removed by ``finish``;
+    - a lone incomplete object is salvaged, and category/text and bbox
+      duplicates are removed, with the OutputCleaner methods.
+
+    Unlike OutputCleaner, brace pairs inside the text (LaTeX such as
+    ``\\frac{a}{b}``) are left untouched and objects containing braces are
+    kept when duplicates are removed.
+    """
+
+    BBOX_MARKER = '{"bbox":'
+    TRUNCATE_LENGTH = 50000
+    SCAN_INTERVAL = 256  # Characters buffered before scanning without a closing brace
+
+    _STRUCTURAL = re.compile(r'[{}"]')
+    _STRING_SPECIAL = re.compile(r'["\\]')
+
+    def __init__(self, cleaner: Optional[OutputCleaner] = None,
+                 on_block: Optional[Callable[[Dict], None]] = None,
+                 on_duplicate: Optional[Callable[[], None]] = None):
+        """
+        Args:
+            cleaner: OutputCleaner used for logging and the final deduplication
+            on_block: Called with each layout block as soon as it is complete
+            on_duplicate: Called for each complete object that exactly repeats
+                an earlier one (and is dropped)
+        """
+        self.cleaner = cleaner or OutputCleaner()
+        self.on_block = on_block
+        self.on_duplicate = on_duplicate
+        self.reset()
+
+    def reset(self):
+        """Forget everything fed so far, e.g. when a request is restarted"""
+        self._chunks: List[str] = []
+        self._pending: List[str] = []  # Chunks fed since the last scan
+        self._pending_length = 0
+        self._buffer = ''           # Text from the open object (or scan position) on
+        self._base = 0              # Absolute offset of _buffer[0]
+        self._pos = 0               # Absolute offset of the next character to scan
+        self._marker_from = 0       # Absolute offset to count markers from
+        self._depth = 0
+        self._in_string = False
+        self._object_start = 0
+        self._seen = set()
+        self._blocks: List[Tuple[int, Dict]] = []  # (absolute start, block)
+        self.length = 0
+        self.marker_count = 0
+        self.last_marker = -1
+        self.duplicates = 0
+        self.malformed = 0
+        self.complete = False  # Set by finish: whether the output was closed with ']'
+
+    @property
+    def blocks(self) -> List[Dict]:
+        """Blocks completed so far"""
+        return [block for _, block in self._blocks]
+
+    def feed(self, chunk: str):
+        """Consume the next chunk of the response"""
+        if not chunk:
+            return
+        self._chunks.append(chunk)
+        self._pending.append(chunk)
+        self.length += len(chunk)
+        self._pending_length += len(chunk)
+        # Objects can only complete at a closing brace; other chunks are
+        # batched to keep the per-chunk cost low
+        if '}' in chunk or self._pending_length >= self.SCAN_INTERVAL:
+            self._scan(final=False)
+
+    def _scan(self, final: bool):
+        if self._pending:
+            self._buffer += ''.join(self._pending)
+            self._pending = []
+            self._pending_length = 0
+            self._count_markers()
+
+        buffer, base = self._buffer, self._base
+        end = len(buffer)
+        marker_length = len(self.BBOX_MARKER)
+        i = self._pos - base
+
+        while i < end:
+            if self._in_string:
+                match = self._STRING_SPECIAL.search(buffer, i)
+                if match is None:
+                    # A trailing '{' may be the start of a new object
+                    i = end - 1 if buffer.endswith('{') and not final else end
+                    break
+                j = match.start()
+                if buffer[j] == '\\':
+                    if j + 1 >= end and not final:
+                        i = j  # Wait for the escaped character
+                        break
+                    i = j + 2
+                    continue
+                if buffer[j - 1] == '{' and j - 1 >= i:
+                    if end - (j - 1) < marker_length and not final:
+                        i = j - 1  # Not known yet whether a new object starts here
+                        break
+                    if buffer.startswith(self.BBOX_MARKER, j - 1):
+                        # A new object starts inside what looks like a string:
+                        # the current object is broken (e.g. an unescaped quote)
+                        self._abandon_object()
+                        i = j - 1
+                        continue
+                self._in_string = False
+                i = j + 1
+                continue
+
+            match = self._STRUCTURAL.search(buffer, i)
+            if match is None:
+                i = end
+                break
+            j = match.start()
+            char = buffer[j]
+            if char == '{':
+                if end - j < marker_length and not final:
+                    i = j  # Not known yet whether this is a new object
+                    break
+                if self._depth > 0 and buffer.startswith(self.BBOX_MARKER, j):
+                    self._abandon_object()
+                if self._depth == 0:
+                    self._object_start = base + j
+                self._depth += 1
+            elif char == '}':
+                if self._depth > 0:
+                    self._depth -= 1
+                    if self._depth == 0:
+                        self._close_object(buffer[self._object_start - base:j + 1])
+            else:
+                self._in_string = True
+            i = j + 1
+
+        self._pos = base + i
+        # Only the open object and a possibly incomplete marker are needed
+        keep_from = min(self._object_start - base, i) if self._depth > 0 else i
+        keep_from = min(keep_from, self._marker_from - base)
+        if keep_from > 0:
+            self._buffer = buffer[keep_from:]
+            self._base = base + keep_from
+
+    def _count_markers(self):
+        # Markers are counted over the whole output, as OutputCleaner does;
+        # the first characters of the new text may complete a marker
+        buffer, base = self._buffer, self._base
+        start = self._marker_from - base
+        while True:
+            index = buffer.find(self.BBOX_MARKER, start)
+            if index < 0:
+                break
+            self.marker_count += 1
+            self.last_marker = base + index
+            start = index + 1
+        self._marker_from = base + max(start, len(buffer) - len(self.BBOX_MARKER) + 1)
+
+    def _abandon_object(self):
+        if self._depth > 0:
+            self.malformed += 1
+        self._depth = 0
+        self._in_string = False
+
+    def _close_object(self, raw: str):
+        if raw in self._seen:
+            self.duplicates += 1
+            if self.on_duplicate:
+                self.on_duplicate()
+            return
+        self._seen.add(raw)
+        try:
+            block = json.loads(raw)
+        except json.JSONDecodeError:
+            self.malformed += 1
+            return
+        self._blocks.append((self._object_start, block))
+        if self.on_block:
+            self.on_block(block)
+
+    def finish(self) -> List[Dict]:
+        """
+        Complete the parse at the end of the response
+
+        Returns:
+            Cleaned layout blocks (empty if nothing could be recovered)
+        """
+        self._scan(final=True)
+        log = self.cleaner.log
+        log(f"🔧 Parsed streamed output: {self.length:,} characters, {len(self._blocks)} objects")
+
+        last_char = next((chunk.rstrip()[-1] for chunk in reversed(self._chunks) if chunk.strip()), '')
+        self.complete = last_char == ']'
+        blocks = self._blocks
+        text_end = self.length
+        needs_truncation = self.length > self.TRUNCATE_LENGTH or last_char != ']'
+        if needs_truncation and self.marker_count > 1 and self.last_marker > 0:
+            blocks = [(start, block) for start, block in blocks if start < self.last_marker]
+            text_end = self.last_marker
+            log(f"    ✂️ Truncated the last element at {self.last_marker:,}")
+        elif self._depth > 0:
+            self.malformed += 1
+        if self.duplicates:
+            log(f"    ✅ Removed {self.duplicates} duplicate dicts")
+        if self.malformed:
+            log(f"    ⚠️ Dropped {self.malformed} incomplete or invalid objects")
+
+        result = [block for _, block in blocks]
+        if not result:
+            text = self.cleaner._ensure_json_format(''.join(self._chunks)[:text_end])
+            result = self.cleaner._handle_single_incomplete_dict(text) or []
+        if result:
+            result = self.cleaner.remove_duplicate_category_text_pairs_and_bbox(result, case_id=0)
+        return result
+
+
+class RepetitionDetector:
+    """
+    Detects a degenerate repetition loop while a layout output is streamed
+
+    The model sometimes repeats the same block or bbox until it reaches
+    ``max_new_tokens``; the repeats are removed by the cleaning afterwards.
+    Two patterns are recognized:
+
+    - ``max_repeats`` consecutive complete objects that the cleaning would
+      discard or that repeat an earlier bbox or category/text pair;
+    - a single object growing past ``runaway_chars`` whose latest text is
+      one short unit repeated over and over.
+
+    Connect ``block``/``duplicate`` to the parser's ``on_block``/``on_duplicate``
+    and pass every chunk to ``feed``; ``looping`` tells when to stop.
+    """
+
+    def __init__(self, max_repeats: int = 10, runaway_chars: int = 8000,
+                 tail_chars: int = 3000, max_period: int = 300):
+        """
+        Args:
+            max_repeats: Consecutive repeated objects that make a loop
+            runaway_chars: Size an unfinished object must reach before its
+                text is checked for a loop
+            tail_chars: Length of the latest text that must be periodic
+            max_period: Longest repeated unit that is looked for
+        """
+        self.max_repeats = max_repeats
+        self.runaway_chars = runaway_chars
+        self.tail_chars = tail_chars
+        self.max_period = max_period
+        self.looping = False
+        self.reason = ''
+        self._bboxes = set()
+        self._pairs = set()
+        self._consecutive = 0
+        self._tail = ''
+        self._since_object = 0
+        self._next_check = runaway_chars
+
+    def block(self, block: Dict):
+        """Record a complete block"""
+        repeated = False
+        if isinstance(block, dict):
+            bbox = block.get('bbox')
+            if isinstance(bbox, list) and bbox:
+                key = tuple(bbox)
+                repeated = key in self._bboxes
+                self._bboxes.add(key)
+            if block.get('text'):
+                pair = (block.get('category', ''), block['text'])
+                repeated = repeated or pair in self._pairs
+                self._pairs.add(pair)
+        self._object_closed(repeated)
+
+    def duplicate(self):
+        """Record a complete object that exactly repeats an earlier one"""
+        self._object_closed(True)
+
+    def _object_closed(self, repeated: bool):
+        self._since_object = 0
+        self._next_check = self.runaway_chars
+        self._consecutive = self._consecutive + 1 if repeated else 0
+        if self._consecutive >= self.max_repeats and not self.looping:
+            self.looping = True
+            self.reason = f"{self._consecutive} repeated blocks in a row"
+
+    def feed(self, chunk: str):
+        """Record streamed text; checks the object being generated for a loop"""
+        self._tail = (self._tail + chunk)[-self.tail_chars:]
+        self._since_object += len(chunk)
+        if self._since_object < self._next_check or self.looping:
+            return
+        self._next_check = self._since_object + self.tail_chars // 4
+        tail = self._tail
+        for period in range(1, self.max_period + 1):
+            if tail[period:] == tail[:-period]:
+                self.looping = True
+                self.reason = f"text repeating every {period} characters"
+                return
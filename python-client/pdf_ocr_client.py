@@ -6,44 +6,197 @@ This script processes PDF files using OCR API and exports results to markdown fo
 
 Features:
 1. Converts PDF pages to images with dimensions that are multiples of 28
-2. Recognizes each page sequentially using OCR API
-3. Maintains a .ocr_progress.json file next to the PDF (compatible with web version)
+2. Recognizes each page using OCR API, rendering and encoding later pages
+   in background threads while the current page is being recognized, with
+   optionally several pages in flight at once
+3. Maintains a .ocr_progress.json file next to the PDF (compatible with web version),
+   appending each recognized page to a journal that is compacted into it
 4. Exports markdown with extracted images to output folder
 
 Usage:
-    python pdf_ocr_client.py <pdf_path> <output_folder> [--api-base <url>] [--resume]
+    python pdf_ocr_client.py <pdf_path> <output_folder> [--api-base <url>] [--prefetch <n>]
+                            [--concurrency <n>] [--expensive-first] [--image-encoding <mode>]
 """
 
 import os
 import sys
 import json
+import math
 import re
 import argparse
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Executor, Future, ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
 from pathlib import Path
-from typing import List, Dict, Optional, Tuple
-import requests
+from typing import Callable, Iterator, List, Dict, Optional, TextIO, Tuple, Union
 from PIL import Image
 import fitz  # PyMuPDF
 
 # Import utility functions
-from ocr_utils import smart_resize, PILimage_to_base64, fitz_doc_to_image, OutputCleaner
+from ocr_cache import DEFAULT_CACHE_PATH, PageCache
+from ocr_progress import ProgressStore
+from ocr_raster import create_render_pool, rasterize_page
+from ocr_text_layer import TextLayerPage, read_text_layer
+from ocr_backend import EndpointPool, OCRRequestError, OCRTransport, as_endpoint_pool
+from ocr_utils import (encode_image_data_url, parse_image_encoding, IMAGE_ENCODINGS,
+                       fitz_page_target_size, fitz_page_to_target_image, fitz_clip_to_image,
+                       estimate_page_complexity, fitz_page_tiles, fitz_clip_tile, merge_tile_blocks,
+                       screen_page_image, image_difference_fraction, image_data_url,
+                       OutputCleaner, StreamingLayoutParser, RepetitionDetector)
+
+
+# Marks the end of a pipeline queue
+_END_OF_PAGES = None
+
+# Hash bits two page images may differ in to be compared as possible duplicates
+DUPLICATE_HASH_BITS = 12
+
+# Superscript digits that prefix footnotes in OCR output
+FOOTNOTE_CHARS = '⁰¹²³⁴⁵⁶⁷⁸⁹'
+
+
+@dataclass
+class PreparedPage:
+    """A page that went through the render/encode stages of the pipeline"""
+    page_num: int
+    image_size: Tuple[int, int]
+    target_size: Tuple[int, int]
+    image: Optional[Image.Image] = None
+    image_base64: Optional[str] = None
+    error: Optional[str] = None
+    tiles: int = 0  # Bands to recognize the page in instead of as a whole (0: whole page)
+    text_layer: Optional[TextLayerPage] = None  # Set when the page is read from its text layer
 
 
 class PDFOCRClient:
     """PDF OCR Client that mimics pdfocr.js functionality"""
 
-    def __init__(self, pdf_path: str, output_folder: str, api_base: str = "http://localhost:5123"):
+    def __init__(self, pdf_path: str, output_folder: str,
+                 api_base: Union[str, EndpointPool] = "http://localhost:5123",
+                 prefetch: int = 2, concurrency: int = 1, expensive_first: bool = False,
+                 transport: Optional[OCRTransport] = None, stdout: Optional[TextIO] = None,
+                 stderr: Optional[TextIO] = None,
+                 on_page_result: Optional[Callable[[int, Optional[List[Dict]]], None]] = None,
+                 cache: Optional[PageCache] = None, progress_file: Optional[str] = None,
+                 image_encoding: str = 'png', compress_progress: bool = False,
+                 dump_raw_dir: Optional[str] = None, abort_loops: bool = True,
+                 loop_retry_temperature: Optional[float] = None, tile_mode: str = 'off',
+                 tile_text_chars: int = 6000, max_tiles: int = 4, text_layer: bool = False,
+                 text_layer_ocr: bool = False, skip_blank: bool = True, dedup_pages: bool = True,
+                 duplicate_tolerance: float = 0.00001, render_workers: int = 0,
+                 render_pool: Optional[Executor] = None):
         """
         Initialize PDF OCR Client
 
         Args:
             pdf_path: Path to the PDF file
             output_folder: Path to the output folder for markdown and images
-            api_base: Base URL for the OCR API
+            api_base: Base URL for the OCR API, a comma-separated list of base
+                URLs, or an EndpointPool shared with other clients; ignored
+                when ``transport`` is given
+            prefetch: Number of pages each background stage (render, encode)
+                may prepare ahead of the pages currently being recognized
+            concurrency: Maximum number of OCR requests in flight at once
+            expensive_first: Dispatch the most complex pages first so that the
+                slowest page does not end up last and set the total latency
+            transport: OCR transport (timeouts, retries, connection pool) to
+                send requests with; by default one is created for ``api_base``
+            stdout: Stream for progress output (default: sys.stdout). Giving each
+                client its own stream keeps the logs of concurrent clients apart.
+            stderr: Stream for error tracebacks (default: sys.stderr)
+            on_page_result: Called with (page_num, blocks) as soon as a page is
+                recognized or loaded from progress, and with (page_num, None)
+                when a page fails; may be called from worker threads and in
+                any page order
+            cache: Content-addressed cache of page results, consulted before
+                sending a page to the OCR API
+            progress_file: Where to keep the .ocr_progress.json progress
+                (default: next to the PDF); recognized pages are appended to a
+                journal next to it and compacted into it (see ocr_progress.py)
+            image_encoding: Wire encoding of page images, e.g. 'png', 'png:1',
+                'gray', 'bilevel', 'webp' or 'jpeg:90' (see ocr_utils.IMAGE_ENCODINGS)
+            compress_progress: gzip the progress file (the default file name
+                then ends in .ocr_progress.json.gz)
+            dump_raw_dir: Save every raw OCR response to this directory, e.g. to
+                build a corpus for compare_output_parsers.py
+            abort_loops: Stop a response as soon as the model is caught in a
+                repetition loop, keeping the blocks parsed so far
+            loop_retry_temperature: If set, a page whose response was stopped
+                in a loop is requested once more with this temperature
+            tile_mode: 'off', 'auto' (recognize dense pages, and pages whose
+                response was cut off at max_new_tokens, in overlapping
+                horizontal bands) or 'always'
+            tile_text_chars: Text-layer characters per band; pages with more
+                are dense
+            max_tiles: Upper bound on the number of bands per page
+            text_layer: Read pages with a trustworthy text layer (born-digital
+                PDFs) directly instead of sending them to the OCR model, see
+                ocr_text_layer.py
+            text_layer_ocr: Recognize the formula and table regions of pages
+                read from the text layer with the OCR model
+            skip_blank: Store an empty result for blank pages instead of
+                sending them to the OCR model
+            dedup_pages: Reuse the result of an earlier page of the document
+                for a page that renders (nearly) identically
+            duplicate_tolerance: Fraction of pixels that may differ between
+                duplicate pages
+            render_workers: Render and encode pages in this many worker
+                processes (see ocr_raster.py); 0 renders them in a thread of
+                this process
+            render_pool: Render pool from ocr_raster.create_render_pool shared
+                with other clients; ``render_workers`` should then be its size
         """
         self.pdf_path = Path(pdf_path)
         self.output_folder = Path(output_folder)
-        self.api_base = api_base.rstrip('/')
+        self.stdout = stdout
+        self.stderr = stderr
+        self.on_page_result = on_page_result
+        parse_image_encoding(image_encoding)  # Fail early on a typo
+        self.image_encoding = image_encoding
+        self.dump_raw_dir = Path(dump_raw_dir) if dump_raw_dir else None
+        if self.dump_raw_dir:
+            self.dump_raw_dir.mkdir(parents=True, exist_ok=True)
+        # Threads encoding and saving extracted images
+        self.image_workers = min(8, os.cpu_count() or 1)
+        self.cache = cache
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.abort_loops = abort_loops
+        self.loop_retry_temperature = loop_retry_temperature
+        self.loop_aborts = 0
+        self.loop_tokens_saved = 0
+        self.loop_seconds_saved = 0.0
+        if tile_mode not in ('off', 'auto', 'always'):
+            raise ValueError(f"Invalid tile mode: {tile_mode}")
+        self.tile_mode = tile_mode
+        self.tile_text_chars = tile_text_chars
+        self.max_tiles = max(2, max_tiles)
+        self.tiled_pages = 0
+        self.text_layer = text_layer
+        self.text_layer_ocr = text_layer_ocr
+        self.text_layer_pages = 0
+        self.text_layer_regions = 0
+        self.skip_blank = skip_blank
+        self.dedup_pages = dedup_pages
+        self.duplicate_tolerance = duplicate_tolerance
+        self.blank_pages = []
+        # Duplicate page -> the page whose result it reuses
+        self.duplicate_pages = {}
+        # Page -> duplicates waiting for its result
+        self._waiting_duplicates = {}
+        self.prefetch = max(1, prefetch)
+        self.render_pool = render_pool
+        self.render_workers = max(0, render_workers)
+        self.concurrency = max(1, concurrency)
+        if transport is None:
+            transport = OCRTransport(as_endpoint_pool(api_base), pool_maxsize=self.concurrency)
+        self.transport = transport
+        self.backend = transport.pool
+        self.api_base = str(self.backend)
+        self.expensive_first = expensive_first
 
         # Validate inputs
         if not self.pdf_path.exists():
@@ -55,103 +208,211 @@ class PDFOCRClient:
         # Create output folder
         self.output_folder.mkdir(parents=True, exist_ok=True)
 
-        # Progress file path (next to the PDF)
-        self.progress_file = self.pdf_path.parent / f"{self.pdf_path}.ocr_progress.json"
+        # Progress file path (next to the PDF unless given)
+        if progress_file is not None:
+            self.progress_file = Path(progress_file)
+        else:
+            suffix = '.gz' if compress_progress else ''
+            self.progress_file = self.pdf_path.parent / f"{self.pdf_path}.ocr_progress.json{suffix}"
+        self.progress = ProgressStore(self.progress_file, self.pdf_path.name, compress=compress_progress)
 
-        # Initialize page results storage
+        # Initialize page results storage, guarded by a lock because pages
+        # may be committed from several OCR worker threads
         self.page_results = {}
+        self.failed_pages = set()
+        self.total_pages = None
+        self._results_lock = threading.Lock()
 
         # Initialize output cleaner
-        self.cleaner = OutputCleaner()
+        self.cleaner = OutputCleaner(log=self.log)
 
-        print(f"📄 PDF: {self.pdf_path.name}")
-        print(f"📁 Output folder: {self.output_folder}")
-        print(f"💾 Progress file: {self.progress_file}")
-        print(f"🌐 API base: {self.api_base}")
+        self.log(f"📄 PDF: {self.pdf_path.name}")
+        self.log(f"📁 Output folder: {self.output_folder}")
+        self.log(f"💾 Progress file: {self.progress_file}")
+        self.log(f"🌐 API base: {self.api_base}")
 
-    def check_api_health(self) -> bool:
-        """Check if the OCR API is available"""
+    def log(self, *args, **kwargs):
+        """Print to this client's output stream"""
+        print(*args, file=self.stdout or sys.stdout, **kwargs)
+
+    def _notify_page(self, page_num: int, result: Optional[List[Dict]]):
+        """Pass a page outcome to the on_page_result callback"""
+        if self.on_page_result is None:
+            return
         try:
-            response = requests.get(f"{self.api_base}/health", timeout=20)
-            if response.status_code == 200:
-                data = response.json()
-                print(f"✅ API is healthy, model loaded: {data.get('model_loaded', False)}")
-                return data.get('model_loaded', False)
-            else:
-                print(f"❌ API health check failed: {response.status_code}")
-                return False
+            self.on_page_result(page_num, result)
         except Exception as e:
-            print(f"❌ Cannot connect to API: {e}")
-            return False
+            self.log(f"⚠️  Page result callback failed for page {page_num}: {e}")
+
+    def check_api_health(self) -> bool:
+        """Check which OCR endpoints are available (model loaded)"""
+        healthy = self.backend.check_health()
+        for status in self.backend.status():
+            mark = '✅' if status['healthy'] else '❌'
+            self.log(f"{mark} {status['url']}: model loaded: {status['model_loaded']}")
+        self.log(f"🌐 {healthy}/{len(self.backend.endpoints)} OCR endpoints healthy")
+        return healthy > 0
 
     def load_progress(self) -> bool:
-        """Load progress from .ocr_progress.json file if it exists"""
-        if not self.progress_file.exists():
-            print("ℹ️  No progress file found, starting fresh")
+        """Load progress from the .ocr_progress.json file and its journal if they exist"""
+        if not self.progress.exists():
+            self.log("ℹ️  No progress file found, starting fresh")
             return False
 
         try:
-            with open(self.progress_file, 'r', encoding='utf-8') as f:
-                progress_data = json.load(f)
-
-            # Validate format
-            if 'filename' not in progress_data or 'pages' not in progress_data:
-                print("⚠️  Invalid progress file format")
-                return False
-
             # Load page results
-            for page_num_str, result in progress_data['pages'].items():
-                page_num = int(page_num_str)
-                self.page_results[page_num] = result
+            self.page_results.update(self.progress.load())
 
-            print(f"✅ Loaded progress: {len(self.page_results)} pages already recognized")
+            self.log(f"✅ Loaded progress: {len(self.page_results)} pages already recognized")
             return True
 
         except Exception as e:
-            print(f"⚠️  Failed to load progress: {e}")
+            self.log(f"⚠️  Failed to load progress: {e}")
             return False
 
+    def progress_snapshot(self) -> Dict:
+        """Return a thread-safe snapshot of the recognition progress"""
+        with self._results_lock:
+            return {
+                'total_pages': self.total_pages,
+                'completed_pages': sorted(self.page_results),
+                'failed_pages': sorted(self.failed_pages),
+            }
+
+    def save_page_progress(self, page_num: int, result: List[Dict]):
+        """Append a recognized page to the progress journal"""
+        try:
+            self.progress.append(page_num, result)
+            self.log(f"💾 Progress saved: {len(self.page_results)} pages")
+        except Exception as e:
+            self.log(f"❌ Failed to save progress: {e}")
+
     def save_progress(self):
-        """Save progress to .ocr_progress.json file"""
+        """Write all results to the .ocr_progress.json file and clear the journal"""
         if not self.page_results:
-            print("⚠️  No results to save")
+            self.log("⚠️  No results to save")
             return
 
-        progress_data = {
-            "filename": self.pdf_path.name,
-            "pages": {str(k): v for k, v in self.page_results.items()}
-        }
-
         try:
-            with open(self.progress_file, 'w', encoding='utf-8') as f:
-                json.dump(progress_data, f, ensure_ascii=False, indent=2)
-            print(f"💾 Progress saved: {len(self.page_results)} pages")
+            self.progress.compact(self.page_results)
+            self.log(f"💾 Progress saved: {len(self.page_results)} pages")
         except Exception as e:
-            print(f"❌ Failed to save progress: {e}")
+            self.log(f"❌ Failed to save progress: {e}")
 
     def convert_page_to_image(self, page) -> Tuple[Image.Image, Tuple[int, int]]:
         """
         Convert a single PDF page to image with dimensions that are multiples of 28
 
+        The render matrix is computed from the page size and the smart_resize
+        constraints up front, so the page is rasterized once, at exactly the
+        size sent to the model, with no resampling afterwards.
+
+        Args:
+            page: fitz page object
+
+        Returns:
+            Tuple of (image, (width, height)); the image already has the target size
+        """
+        target_size = fitz_page_target_size(page, target_dpi=200)
+        image = fitz_page_to_target_image(page, target_size)
+        return image, target_size
+
+    def plan_tiles(self, page, target_size: Tuple[int, int]) -> int:
+        """
+        Decide up front whether a page is recognized in bands
+
+        In 'auto' mode a page is dense when its text layer holds more than
+        ``tile_text_chars`` characters or when max_pixels kept it well below
+        the nominal 200 DPI; scanned pages without a text layer are only
+        split once their response turns out to be cut off.
+
+        Args:
+            page: fitz page object
+            target_size: Size the whole page is sent to the model at
+
+        Returns:
+            Number of bands, or 0 to recognize the whole page
+        """
+        if self.tile_mode == 'off':
+            return 0
+        by_text = math.ceil(len(page.get_text('text')) / self.tile_text_chars)
+        nominal_pixels = (page.rect.width * 200 / 72) * (page.rect.height * 200 / 72)
+        by_pixels = math.floor(nominal_pixels / (target_size[0] * target_size[1]) + 0.2)
+        count = max(by_text, by_pixels, 2 if self.tile_mode == 'always' else 0)
+        return min(self.max_tiles, count) if count >= 2 else 0
+
+    def read_page_text_layer(self, page_num: int, page) -> Optional[PreparedPage]:
+        """
+        Read a page from its text layer if the text layer can be trusted
+
         Args:
+            page_num: Page number
             page: fitz page object
 
         Returns:
-            Tuple of (original_image, (resized_width, resized_height))
+            PreparedPage with the text-layer blocks, or None if the page has
+            to be recognized by the OCR model
         """
-        # Convert page to image
-        image = fitz_doc_to_image(page, target_dpi=200)
+        target_size = fitz_page_target_size(page, target_dpi=200)
+        layer = read_text_layer(page, target_size)
+        if not layer.trusted:
+            self.log(f"  📑 Page {page_num}: text layer not used ({layer.reason})")
+            return None
+        return PreparedPage(page_num, target_size, target_size, text_layer=layer)
 
-        # Calculate resized dimensions (multiples of 28)
-        resized_height, resized_width = smart_resize(
-            image.height,
-            image.width,
-            factor=28,
-            min_pixels=3136,
-            max_pixels=11289600
-        )
+    def recognize_text_layer_page(self, page_num: int, layer: TextLayerPage) -> List[Dict]:
+        """
+        Take the blocks of a page from its text layer
 
-        return image, (resized_width, resized_height)
+        With ``text_layer_ocr`` the formula and table regions of the page are
+        rendered on their own and recognized by the OCR model, and the blocks
+        recognized there replace the text-layer blocks of the region; a
+        region whose recognition fails keeps its text-layer blocks.
+
+        Args:
+            page_num: Page number
+            layer: Text layer of the page from ``read_text_layer``
+
+        Returns:
+            Blocks of the page
+        """
+        with self._results_lock:
+            self.text_layer_pages += 1
+        if not (self.text_layer_ocr and layer.regions):
+            return layer.blocks
+
+        with fitz.open(self.pdf_path) as doc:
+            page = doc[page_num - 1]
+            page_rect = page.rect
+            target_size = fitz_page_target_size(page, target_dpi=200)
+            tiles = [fitz_clip_tile(page, i, region.rect) for i, region in enumerate(layer.regions)]
+        self.log(f"  📑 Page {page_num}: recognizing {len(tiles)} formula/table regions")
+
+        def recognize_region(tile):
+            payload = self._ocr_payload(encode_image_data_url(tile.image, self.image_encoding))
+            tile.image = None
+            blocks, _, _, _ = self._stream_page(page_num, payload)
+            return merge_tile_blocks([tile], [blocks], page_rect, target_size) if blocks else None
+
+        with ThreadPoolExecutor(max_workers=min(len(tiles), self.concurrency)) as executor:
+            region_blocks = list(executor.map(recognize_region, tiles))
+
+        replacements = {}
+        replaced = set()
+        for region, blocks in zip(layer.regions, region_blocks):
+            if blocks:
+                replacements[region.blocks[0]] = blocks
+                replaced.update(region.blocks)
+        with self._results_lock:
+            self.text_layer_regions += len(replacements)
+
+        result = []
+        for i, block in enumerate(layer.blocks):
+            if i in replacements:
+                result.extend(replacements[i])
+            elif i not in replaced:
+                result.append(block)
+        return result
 
     def recognize_page(self, page_num: int, image: Image.Image, target_size: Tuple[int, int]) -> Optional[List[Dict]]:
         """
@@ -165,66 +426,90 @@ class PDFOCRClient:
         Returns:
             List of OCR result blocks or None if failed
         """
-        print(f"\n🔍 Recognizing page {page_num}...")
+        return self.recognize_encoded_page(page_num, self.encode_page(image, target_size))
 
-        try:
-            # Resize image to target size
-            resized_image = image.resize(target_size)
+    def encode_page(self, image: Image.Image, target_size: Tuple[int, int]) -> str:
+        """
+        Resize a page image to the target size and encode it for the OCR API
 
-            # Convert to base64
-            image_base64 = PILimage_to_base64(resized_image, format='PNG')
+        Args:
+            image: PIL Image object
+            target_size: Target (width, height) for resizing
 
-            # Prepare API request
-            payload = {
-                "image": image_base64,
-                "prompt_type": "prompt_layout_all_en",
-                "temperature": 0.1,
-                "top_p": 1.0,
-                "max_new_tokens": 12000,
-                "stream": True
-            }
+        Returns:
+            Base64 data URL of the resized image
+        """
+        if image.size != target_size:
+            image = image.resize(target_size)
+        return encode_image_data_url(image, self.image_encoding)
 
-            # Call OCR API with streaming
-            response = requests.post(
-                f"{self.api_base}/ocr",
-                json=payload,
-                stream=True,
-                timeout=300
-            )
+    def recognize_encoded_page(self, page_num: int, image_base64: str, tiles: int = 0) -> Optional[List[Dict]]:
+        """
+        Recognize a single page that is already encoded for the OCR API
 
-            if response.status_code != 200:
-                print(f"❌ API request failed: {response.status_code}")
-                return None
+        Args:
+            page_num: Page number
+            image_base64: Base64 data URL of the page image
+            tiles: Recognize the page in this many bands instead of as a whole
+                (see ``plan_tiles``)
 
-            # Collect streaming response and print in real-time
-            full_response = ""
-            print(f"  📡 Streaming response:")
-            print("  " + "="*60)
-            for line in response.iter_lines():
-                if line:
-                    try:
-                        data = json.loads(line.decode('utf-8'))
-                        if 'response' in data:
-                            chunk = data['response']
-                            full_response += chunk
-                            # Print the actual content as it arrives
-                            print(chunk, end='', flush=True)
-                        if data.get('done', False):
-                            break
-                    except json.JSONDecodeError:
-                        continue
-
-            print(f"\n  " + "="*60)
-            print(f"  Raw response length: {len(full_response)} characters")
-
-            # Clean the response using OutputCleaner
-            cleaned_result = self.cleaner.clean_model_output(full_response)
+        Returns:
+            List of OCR result blocks or None if failed
+        """
+        self.log(f"\n🔍 Recognizing page {page_num}...")
+
+        try:
+            # Prepare API request
+            payload = self._ocr_payload(image_base64)
+
+            cache_key = None
+            if self.cache is not None:
+                cache_key = PageCache.make_key(image_base64, {k: v for k, v in payload.items()
+                                                              if k not in ('image', 'stream')})
+                cached_result = self.cache.get(cache_key)
+                with self._results_lock:
+                    if cached_result is not None:
+                        self.cache_hits += 1
+                    else:
+                        self.cache_misses += 1
+                if cached_result is not None:
+                    self.log(f"  ♻️  Page {page_num}: {len(cached_result)} blocks from cache")
+                    return cached_result
+
+            if tiles:
+                tiled_result, complete = self.recognize_page_tiles(page_num, tiles)
+                if tiled_result is not None:
+                    if cache_key is not None and tiled_result and complete:
+                        self.cache.put(cache_key, tiled_result)
+                    return tiled_result
+                self.log(f"  ⚠️  Page {page_num}: tiled recognition failed, recognizing the whole page")
+
+            cleaned_result, full_response, looped, cut_off = self._stream_page(page_num, payload)
+            if cut_off and self.tile_mode != 'off' and not tiles:
+                # The tail of the page was lost at max_new_tokens
+                self.log(f"  ✂️  Page {page_num}: response cut off at the token limit, recognizing it in bands")
+                tiled_result, complete = self.recognize_page_tiles(page_num, 2)
+                if tiled_result is not None and len(tiled_result) >= len(cleaned_result or []):
+                    cleaned_result, looped, cut_off = tiled_result, False, not complete
+            if looped and self.loop_retry_temperature is not None:
+                retry_payload = dict(payload, temperature=self.loop_retry_temperature)
+                self.log(f"  🔁 Page {page_num}: retrying with temperature {self.loop_retry_temperature}")
+                retry_result, retry_response, retry_looped, retry_cut_off = self._stream_page(page_num, retry_payload)
+                if retry_result is not None and (not retry_looped or len(retry_result) > len(cleaned_result or [])):
+                    cleaned_result, full_response = retry_result, retry_response
+                    looped, cut_off = retry_looped, retry_cut_off
+            if cleaned_result is None:
+                return None
 
             if cleaned_result and isinstance(cleaned_result, list):
-                print(f"  ✅ Recognized {len(cleaned_result)} blocks")
+                self.log(f"  ✅ Page {page_num}: recognized {len(cleaned_result)} blocks")
+                # A looping or cut-off page is not cached, so that a later run
+                # (e.g. with tiling or loop retry enabled) recognizes it again
+                if cache_key is not None and not looped and not cut_off:
+                    self.cache.put(cache_key, cleaned_result)
                 return cleaned_result
             else:
-                print(f"  ⚠️  Cleaning failed, trying to parse as JSON...")
+                self.log(f"  ⚠️  Cleaning failed, trying to parse as JSON...")
                 # Try to parse directly
                 try:
                     result = json.loads(full_response)
@@ -235,58 +520,597 @@ class PDFOCRClient:
                 return None
 
         except Exception as e:
-            print(f"❌ Recognition failed: {e}")
+            self.log(f"❌ Recognition failed: {e}")
             return None
 
+    @staticmethod
+    def _ocr_payload(image_base64: str) -> Dict:
+        """Build the /ocr request for an encoded page or band image"""
+        return {
+            "image": image_base64,
+            "prompt_type": "prompt_layout_all_en",
+            "temperature": 0.1,
+            "top_p": 1.0,
+            "max_new_tokens": 12000,
+            "stream": True
+        }
+
+    def recognize_page_tiles(self, page_num: int, count: int) -> Tuple[Optional[List[Dict]], bool]:
+        """
+        Recognize a page in overlapping horizontal bands and merge the blocks
+
+        Each band needs a much shorter generation than the whole page, so dense
+        pages are not cut off at max_new_tokens, and up to ``concurrency``
+        bands are recognized at the same time.
+
+        Args:
+            page_num: Page number
+            count: Number of bands
+
+        Returns:
+            Tuple of (blocks in whole-page coordinates or None if a band
+            failed, whether no band looped or was cut off)
+        """
+        with fitz.open(self.pdf_path) as doc:
+            page = doc[page_num - 1]
+            page_rect = page.rect
+            target_size = fitz_page_target_size(page, target_dpi=200)
+            tiles = fitz_page_tiles(page, count)
+        self.log(f"  🧩 Page {page_num}: recognizing {count} bands")
+
+        def recognize_tile(tile):
+            payload = self._ocr_payload(encode_image_data_url(tile.image, self.image_encoding))
+            tile.image = None
+            blocks, _, looped, cut_off = self._stream_page(page_num, payload)
+            if cut_off:
+                self.log(f"  ⚠️  Page {page_num}: band {tile.index + 1}/{count} was cut off as well")
+            return blocks, not looped and not cut_off
+
+        with ThreadPoolExecutor(max_workers=min(count, self.concurrency)) as executor:
+            results = list(executor.map(recognize_tile, tiles))
+        tile_blocks = [blocks for blocks, _ in results]
+        if any(blocks is None for blocks in tile_blocks):
+            return None, False
+
+        merged = merge_tile_blocks(tiles, tile_blocks, page_rect, target_size)
+        with self._results_lock:
+            self.tiled_pages += 1
+        self.log(f"  🧩 Page {page_num}: merged {sum(len(blocks) for blocks in tile_blocks)} band blocks "
+                 f"into {len(merged)}")
+        return merged, all(complete for _, complete in results)
+
+    def _stream_page(self, page_num: int, payload: Dict) -> Tuple[Optional[List[Dict]], str, bool, bool]:
+        """
+        Stream one OCR request and parse the blocks as they arrive
+
+        A repetition loop stops the stream early: the blocks parsed so far
+        are kept and the repeats the model would have produced up to
+        ``max_new_tokens`` are never generated.
+
+        Returns:
+            Tuple of (cleaned blocks or None if the request failed, raw
+            response text, whether a repetition loop was aborted, whether
+            the response was cut off before its end, e.g. at max_new_tokens)
+        """
+        # Collect streaming response and print in real-time. With several
+        # pages in flight the chunks would interleave, so only print them
+        # when pages are recognized one at a time.
+        stream_to_console = self.concurrency == 1
+        if stream_to_console:
+            self.log(f"  📡 Streaming response:")
+            self.log("  " + "="*60)
+
+        # Blocks are parsed as they arrive instead of after the stream ends
+        detector = RepetitionDetector()
+        parser = StreamingLayoutParser(self.cleaner, on_block=detector.block, on_duplicate=detector.duplicate)
+        stream = {'chunks': 0, 'first_chunk': None}
+
+        def on_chunk(chunk):
+            if stream['first_chunk'] is None:
+                stream['first_chunk'] = time.monotonic()
+            stream['chunks'] += 1
+            parser.feed(chunk)
+            detector.feed(chunk)
+            # Print the actual content as it arrives
+            if stream_to_console:
+                self.log(chunk, end='', flush=True)
+            return self.abort_loops and detector.looping
+
+        def on_retry(attempt, error, delay):
+            nonlocal detector, parser
+            detector = RepetitionDetector()
+            parser = StreamingLayoutParser(self.cleaner, on_block=detector.block, on_duplicate=detector.duplicate)
+            stream.update(chunks=0, first_chunk=None)
+            self.log(f"\n  🔁 Page {page_num}: {error}, retry {attempt}/{self.transport.max_retries} in {delay:.1f}s")
+
+        # Call OCR API with streaming; the transport retries on another endpoint if needed
+        try:
+            full_response = self.transport.stream_ocr(payload, on_chunk=on_chunk, on_retry=on_retry)
+        except OCRRequestError as e:
+            self.log(f"❌ API request failed: {e}")
+            return None, '', False, False
+
+        if stream_to_console:
+            self.log(f"\n  " + "="*60)
+        self.log(f"  Page {page_num} raw response length: {len(full_response)} characters")
+        if self.dump_raw_dir:
+            raw_path = self.dump_raw_dir / f"{self.pdf_path.stem}_page_{page_num}.txt"
+            raw_path.write_text(full_response, encoding='utf-8')
+
+        looped = self.abort_loops and detector.looping
+        if looped:
+            # Each streamed message carries about one token; the loop would
+            # have continued until max_new_tokens
+            generated = stream['chunks']
+            elapsed = time.monotonic() - stream['first_chunk']
+            tokens_saved = max(0, payload['max_new_tokens'] - generated)
+            seconds_saved = tokens_saved * elapsed / generated if generated else 0.0
+            with self._results_lock:
+                self.loop_aborts += 1
+                self.loop_tokens_saved += tokens_saved
+                self.loop_seconds_saved += seconds_saved
+            self.log(f"  ✂️  Page {page_num}: repetition loop ({detector.reason}) stopped after ~{generated} tokens, "
+                     f"saved ~{tokens_saved} tokens / ~{seconds_saved:.0f}s")
+
+        # Complete the parse (same cleaning rules as OutputCleaner)
+        blocks = parser.finish()
+        cut_off = bool(blocks) and not looped and not parser.complete
+        return blocks, full_response, looped, cut_off
+
+    def _render_stage(self, page_nums: List[int], out_queue: queue.Queue, stop: threading.Event,
+                      pool: Optional[Executor] = None):
+        """
+        Pipeline stage 1: render pages to images in page order
+
+        The document is opened in this thread so that the fitz objects are
+        never shared between threads. With a render pool, the pages are
+        rendered and encoded in its worker processes, which open the
+        document themselves.
+        """
+        doc = None
+        try:
+            doc = fitz.open(self.pdf_path)
+            for item in self._render_pages(doc, page_nums, stop, pool):
+                if not self._put_until_stopped(out_queue, item, stop):
+                    break
+        except Exception as e:
+            self._put_until_stopped(out_queue, e, stop)
+        finally:
+            if doc is not None:
+                doc.close()
+            self._put_until_stopped(out_queue, _END_OF_PAGES, stop)
+
+    def _render_pages(self, doc, page_nums: List[int], stop: threading.Event,
+                      pool: Optional[Executor]) -> Iterator[PreparedPage]:
+        """
+        Yield the pages that need an OCR request, in page order
+
+        Pages read from the text layer are yielded as they are; blank and
+        duplicate pages are committed here and not yielded. With a pool, up
+        to ``render_workers + prefetch`` pages are rasterized at a time and
+        arrive with their image already encoded.
+        """
+        screened = []
+        in_flight = deque()  # (page number, tiles, future) of pages rasterized in the pool
+        window = self.render_workers + self.prefetch
+        try:
+            for page_num in page_nums:
+                if stop.is_set():
+                    return
+                item = None
+                try:
+                    page = doc[page_num - 1]  # fitz uses 0-based indexing
+                    item = self.read_page_text_layer(page_num, page) if self.text_layer else None
+                    if item is None and pool is not None:
+                        target_size = fitz_page_target_size(page, target_dpi=200)
+                        future = pool.submit(rasterize_page, str(self.pdf_path), page_num, target_size,
+                                             self.image_encoding, self.skip_blank, self.dedup_pages)
+                        in_flight.append((page_num, self.plan_tiles(page, target_size), future))
+                    elif item is None:
+                        image, target_size = self.convert_page_to_image(page)
+                        blank, page_hash = screen_page_image(image, self.skip_blank, self.dedup_pages)
+                        if not self._screen_page(doc, page_num, target_size, screened, blank, page_hash, image):
+                            item = PreparedPage(page_num, (image.width, image.height), target_size, image=image,
+                                                tiles=self.plan_tiles(page, target_size))
+                except Exception as e:
+                    item = PreparedPage(page_num, (0, 0), (0, 0), error=f"render failed: {e}")
+                if item is not None:
+                    yield item
+
+                while in_flight and (len(in_flight) > window or in_flight[0][2].done()):
+                    item = self._collect_rasterized(doc, *in_flight.popleft(), screened)
+                    if item is not None:
+                        yield item
+            while in_flight and not stop.is_set():
+                item = self._collect_rasterized(doc, *in_flight.popleft(), screened)
+                if item is not None:
+                    yield item
+        finally:
+            for _, _, future in in_flight:
+                future.cancel()
+
+    def _collect_rasterized(self, doc, page_num: int, tiles: int, future: Future,
+                            screened: List[Tuple[int, Tuple[int, int], int]]) -> Optional[PreparedPage]:
+        """Wait for a page rasterized in the render pool and screen it like a page rendered here"""
+        try:
+            raster = future.result()
+            if self._screen_page(doc, page_num, raster.target_size, screened, raster.blank, raster.page_hash):
+                return None
+            return PreparedPage(page_num, raster.target_size, raster.target_size,
+                                image_base64=image_data_url(raster.mime, raster.data), tiles=tiles)
+        except Exception as e:
+            return PreparedPage(page_num, (0, 0), (0, 0), error=f"render failed: {e}")
+
+    def _encode_stage(self, in_queue: queue.Queue, out_queue: queue.Queue, stop: threading.Event):
+        """Pipeline stage 2: resize and base64-encode rendered pages"""
+        while not stop.is_set():
+            try:
+                item = in_queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            if isinstance(item, PreparedPage) and item.error is None and item.image is not None:
+                try:
+                    item.image_base64 = self.encode_page(item.image, item.target_size)
+                except Exception as e:
+                    item.error = f"encode failed: {e}"
+                item.image = None  # Release the full-size raster early
+            if not self._put_until_stopped(out_queue, item, stop) or item is _END_OF_PAGES:
+                break
+
+    @staticmethod
+    def _put_until_stopped(out_queue: queue.Queue, item, stop: threading.Event) -> bool:
+        """Put an item into a bounded queue, giving up once the pipeline is stopped"""
+        while not stop.is_set():
+            try:
+                out_queue.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _recognize_stage(self, in_queue: queue.Queue, total_pages: int, stop: threading.Event,
+                         errors: List[Exception]):
+        """
+        Pipeline stage 3: send encoded pages to the OCR API
+
+        ``concurrency`` of these workers share the encoded queue, which bounds
+        the number of requests in flight. Pages may finish out of order; each
+        result is committed under the results lock and progress is saved with
+        the pages sorted, so the progress file is always consistent.
+        """
+        while not stop.is_set():
+            try:
+                item = in_queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            if item is _END_OF_PAGES:
+                # Let the other workers see the end marker too
+                in_queue.put(item)
+                break
+            if isinstance(item, Exception):
+                errors.append(item)
+                stop.set()
+                break
+
+            page_num = item.page_num
+            if item.error:
+                self.log(f"⚠️  Page {page_num} {item.error}, skipping...")
+                self._fail_page(page_num)
+                continue
+
+            if item.text_layer is not None:
+                self.log(f"  Page {page_num}/{total_pages}: text layer, {len(item.text_layer.blocks)} blocks")
+                result = self.recognize_text_layer_page(page_num, item.text_layer)
+            else:
+                width, height = item.image_size
+                self.log(f"  Page {page_num}/{total_pages}: {width}x{height} -> "
+                         f"{item.target_size[0]}x{item.target_size[1]}")
+
+                # Recognize page
+                result = self.recognize_encoded_page(page_num, item.image_base64, tiles=item.tiles)
+
+            if result:
+                self._commit_page(page_num, result)
+            else:
+                self.log(f"⚠️  Page {page_num} recognition failed, skipping...")
+                self._fail_page(page_num)
+
+    def _commit_page(self, page_num: int, result: List[Dict]):
+        """Store a page result and save progress, also for the duplicates waiting for it"""
+        with self._results_lock:
+            pages = [page_num] + self._waiting_duplicates.pop(page_num, [])
+            for num in pages:
+                self.page_results[num] = result
+                self.failed_pages.discard(num)
+        # Save progress after each page; the journal append is fsync'd, so it
+        # runs outside the results lock (ProgressStore serializes appends)
+        for num in pages:
+            self.save_page_progress(num, result)
+        for num in pages:
+            self._notify_page(num, result)
+
+    def _fail_page(self, page_num: int):
+        """Mark a page failed, along with the duplicates waiting for its result"""
+        with self._results_lock:
+            pages = [page_num] + self._waiting_duplicates.pop(page_num, [])
+            self.failed_pages.update(pages)
+        for num in pages:
+            self._notify_page(num, None)
+
+    def _screen_page(self, doc, page_num: int, target_size: Tuple[int, int],
+                     screened: List[Tuple[int, Tuple[int, int], int]], blank: bool, page_hash: Optional[int],
+                     image: Optional[Image.Image] = None) -> bool:
+        """
+        Pre-pass over a rendered page before it is sent to the OCR model
+
+        A blank page gets an empty result. A page that renders like a page
+        screened before (same size, hashes a few bits apart, and hardly any
+        pixel different) reuses that page's result once it is recognized.
+
+        Args:
+            doc: Open fitz document, to render pages for comparison
+            page_num: Page number
+            target_size: Size the page was rendered at
+            screened: (page number, target size, hash) of the pages screened
+                so far in this run; the page is added to it
+            blank, page_hash: Result of ``screen_page_image`` for the page
+            image: The rendered page, if it was rendered in this process
+
+        Returns:
+            True if the page needs no OCR request
+        """
+        if blank:
+            with self._results_lock:
+                self.blank_pages.append(page_num)
+            self.log(f"  ⬜ Page {page_num}: blank, skipped")
+            self._commit_page(page_num, [])
+            return True
+        if page_hash is None:
+            return False
+
+        candidates = sorted((bin(page_hash ^ other_hash).count('1'), other_num)
+                            for other_num, other_size, other_hash in screened if other_size == target_size)
+        # Comparing renders the earlier page again; the closest two hashes are enough
+        for distance, original in candidates[:2]:
+            if distance > DUPLICATE_HASH_BITS:
+                break
+            if image is None:
+                image = fitz_page_to_target_image(doc[page_num - 1], target_size)
+            original_image = fitz_page_to_target_image(doc[original - 1], target_size)
+            if image_difference_fraction(image, original_image) > self.duplicate_tolerance:
+                continue
+            with self._results_lock:
+                result = self.page_results.get(original)
+                if result is None and original in self.failed_pages:
+                    continue  # Recognize the page itself
+                self.duplicate_pages[page_num] = original
+                if result is None:
+                    self._waiting_duplicates.setdefault(original, []).append(page_num)
+            self.log(f"  🔁 Page {page_num}: duplicate of page {original}, reusing its result")
+            if result is not None:
+                self._commit_page(page_num, result)
+            return True
+
+        screened.append((page_num, target_size, page_hash))
+        return False
+
+    def _order_by_complexity(self, page_nums: List[int]) -> List[int]:
+        """Sort pages so that the most expensive ones are dispatched first"""
+        self.log(f"📐 Estimating complexity of {len(page_nums)} pages...")
+        with fitz.open(self.pdf_path) as doc:
+            costs = {page_num: estimate_page_complexity(doc[page_num - 1]) for page_num in page_nums}
+        return sorted(page_nums, key=lambda page_num: costs[page_num], reverse=True)
+
     def recognize_all_pages(self):
         """
         Recognize all pages in the PDF
 
-        Automatically resumes from existing progress if available
+        Automatically resumes from existing progress if available.
+
+        Pages flow through a three-stage pipeline connected by bounded queues:
+        a render thread and an encode thread prepare up to ``prefetch`` pages
+        each while ``concurrency`` worker threads stream OCR results, so the
+        OCR server is not left idle during rendering and encoding.
         """
         # Automatically load existing progress
         self.load_progress()
 
-        # Open PDF and process pages one by one
-        doc = fitz.open(self.pdf_path)
-        total_pages = doc.page_count
-        print(f"\n📊 Total pages: {total_pages}")
+        with fitz.open(self.pdf_path) as doc:
+            total_pages = doc.page_count
+        self.total_pages = total_pages
+        self.log(f"\n📊 Total pages: {total_pages}")
 
+        pending_pages = []
         for page_num in range(1, total_pages + 1):
             # Skip if already recognized
             if page_num in self.page_results:
-                print(f"\n⏭️  Skipping page {page_num} (already recognized)")
+                self.log(f"\n⏭️  Skipping page {page_num} (already recognized)")
+                self._notify_page(page_num, self.page_results[page_num])
                 continue
+            pending_pages.append(page_num)
+
+        if self.expensive_first and len(pending_pages) > 1:
+            pending_pages = self._order_by_complexity(pending_pages)
+
+        # A render pool of our own lives for this run; a shared one is left running
+        pool = self.render_pool
+        own_pool = None
+        if pool is None and self.render_workers > 0 and pending_pages:
+            pool = own_pool = create_render_pool(self.render_workers)
+            self.log(f"🖨️  Rendering pages in {self.render_workers} worker processes")
+
+        rendered_queue = queue.Queue(maxsize=self.prefetch)
+        encoded_queue = queue.Queue(maxsize=self.prefetch)
+        stop = threading.Event()
+        errors = []
+        stages = [
+            threading.Thread(target=self._render_stage, args=(pending_pages, rendered_queue, stop, pool),
+                             name="ocr-render", daemon=True),
+            threading.Thread(target=self._encode_stage, args=(rendered_queue, encoded_queue, stop),
+                             name="ocr-encode", daemon=True),
+        ]
+        workers = [
+            threading.Thread(target=self._recognize_stage, args=(encoded_queue, total_pages, stop, errors),
+                             name=f"ocr-worker-{i}", daemon=True)
+            for i in range(self.concurrency)
+        ]
+        for thread in stages + workers:
+            thread.start()
 
-            # Convert this page to image
-            page = doc[page_num - 1]  # fitz uses 0-based indexing
-            image, target_size = self.convert_page_to_image(page)
-            print(f"  Page {page_num}/{total_pages}: {image.width}x{image.height} -> {target_size[0]}x{target_size[1]}")
+        try:
+            # Join with a timeout so that KeyboardInterrupt reaches this thread
+            for worker in workers:
+                while worker.is_alive():
+                    worker.join(timeout=0.5)
+            if errors:
+                raise errors[0]
+        finally:
+            stop.set()
+            for stage in stages:
+                stage.join(timeout=5)
+            if own_pool is not None:
+                own_pool.shutdown(wait=True, cancel_futures=True)
+
+        # Fold this run's journal into the progress file, leaving it in the
+        # format the web version loads
+        if self.progress.journal_path.exists():
+            self.save_progress()
 
-            # Recognize page
-            result = self.recognize_page(page_num, image, target_size)
+        self.log(f"\n✅ Recognition complete: {len(self.page_results)} pages")
+        if self.failed_pages:
+            self.log(f"⚠️  Failed pages (rerun to retry them): {sorted(self.failed_pages)}")
+        lookups = self.cache_hits + self.cache_misses
+        if lookups:
+            self.log(f"♻️  Page cache: {self.cache_hits}/{lookups} hits ({self.cache_hits / lookups:.0%})")
+        if self.blank_pages:
+            self.log(f"⬜ Blank pages skipped: {sorted(self.blank_pages)}")
+        if self.duplicate_pages:
+            pairs = ', '.join(f"{page} (= {original})" for page, original in sorted(self.duplicate_pages.items()))
+            self.log(f"🔁 Duplicate pages reused: {pairs}")
+        if self.text_layer_pages:
+            regions = f", {self.text_layer_regions} formula/table regions recognized" if self.text_layer_regions else ""
+            self.log(f"📑 Pages read from the text layer: {self.text_layer_pages}{regions}")
+        if self.tiled_pages:
+            self.log(f"🧩 Pages recognized in bands: {self.tiled_pages}")
+        if self.loop_aborts:
+            self.log(f"✂️  Repetition loops stopped early: {self.loop_aborts}, saved ~{self.loop_tokens_saved} tokens "
+                     f"/ ~{self.loop_seconds_saved:.0f}s of generation")
+
+    def render_page_markdown(self, page_num: int, page_result: List[Dict],
+                             footnote_counter: int = 1) -> Tuple[str, List[Dict], Dict[str, int], int]:
+        """
+        Render the blocks of one page to markdown
 
-            if result:
-                self.page_results[page_num] = result
-                # Save progress after each page
-                self.save_progress()
-            else:
-                print(f"⚠️  Page {page_num} recognition failed, skipping...")
+        Superscript footnote markers in the body text are not replaced here,
+        see ``apply_footnote_references``.
 
-        doc.close()
-        print(f"\n✅ Recognition complete: {len(self.page_results)} pages")
+        Args:
+            page_num: Page number
+            page_result: Cleaned OCR blocks of the page
+            footnote_counter: Number of the first footnote defined on this page
+
+        Returns:
+            Tuple of (markdown, images to extract, footnote map of this page
+            mapping superscript prefix (e.g. '¹²') -> footnote number (e.g. 12),
+            next footnote number)
+        """
+        markdown = ""
+        footnote_map = {}
+        images_to_extract = []
+
+        # Process each block in the page
+        i = 0
+        while i < len(page_result):
+            block = page_result[i]
+
+            # Skip page headers and footers
+            if block.get('category') in ['Page-footer', 'Page-header']:
+                i += 1
+                continue
+
+            # Handle Picture blocks
+            if block.get('category') == 'Picture' or block.get('category') == 'image':
+                bbox = block.get('bbox')
+                if bbox and len(bbox) == 4:
+                    x1, y1, x2, y2 = bbox
+                    image_name = f"{self.pdf_path.stem}_page_{page_num}_{x1}_{x2}_{y1}_{y2}.png"
+
+                    # Store image info for extraction
+                    images_to_extract.append({
+                        'page_num': page_num,
+                        'bbox': bbox,
+                        'filename': image_name
+                    })
+
+                    # Check if next block is Caption
+                    caption = ''
+                    if i + 1 < len(page_result) and page_result[i + 1].get('category') == 'Caption':
+                        caption = page_result[i + 1].get('text', '')
+                        i += 1  # Skip the caption block
+
+                    # Add image reference to markdown
+                    if caption:
+                        markdown += f"![{caption}](./{image_name})\n\n"
+                    else:
+                        markdown += f"![](./{image_name})\n\n"
+
+                i += 1
+                continue
+
+            # Handle Footnote blocks (may contain multiple merged footnotes)
+            if block.get('category') == 'Footnote':
+                text = block.get('text', '').strip()
+                if text:
+                    # Split merged footnotes: e.g. "⁹text1\n¹⁰text2" -> ["⁹text1", "¹⁰text2"]
+                    parts = re.split(f'\n(?=[{FOOTNOTE_CHARS}])', text)
+                    for part in parts:
+                        part = part.strip()
+                        if not part:
+                            continue
+                        # Extract leading superscript digits as prefix
+                        prefix = ''
+                        idx = 0
+                        while idx < len(part) and part[idx] in FOOTNOTE_CHARS:
+                            prefix += part[idx]
+                            idx += 1
+                        if prefix:
+                            footnote_map[prefix] = footnote_counter
+                            part = part[idx:].lstrip()
+                        markdown += f"[^{footnote_counter}]: {part}\n\n"
+                        footnote_counter += 1
+                i += 1
+                continue
+
+            # Handle other text blocks
+            text = block.get('text', '').strip()
+            if text:
+                markdown += text + '\n\n'
+
+            i += 1
+
+        return markdown, images_to_extract, footnote_map, footnote_counter
+
+    @staticmethod
+    def apply_footnote_references(markdown: str, footnote_map: Dict[str, int]) -> str:
+        """Replace superscript prefixes in body text with footnote references"""
+        # Sort by length descending so '¹²' is replaced before '²'.
+        # Use lookaround to ensure the match is not part of a longer superscript sequence.
+        for prefix in sorted(footnote_map.keys(), key=len, reverse=True):
+            fn_num = footnote_map[prefix]
+            pattern = f'(?<![{FOOTNOTE_CHARS}]){re.escape(prefix)}(?![{FOOTNOTE_CHARS}])'
+            markdown = re.sub(pattern, f'[^{fn_num}]', markdown)
+        return markdown
 
     def export_to_markdown(self):
         """Export OCR results to markdown with images"""
         if not self.page_results:
-            print("❌ No results to export")
+            self.log("❌ No results to export")
             return
 
-        print(f"\n📝 Exporting to markdown...")
+        self.log(f"\n📝 Exporting to markdown...")
 
         markdown = ""
         footnote_counter = 1
-        footnote_chars = '⁰¹²³⁴⁵⁶⁷⁸⁹'
         # Maps superscript prefix (e.g. '¹²') -> footnote number (e.g. 12)
         footnote_map = {}
         images_to_extract = []
@@ -300,132 +1124,74 @@ class PDFOCRClient:
             if not page_result or not isinstance(page_result, list):
                 continue
 
-            # Process each block in the page
-            i = 0
-            while i < len(page_result):
-                block = page_result[i]
-
-                # Skip page headers and footers
-                if block.get('category') in ['Page-footer', 'Page-header']:
-                    i += 1
-                    continue
-
-                # Handle Picture blocks
-                if block.get('category') == 'Picture' or block.get('category') == 'image':
-                    bbox = block.get('bbox')
-                    if bbox and len(bbox) == 4:
-                        x1, y1, x2, y2 = bbox
-                        image_name = f"{self.pdf_path.stem}_page_{page_num}_{x1}_{x2}_{y1}_{y2}.png"
-
-                        # Store image info for extraction
-                        images_to_extract.append({
-                            'page_num': page_num,
-                            'bbox': bbox,
-                            'filename': image_name
-                        })
-
-                        # Check if next block is Caption
-                        caption = ''
-                        if i + 1 < len(page_result) and page_result[i + 1].get('category') == 'Caption':
-                            caption = page_result[i + 1].get('text', '')
-                            i += 1  # Skip the caption block
-
-                        # Add image reference to markdown
-                        if caption:
-                            markdown += f"![{caption}](./{image_name})\n\n"
-                        else:
-                            markdown += f"![](./{image_name})\n\n"
-
-                    i += 1
-                    continue
-
-                # Handle Footnote blocks (may contain multiple merged footnotes)
-                if block.get('category') == 'Footnote':
-                    text = block.get('text', '').strip()
-                    if text:
-                        # Split merged footnotes: e.g. "⁹text1\n¹⁰text2" -> ["⁹text1", "¹⁰text2"]
-                        parts = re.split(f'\n(?=[{footnote_chars}])', text)
-                        for part in parts:
-                            part = part.strip()
-                            if not part:
-                                continue
-                            # Extract leading superscript digits as prefix
-                            prefix = ''
-                            idx = 0
-                            while idx < len(part) and part[idx] in footnote_chars:
-                                prefix += part[idx]
-                                idx += 1
-                            if prefix:
-                                footnote_map[prefix] = footnote_counter
-                                part = part[idx:].lstrip()
-                            markdown += f"[^{footnote_counter}]: {part}\n\n"
-                            footnote_counter += 1
-                    i += 1
-                    continue
-
-                # Handle other text blocks
-                text = block.get('text', '').strip()
-                if text:
-                    markdown += text + '\n\n'
+            page_markdown, page_images, page_footnotes, footnote_counter = self.render_page_markdown(
+                page_num, page_result, footnote_counter)
+            markdown += page_markdown
+            images_to_extract.extend(page_images)
+            footnote_map.update(page_footnotes)
 
-                i += 1
-
-        # Replace superscript prefixes in body text with footnote references.
-        # Sort by length descending so '¹²' is replaced before '²'.
-        # Use lookaround to ensure the match is not part of a longer superscript sequence.
-        for prefix in sorted(footnote_map.keys(), key=len, reverse=True):
-            fn_num = footnote_map[prefix]
-            pattern = f'(?<![{footnote_chars}]){re.escape(prefix)}(?![{footnote_chars}])'
-            markdown = re.sub(pattern, f'[^{fn_num}]', markdown)
+        markdown = self.apply_footnote_references(markdown, footnote_map)
 
         # Save markdown file
         markdown_path = self.output_folder / f"{self.pdf_path.stem}.md"
         with open(markdown_path, 'w', encoding='utf-8') as f:
             f.write(markdown)
-        print(f"✅ Markdown saved: {markdown_path}")
+        self.log(f"✅ Markdown saved: {markdown_path}")
 
         # Extract and save images
         if images_to_extract:
             self.extract_images(images_to_extract)
 
-        print(f"✅ Export complete: {len(images_to_extract)} images extracted")
+        self.log(f"✅ Export complete: {len(images_to_extract)} images extracted")
 
     def extract_images(self, images_info: List[Dict]):
         """
         Extract image regions from PDF pages and save them
 
+        Images are grouped by page and only their regions are rendered, so a
+        page with several figures is not rasterized once per figure. PNG
+        encoding and saving run on a thread pool while the next regions are
+        rendered.
+
         Args:
             images_info: List of dicts with 'page_num', 'bbox', and 'filename'
         """
-        print(f"\n🖼️  Extracting {len(images_info)} images...")
-
-        # Open PDF
-        doc = fitz.open(self.pdf_path)
+        self.log(f"\n🖼️  Extracting {len(images_info)} images...")
 
+        images_by_page = {}
         for img_info in images_info:
-            page_num = img_info['page_num']
-            bbox = img_info['bbox']
-            filename = img_info['filename']
+            images_by_page.setdefault(img_info['page_num'], []).append(img_info)
 
-            try:
-                # Get page
-                page = doc[page_num - 1]  # fitz uses 0-based indexing
+        def save_image(image: Image.Image, filename: str):
+            image.save(self.output_folder / filename)
+            return filename
 
-                # Convert page to image
-                page_image = fitz_doc_to_image(page, target_dpi=200)
-
-                # Crop image using bbox
-                x1, y1, x2, y2 = bbox
-                cropped_image = page_image.crop((x1, y1, x2, y2))
-
-                # Save image
-                image_path = self.output_folder / filename
-                cropped_image.save(image_path)
+        # Open PDF
+        doc = fitz.open(self.pdf_path)
 
-                print(f"  ✅ {filename}")
+        with ThreadPoolExecutor(max_workers=self.image_workers) as executor:
+            futures = {}
+            for page_num in sorted(images_by_page):
+                page = doc[page_num - 1]  # fitz uses 0-based indexing
+                # Bboxes are in the coordinates of the image sent to the model
+                target_size = fitz_page_target_size(page, target_dpi=200)
 
-            except Exception as e:
-                print(f"  ❌ Failed to extract {filename}: {e}")
+                for img_info in images_by_page[page_num]:
+                    filename = img_info['filename']
+                    try:
+                        # Render only the bbox region of the page
+                        cropped_image = fitz_clip_to_image(page, img_info['bbox'], target_size)
+                        futures[executor.submit(save_image, cropped_image, filename)] = filename
+                    except Exception as e:
+                        self.log(f"  ❌ Failed to extract {filename}: {e}")
+
+            for future in as_completed(futures):
+                filename = futures[future]
+                try:
+                    future.result()
+                    self.log(f"  ✅ {filename}")
+                except Exception as e:
+                    self.log(f"  ❌ Failed to extract {filename}: {e}")
 
         doc.close()
 
@@ -441,9 +1207,9 @@ class PDFOCRClient:
         """
         try:
             # Check API health
-            # if not self.check_api_health():
-            #     print("❌ API is not available, please start the OCR server first")
-            #     return False
+            if not self.check_api_health():
+                self.log("❌ API is not available, please start the OCR server first")
+                return False
 
             # Recognize all pages
             self.recognize_all_pages()
@@ -451,17 +1217,17 @@ class PDFOCRClient:
             # Export to markdown
             self.export_to_markdown()
 
-            print("\n✅ All done!")
+            self.log("\n✅ All done!")
             return True
 
         except KeyboardInterrupt:
-            print("\n⚠️  Interrupted by user")
+            self.log("\n⚠️  Interrupted by user")
             self.save_progress()
             return False
         except Exception as e:
-            print(f"\n❌ Error: {e}")
+            self.log(f"\n❌ Error: {e}")
             import traceback
-            traceback.print_exc()
+            traceback.print_exc(file=self.stderr or sys.stderr)
             return False
         finally:
             # Clean up
@@ -481,6 +1247,15 @@ Examples:
   # Use custom API endpoint
   python pdf_ocr_client.py document.pdf output/ --api-base http://192.168.1.100:5123
 
+  # Spread pages over two OCR servers
+  python pdf_ocr_client.py document.pdf output/ --api-base http://gpu1:5123,http://gpu2:5123 --concurrency 4
+
+  # Keep 4 pages in flight on a batching server, slowest pages first
+  python pdf_ocr_client.py document.pdf output/ --concurrency 4 --expensive-first
+
+  # Born-digital PDF: take the text layer, OCR only formulas and tables
+  python pdf_ocr_client.py document.pdf output/ --text-layer --text-layer-ocr
+
 Note: The script automatically resumes from existing .ocr_progress.json file if found.
         """
     )
@@ -489,12 +1264,87 @@ Note: The script automatically resumes from existing .ocr_progress.json file if
     parser.add_argument('output_folder', help='Path to the output folder')
     default_api_base = os.environ.get('DOTS_OCR_API_BASE', 'http://172.19.193.39:5123')
     parser.add_argument('--api-base', default=default_api_base,
-                        help=f'Base URL for the OCR API (default: {default_api_base})')
+                        help=f'Base URL for the OCR API, or a comma-separated list of base URLs '
+                             f'to spread pages over several servers (default: {default_api_base})')
+    parser.add_argument('--prefetch', type=int, default=2,
+                        help='Pages rendered/encoded ahead of the pages being recognized (default: 2)')
+    parser.add_argument('--concurrency', type=int, default=1,
+                        help='Maximum number of OCR requests in flight at once (default: 1)')
+    parser.add_argument('--expensive-first', action='store_true',
+                        help='Dispatch the most complex pages first')
+    parser.add_argument('--render-workers', type=int, default=0,
+                        help='Render and encode pages in this many worker processes '
+                             '(default: 0, render in a thread of the client process)')
+    parser.add_argument('--connect-timeout', type=float, default=10,
+                        help='Seconds to connect to the OCR API (default: 10)')
+    parser.add_argument('--first-token-timeout', type=float, default=300,
+                        help='Seconds to wait for the first streamed chunk, and between chunks (default: 300)')
+    parser.add_argument('--total-timeout', type=float, default=1800,
+                        help='Seconds allowed for a whole page response (default: 1800)')
+    parser.add_argument('--max-retries', type=int, default=4,
+                        help='Retries per page on connection errors, timeouts and 5xx (default: 4)')
+    parser.add_argument('--image-encoding', default='png',
+                        help=f'Wire encoding of page images: {", ".join(IMAGE_ENCODINGS)}, optionally '
+                             f'with a parameter, e.g. png:1 or jpeg:90 (default: png); '
+                             f'see bench_image_encoding.py to choose one')
+    parser.add_argument('--compress-progress', action='store_true',
+                        help='Keep the progress file gzip-compressed (<pdf>.ocr_progress.json.gz); '
+                             'export it for the web version with ocr_progress.py')
+    parser.add_argument('--dump-raw', metavar='DIR',
+                        help='Save every raw OCR response to DIR (corpus for compare_output_parsers.py)')
+    parser.add_argument('--no-loop-abort', action='store_true',
+                        help='Let responses caught in a repetition loop run until max_new_tokens')
+    parser.add_argument('--loop-retry-temperature', type=float,
+                        help='Request a page stopped in a repetition loop once more with this temperature '
+                             '(e.g. 0.3; default: keep the blocks recognized before the loop)')
+    parser.add_argument('--tile', choices=['off', 'auto', 'always'], default='off',
+                        help='Recognize pages in overlapping horizontal bands: auto splits dense pages and '
+                             'pages whose response is cut off at the token limit (default: off)')
+    parser.add_argument('--tile-text-chars', type=int, default=6000,
+                        help='Text-layer characters per band when splitting dense pages (default: %(default)s)')
+    parser.add_argument('--max-tiles', type=int, default=4,
+                        help='Maximum number of bands per page (default: %(default)s)')
+    parser.add_argument('--text-layer', action='store_true',
+                        help='Read pages with a trustworthy text layer (born-digital PDFs) directly instead of '
+                             'sending them to the OCR model')
+    parser.add_argument('--text-layer-ocr', action='store_true',
+                        help='With --text-layer, recognize the formula and table regions of those pages with '
+                             'the OCR model')
+    parser.add_argument('--no-skip-blank', action='store_true',
+                        help='Send blank pages to the OCR model instead of storing an empty result')
+    parser.add_argument('--no-dedup', action='store_true',
+                        help='Recognize every page even if it renders identically to an earlier page')
+    parser.add_argument('--cache', nargs='?', const=str(DEFAULT_CACHE_PATH), default=None, metavar='PATH',
+                        help=f'Reuse page results across documents from a content-addressed cache '
+                             f'(default path: {DEFAULT_CACHE_PATH})')
+    parser.add_argument('--cache-size-mb', type=int, default=512,
+                        help='Size limit of the page cache in MB (default: 512)')
 
     args = parser.parse_args()
+    try:
+        parse_image_encoding(args.image_encoding)
+    except ValueError as e:
+        parser.error(str(e))
 
     # Create client and run
-    client = PDFOCRClient(args.pdf_path, args.output_folder, args.api_base)
+    transport = OCRTransport(
+        EndpointPool.from_string(args.api_base),
+        connect_timeout=args.connect_timeout,
+        first_token_timeout=args.first_token_timeout,
+        total_timeout=args.total_timeout,
+        max_retries=args.max_retries,
+        pool_maxsize=args.concurrency
+    )
+    cache = PageCache(args.cache, max_bytes=args.cache_size_mb * 1024 * 1024) if args.cache else None
+    client = PDFOCRClient(args.pdf_path, args.output_folder, prefetch=args.prefetch,
+                          concurrency=args.concurrency, expensive_first=args.expensive_first,
+                          transport=transport, cache=cache, image_encoding=args.image_encoding,
+                          compress_progress=args.compress_progress, dump_raw_dir=args.dump_raw,
+                          abort_loops=not args.no_loop_abort, loop_retry_temperature=args.loop_retry_temperature,
+                          tile_mode=args.tile, tile_text_chars=args.tile_text_chars, max_tiles=args.max_tiles,
+                          text_layer=args.text_layer, text_layer_ocr=args.text_layer_ocr,
+                          skip_blank=not args.no_skip_blank, dedup_pages=not args.no_dedup,
+                          render_workers=args.render_workers)
     success = client.run()
 
     sys.exit(0 if success else 1)
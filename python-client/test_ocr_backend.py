@@ -0,0 +1,63 @@
+"""Tests of endpoint routing in ocr_backend"""
+
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from ocr_backend import EndpointPool, OCRRequestError, OCRTransport
+
+
+class _RejectingHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        body = b'{"error": "page too large"}'
+        self.send_response(400)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def rejecting_server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _RejectingHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+    server.server_close()
+
+
+def test_rejected_requests_do_not_drain_the_endpoint(rejecting_server):
+    pool = EndpointPool([rejecting_server], failure_threshold=3)
+    transport = OCRTransport(pool, max_retries=0)
+    for _ in range(5):
+        with pytest.raises(OCRRequestError) as error:
+            transport.stream_ocr({'image': ''})
+        assert not error.value.retryable
+
+    status = pool.status()[0]
+    assert status['healthy']
+    assert status['in_flight'] == 0
+    assert status['failed'] == 0
+    assert status['latency'] is None
+    transport.close()
+
+
+def test_failures_drain_and_successes_record_latency():
+    pool = EndpointPool(['http://a', 'http://b'], failure_threshold=2)
+    a, b = pool.endpoints
+    pool.release(pool.acquire(), success=True, elapsed=2.0)
+    assert a.latency == 2.0 and a.completed == 1
+
+    for _ in range(2):
+        b.in_flight += 1
+        pool.release(b, success=False)
+    assert not b.healthy and b.failed == 2
+
+    a.in_flight += 1
+    pool.release(a, success=False, elapsed=0.01, rejected=True)
+    assert a.healthy and a.failed == 0 and a.in_flight == 0 and a.latency == 2.0
@@ -0,0 +1,46 @@
+"""Tests of the progress journal in ocr_progress"""
+
+import json
+
+from ocr_progress import ProgressStore, read_progress_file
+
+
+def blocks(page_num):
+    return [{'bbox': [0, 0, 10, 10], 'category': 'Text', 'text': f'page {page_num}'}]
+
+
+def test_torn_last_journal_line_is_dropped(tmp_path):
+    store = ProgressStore(tmp_path / 'doc.pdf.ocr_progress.json', 'doc.pdf')
+    store.append(1, blocks(1))
+    store.append(2, blocks(2))
+    with open(store.journal_path, 'ab') as f:
+        f.write(json.dumps({'page': 3, 'blocks': blocks(3)}).encode('utf-8')[:25])
+
+    reloaded = ProgressStore(store.path, 'doc.pdf')
+    assert reloaded.load() == {1: blocks(1), 2: blocks(2)}
+
+    # The torn line is cut off, so the next entry starts on a fresh line
+    reloaded.append(3, blocks(3))
+    assert ProgressStore(store.path, 'doc.pdf').load() == {1: blocks(1), 2: blocks(2), 3: blocks(3)}
+
+
+def test_journal_is_replayed_over_snapshot(tmp_path):
+    store = ProgressStore(tmp_path / 'doc.pdf.ocr_progress.json', 'doc.pdf')
+    store.append(1, blocks(1))
+    store.compact()
+    assert not store.journal_path.exists()
+    store.append(1, blocks(10))
+    store.append(2, blocks(2))
+
+    assert read_progress_file(store.path)['pages'] == {'1': blocks(1)}
+    assert ProgressStore(store.path, 'doc.pdf').load() == {1: blocks(10), 2: blocks(2)}
+
+
+def test_journal_is_compacted_once_larger_than_snapshot(tmp_path):
+    store = ProgressStore(tmp_path / 'doc.pdf.ocr_progress.json', 'doc.pdf', compress=True,
+                          min_compact_bytes=0)
+    for page_num in range(1, 6):
+        store.append(page_num, blocks(page_num))
+
+    assert store.path.read_bytes()[:2] == b'\x1f\x8b'
+    assert ProgressStore(store.path, 'doc.pdf').load() == {n: blocks(n) for n in range(1, 6)}
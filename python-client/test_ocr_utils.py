@@ -0,0 +1,46 @@
+"""Tests of merging the blocks of tiled pages in ocr_utils"""
+
+import fitz
+
+from ocr_utils import PageTile, merge_tile_blocks
+
+
+def text(bbox, content):
+    return {'bbox': bbox, 'category': 'Text', 'text': content}
+
+
+def test_merge_tile_blocks_keeps_one_copy_of_overlapping_blocks():
+    # A 100x200 pt page in two bands overlapping from y=92 to y=108, at one
+    # pixel per point, so band pixels are page points shifted by the band top
+    page_rect = fitz.Rect(0, 0, 100, 200)
+    tiles = [PageTile(0, (0, 0, 100, 108), (0, 100), (100, 108)),
+             PageTile(1, (0, 92, 100, 200), (100, 200), (100, 108))]
+    no_bbox = {'category': 'Text', 'text': 'no bbox'}
+    top_band = [
+        text([10, 10, 90, 30], 'A'),
+        text([10, 94, 40, 104], 'B'),        # whole here, cut by the top edge of the lower band
+        text([44, 101, 56, 106], 'C top'),   # cut by the bottom edge of this band
+        text([60, 97, 90, 103], 'E top'),    # whole in both bands, center in the lower core
+        no_bbox,
+    ]
+    bottom_band = [
+        text([10, 2, 40, 12], 'B bottom'),
+        text([44, 9, 56, 14], 'C'),
+        text([60, 5, 90, 11], 'E'),
+        text([10, 58, 90, 78], 'D'),
+        no_bbox,
+    ]
+
+    merged = merge_tile_blocks(tiles, [top_band, bottom_band], page_rect, (100, 200))
+
+    assert [block['text'] for block in merged] == ['A', 'B', 'no bbox', 'C', 'E', 'D']
+    assert merged[0]['bbox'] == [10, 10, 90, 30]
+    assert merged[3]['bbox'] == [44, 101, 56, 106]
+    assert merged[5]['bbox'] == [10, 150, 90, 170]
+
+
+def test_merge_tile_blocks_scales_to_page_coordinates():
+    page_rect = fitz.Rect(0, 0, 100, 200)
+    tiles = [PageTile(0, (0, 0, 100, 200), (0, 200), (200, 400))]
+    merged = merge_tile_blocks(tiles, [[text([20, 40, 100, 80], 'A')]], page_rect, (50, 100))
+    assert merged == [text([5, 10, 25, 20], 'A')]
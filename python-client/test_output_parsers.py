@@ -0,0 +1,39 @@
+"""StreamingLayoutParser must clean streamed outputs like OutputCleaner"""
+
+import random
+from pathlib import Path
+
+import pytest
+
+from compare_output_parsers import chunked, quiet, with_cleaner_artifacts, without_brace_blocks
+from ocr_utils import OutputCleaner, StreamingLayoutParser
+
+CORPUS_DIR = Path(__file__).parent / 'testdata' / 'ocr_outputs'
+
+# The documented OutputCleaner artifacts (see StreamingLayoutParser): applied to
+# the parser's blocks, they must give the cleaner's result
+CLEANER_ARTIFACTS = {
+    # \frac{a}{b} -> \frac{a},{b}
+    'frac_latex.txt': lambda actual, expected, cleaner: with_cleaner_artifacts(actual, cleaner),
+    # Blocks with braces are lost when duplicates are removed
+    'brace_duplicates.txt': lambda actual, expected, cleaner: without_brace_blocks(actual, expected),
+}
+
+
+@pytest.mark.parametrize('chunk_size', [1, 3, 16, 256, 1 << 20])
+@pytest.mark.parametrize('path', sorted(CORPUS_DIR.iterdir()), ids=lambda path: path.name)
+def test_streaming_parser_matches_cleaner(path, chunk_size):
+    raw = path.read_text(encoding='utf-8')
+    cleaner = OutputCleaner(log=quiet)
+    expected = cleaner.clean_model_output(raw)
+
+    parser = StreamingLayoutParser(OutputCleaner(log=quiet))
+    for chunk in chunked(raw, chunk_size, random.Random(chunk_size)):
+        parser.feed(chunk)
+    actual = parser.finish()
+
+    if path.name not in CLEANER_ARTIFACTS:
+        assert actual == expected
+        return
+    assert actual != expected
+    assert CLEANER_ARTIFACTS[path.name](actual, expected, cleaner) == expected
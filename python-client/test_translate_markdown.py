@@ -0,0 +1,113 @@
+"""translate_markdown 的合并请求、拆分和截断重试测试。"""
+
+import asyncio
+import json
+
+import httpx
+import pytest
+
+from translate_markdown import (
+    RateController,
+    TranslationTruncated,
+    join_translations,
+    pack_blocks,
+    split_block,
+    translate_block_async,
+    translate_splitting,
+    unpack_blocks,
+)
+
+
+def test_pack_and_unpack_round_trip():
+    texts = ["First paragraph.", "- a\n- b", "Third <<not a marker>>"]
+    packed = pack_blocks(texts)
+    assert unpack_blocks(packed, 3) == texts
+    assert unpack_blocks(packed.replace("<<<2>>>", "  <<< 2 >>>"), 3) == texts
+
+
+@pytest.mark.parametrize("result", [
+    "<<<1>>>\n一\n\n二\n\n<<<3>>>\n三",          # 缺少分隔行
+    "<<<1>>>\n一\n\n<<<3>>>\n二\n\n<<<2>>>\n三",  # 顺序错乱
+    "<<<1>>>\n一\n\n<<2>>\n二\n\n<<<3>>>\n三",    # 分隔行被改写
+    "<<<1>>>\n一\n\n<<<2>>>\n\n<<<3>>>\n三",      # 译文为空
+    "译文：\n<<<1>>>\n一\n\n<<<2>>>\n二\n\n<<<3>>>\n三",  # 分隔行前有其他内容
+])
+def test_unpack_rejects_missing_or_garbled_markers(result):
+    assert unpack_blocks(result, 3) is None
+
+
+def test_split_and_join_sentences_and_lines():
+    text = "One sentence here. Another one follows! A third? Yes."
+    parts, sep = split_block(text, 6)
+    assert len(parts) > 1 and sep == " "
+    assert join_translations(parts, sep) == text
+    assert join_translations(["第一句。", "第二句。"], sep) == "第一句。第二句。"
+
+    table = "| a | b |\n| - | - |\n| 1 | 2 |"
+    parts, sep = split_block(table, 4)
+    assert sep == "\n" and join_translations(parts, sep) == table
+
+
+def _sse(content: str, finish_reason: str) -> bytes:
+    chunk = {"choices": [{"delta": {"content": content}, "finish_reason": finish_reason}]}
+    return f"data: {json.dumps(chunk)}\n\ndata: [DONE]\n\n".encode()
+
+
+def test_length_finish_doubles_max_tokens_then_raises():
+    seen = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        seen.append(json.loads(request.content)["max_tokens"])
+        return httpx.Response(200, content=_sse("部分译文", "length"))
+
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            return await translate_block_async(
+                client, "text", "ORIGTEXT", "key", "http://llm/v1", "m",
+                max_tokens=300, max_retries=0, max_tokens_limit=1000)
+
+    with pytest.raises(TranslationTruncated) as error:
+        asyncio.run(run())
+    assert seen == [300, 600, 1000]
+    assert error.value.partial == "部分译文" and error.value.max_tokens == 1000
+
+
+def test_truncated_block_is_split_and_joined():
+    text = "First sentence is here. Second sentence is here. Third sentence is here."
+    requested = []
+
+    async def request(part: str) -> str:
+        requested.append(part)
+        if part == text:
+            raise TranslationTruncated("截断", 100)
+        return f"[{part}]"
+
+    stats: dict[str, int] = {}
+    translation, complete = asyncio.run(translate_splitting(text, request, 1000, stats))
+    assert complete
+    assert requested[0] == text and len(requested) == 1 + stats["parts"]
+    assert translation == " ".join(f"[{part}]" for part in requested[1:])
+    assert stats["split_blocks"] == 1 and "truncated" not in stats
+
+
+def test_unsplittable_truncated_block_keeps_partial():
+    async def request(part: str) -> str:
+        raise TranslationTruncated("截断", 100)
+
+    stats: dict[str, int] = {}
+    assert asyncio.run(translate_splitting("One long sentence", request, 1000, stats)) == ("截断", False)
+    assert stats == {"truncated": 1}
+
+
+def test_rate_controller_halves_on_throttle_and_grows_on_success():
+    async def run():
+        controller = RateController(8)
+        await controller.throttle(None)
+        assert controller.limit == 4
+        await controller.throttle(None)  # 一秒内只减半一次
+        assert controller.limit == 4
+        await controller.acquire(10)
+        await controller.release(True)
+        assert controller.limit == 4.25 and controller.in_flight == 0
+
+    asyncio.run(run())
@@ -0,0 +1,31 @@
+"""translation_memory 的规范化和存取测试。"""
+
+from translation_memory import TranslationMemory, normalize_text
+
+
+def test_nested_and_flat_lists_get_different_keys():
+    nested = "- item\n  - child\n  - child 2"
+    flat = "- item\n- child\n- child 2"
+    assert normalize_text(nested)[0] != normalize_text(flat)[0]
+    assert TranslationMemory.make_key(normalize_text(nested)[0], "m", "p") != \
+        TranslationMemory.make_key(normalize_text(flat)[0], "m", "p")
+
+
+def test_inner_and_trailing_whitespace_are_collapsed():
+    assert normalize_text("a  b\t c \r\n  d   e ")[0] == "a b c\n  d e"
+
+
+def test_hard_line_breaks_are_kept_in_the_key():
+    soft = normalize_text("first line\nsecond line")[0]
+    assert normalize_text("first line   \nsecond line  ")[0] == "first line  \nsecond line"
+    assert normalize_text("first line  \nsecond line")[0] != soft
+    assert normalize_text("first line\\\nsecond line")[0] == "first line\\\nsecond line"
+    assert normalize_text("first line \nsecond line")[0] == soft
+
+
+def test_footnotes_are_renumbered_on_lookup(tmp_path):
+    memory = TranslationMemory(tmp_path / "memory.sqlite")
+    memory.put("See [^3] and [^4].", "见 [^3] 和 [^4]。", "m", "p")
+    assert memory.get("See  [^7] and [^8].", "m", "p") == "见 [^7] 和 [^8]。"
+    assert memory.get("- See [^7] and [^8].", "m", "p") is None
+    memory.close()
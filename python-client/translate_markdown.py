@@ -7,21 +7,59 @@ Markdown翻译脚本 - 使用OpenAI兼容的流式API将Markdown文件翻译为
     python translate_markdown.py input.md -o output.md --alternating
     python translate_markdown.py input.md -o output.md --api-key sk-xxx --model gpt-4
     python translate_markdown.py input.md -o output.md --endpoint https://api.deepseek.com/v1/chat/completions
+    python translate_markdown.py input.md -o output.md --concurrency 16
+    python translate_markdown.py input.md -o output.md --pack-tokens 800
+    python translate_markdown.py input.md -o output.md --no-memory
 """
 
 import argparse
+import asyncio
+import importlib.util
 import json
 import os
+import random
 import re
 import sys
 import time
+from email.utils import parsedate_to_datetime
 from pathlib import Path
+from typing import Awaitable, Callable
 
 import httpx
 
+from translation_memory import DEFAULT_MEMORY_PATH, TranslationMemory
+
+
+# 安装了 h2 包时使用HTTP/2（单连接多路复用）
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+# 值得重试的状态码：限流、服务端错误和网关错误
+RETRYABLE_STATUS = (408, 409, 425, 429, 500, 502, 503, 504)
 
 DEFAULT_PROMPT = "将以下文本翻译为中文，注意只需要输出翻译后的结果，不要额外解释：\n\nORIGTEXT"
 
+# 按原文估计 max_tokens：估计输入token数 × 比例 + 余量，且不少于下限
+OUTPUT_TOKEN_RATIO = 1.5
+OUTPUT_TOKEN_MARGIN = 100
+MIN_OUTPUT_TOKENS = 256
+
+# 句子边界：句末标点（及可选的右引号/括号）之后的空白，或中日文句末标点之后，或HTML表格行之后
+SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?;:][\"')\]])(?=\s)|(?<=[.!?;])(?=\s)|(?<=[。！？；])|(?<=</tr>)")
+CJK_CHAR = re.compile(r"[\u3000-\u9fff\uac00-\ud7af\uff00-\uffef]")
+
+# 合并请求中每个段落前的分隔行，序号从1开始
+PACK_MARKER = "<<<{}>>>"
+PACK_MARKER_PATTERN = re.compile(r"^[ \t]*<<<\s*(\d+)\s*>>>[ \t]*$", re.MULTILINE)
+# 合并请求的系统提示，要求模型原样保留分隔行
+PACK_INSTRUCTION = (
+    "The text to translate consists of several independent segments. Each segment starts with "
+    "a marker line such as <<<1>>>. Translate every segment separately and output each marker "
+    "line unchanged on its own line before its translation, keeping the same order. "
+    "Do not merge, drop or add segments."
+)
+# 一个合并请求最多包含的段落数；段落越多，模型漏掉分隔行的可能越大
+PACK_MAX_BLOCKS = 16
+
 
 def is_skip_block(text: str) -> bool:
     """检测段落是否无需翻译（纯公式块或代码块）。"""
@@ -83,63 +121,597 @@ def parse_blocks(content: str) -> list[str]:
     return blocks
 
 
-def translate_block_streaming(
+def pack_blocks(texts: list[str]) -> str:
+    """将多个段落用分隔行拼接为一个待翻译文本。"""
+    return "\n\n".join(f"{PACK_MARKER.format(i)}\n{text}" for i, text in enumerate(texts, 1))
+
+
+def unpack_blocks(result: str, count: int) -> list[str] | None:
+    """按分隔行拆分合并请求的译文。
+
+    分隔行必须按 1..count 的顺序各出现一次、第一个分隔行之前没有其他内容、
+    且每段译文非空，否则返回 None。
+    """
+    parts = PACK_MARKER_PATTERN.split(result)
+    if parts[0].strip() or len(parts) != 2 * count + 1:
+        return None
+    numbers = parts[1::2]
+    translations = [t.strip() for t in parts[2::2]]
+    if numbers != [str(i) for i in range(1, count + 1)] or not all(translations):
+        return None
+    return translations
+
+
+def pack_groups(texts: list[str], budget: int, max_blocks: int = PACK_MAX_BLOCKS) -> list[list[str]]:
+    """将相邻的短段落按token预算分组，每组合并为一个请求。
+
+    估计token数不超过预算四分之一的段落才参与合并；长段落、本身含分隔行的段落
+    单独成组。
+    """
+    groups: list[list[str]] = []
+    group: list[str] = []
+    used = 0
+    for text in texts:
+        tokens = estimate_tokens(text)
+        if budget <= 0 or tokens > budget // 4 or PACK_MARKER_PATTERN.search(text):
+            if group:
+                groups.append(group)
+                group, used = [], 0
+            groups.append([text])
+            continue
+        if group and (used + tokens > budget or len(group) >= max_blocks):
+            groups.append(group)
+            group, used = [], 0
+        group.append(text)
+        used += tokens
+    if group:
+        groups.append(group)
+    return groups
+
+
+def build_request_body(
     text: str,
     prompt: str,
-    api_key: str,
-    endpoint: str,
     model: str,
     temperature: float | None = None,
     max_tokens: int = 2000,
-) -> str:
-    """调用OpenAI兼容的流式API翻译单个文本块。"""
-    user_content = prompt.replace("ORIGTEXT", text)
-
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {api_key}",
-    }
-
+    system: str | None = None,
+) -> dict:
+    """构建单个文本块的流式chat completion请求体；system 为可选的系统提示。"""
+    messages = [{"role": "user", "content": prompt.replace("ORIGTEXT", text)}]
+    if system:
+        messages.insert(0, {"role": "system", "content": system})
     body: dict = {
         "model": model,
-        "messages": [{"role": "user", "content": user_content}],
+        "messages": messages,
         "max_tokens": max_tokens,
         "stream": True,
     }
     if temperature is not None:
         body["temperature"] = temperature
+    return body
+
+
+def parse_stream_event(line: str) -> tuple[str, str | None] | None:
+    """解析一行SSE数据，返回 (增量内容, finish_reason)；遇到 [DONE] 返回 None。"""
+    line = line.strip()
+    if not line or not line.startswith("data: "):
+        return "", None
+    data = line[6:]  # 去掉 "data: "
+    if data == "[DONE]":
+        return None
+    try:
+        parsed = json.loads(data)
+    except json.JSONDecodeError:
+        return "", None
+    choice = (parsed.get("choices") or [{}])[0]
+    return (choice.get("delta") or {}).get("content", "") or "", choice.get("finish_reason")
+
+
+def parse_stream_line(line: str) -> str | None:
+    """解析一行SSE数据，返回增量内容；遇到 [DONE] 返回 None。"""
+    event = parse_stream_event(line)
+    return None if event is None else event[0]
+
+
+def strip_think(result: str) -> str:
+    """清除 <think>...</think> 标签。"""
+    if re.search(r"<think>[\s\S]*?</think>\s*", result):
+        result = re.sub(r"<think>[\s\S]*?</think>\s*", "", result).strip()
+    return result
 
+
+class TranslationTruncated(RuntimeError):
+    """达到 max_tokens 上限后译文仍被截断；partial 为截断的译文。"""
+
+    def __init__(self, partial: str, max_tokens: int):
+        super().__init__(f"译文在 max_tokens={max_tokens} 处被截断")
+        self.partial = partial
+        self.max_tokens = max_tokens
+
+
+class TranslationAPIError(RuntimeError):
+    """API返回非200状态码。"""
+
+    def __init__(self, status_code: int, body: str, retry_after: float | None = None):
+        super().__init__(f"API请求失败: {status_code} - {body}")
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+    @property
+    def throttled(self) -> bool:
+        """服务端限流或过载（429/503），应降低并发。"""
+        return self.status_code in (429, 503)
+
+    @property
+    def retryable(self) -> bool:
+        return self.status_code in RETRYABLE_STATUS
+
+
+def parse_retry_after(value: str | None) -> float | None:
+    """解析 Retry-After 头（秒数或HTTP日期），返回需要等待的秒数。"""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt: int, base: float = 1.0, cap: float = 60.0) -> float:
+    """第 attempt 次重试前的指数退避时间（带随机抖动）。"""
+    return random.uniform(0.5, 1.0) * min(cap, base * 2 ** attempt)
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估计文本的token数：CJK字符约每字1个token，其他字符约每4个字符1个token。"""
+    cjk = sum(1 for c in text if "\u3000" <= c <= "\u9fff" or "\uac00" <= c <= "\ud7af" or "\uff00" <= c <= "\uffef")
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def output_token_budget(text: str, max_tokens: int) -> int:
+    """按原文长度估计译文所需的 max_tokens，不超过 max_tokens。"""
+    estimate = int(estimate_tokens(text) * OUTPUT_TOKEN_RATIO) + OUTPUT_TOKEN_MARGIN
+    return max(1, min(max_tokens, max(MIN_OUTPUT_TOKENS, estimate)))
+
+
+def split_block(text: str, max_tokens: int) -> tuple[list[str], str]:
+    """将过长的段落拆分为估计token数不超过 max_tokens 的片段。
+
+    多行段落（表格、列表等）按行拆分，单行段落按句子拆分（HTML表格按行
+    拆分）；单个句子或行超过上限时不再拆分。返回 (片段列表, 拼接译文时的分隔符)。
+    """
+    if "\n" in text.strip():
+        units, sep = text.strip().split("\n"), "\n"
+    else:
+        units, sep = [u for u in SENTENCE_BOUNDARY.split(text.strip()) if u.strip()], " "
+    parts: list[str] = []
+    current: list[str] = []
+    used = 0
+    for unit in units:
+        tokens = estimate_tokens(unit)
+        if current and used + tokens > max_tokens:
+            parts.append(sep.join(current) if sep == "\n" else "".join(current))
+            current, used = [], 0
+        current.append(unit)
+        used += tokens
+    if current:
+        parts.append(sep.join(current) if sep == "\n" else "".join(current))
+    if sep != "\n":
+        parts = [p.strip() for p in parts]
+    return parts, sep
+
+
+def join_translations(parts: list[str], sep: str) -> str:
+    """拼接片段的译文；按句拆分时，中日韩文字之间不加空格。"""
+    if sep == "\n":
+        return "\n".join(p.strip("\n") for p in parts)
     result = ""
-    with httpx.Client(timeout=120) as client:
-        with client.stream("POST", endpoint, headers=headers, json=body) as response:
-            if response.status_code != 200:
-                error_body = response.read().decode()
-                raise RuntimeError(
-                    f"API请求失败: {response.status_code} - {error_body}"
-                )
-            for line in response.iter_lines():
-                line = line.strip()
-                if not line or not line.startswith("data: "):
+    for part in (p.strip() for p in parts):
+        if result and not (CJK_CHAR.match(result[-1]) or CJK_CHAR.match(part[:1])):
+            result += " "
+        result += part
+    return result
+
+
+class _RateBucket:
+    """每分钟限额的令牌桶。"""
+
+    def __init__(self, per_minute: float):
+        self.capacity = per_minute
+        self.level = per_minute
+        self.rate = per_minute / 60
+        self.updated = time.monotonic()
+
+    def wait_time(self, amount: float, now: float) -> float:
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+        amount = min(amount, self.capacity)
+        return 0.0 if self.level >= amount else (amount - self.level) / self.rate
+
+    def take(self, amount: float):
+        self.level -= min(amount, self.capacity)
+
+    def refund(self, amount: float):
+        self.level = min(self.capacity, self.level + amount)
+
+
+class RateController:
+    """翻译请求的自适应并发控制。
+
+    并发上限按AIMD调整：每个成功的请求使上限增加 1/上限（约每轮并发 +1），
+    429/503 使上限减半（一秒内至多一次），并在 Retry-After 期间暂停所有新请求。
+    可选的 rpm/tpm 以令牌桶限制每分钟的请求数和token数；token按输入估计值
+    加 max_tokens 预留，请求结束后退回未用完的部分。
+    """
+
+    def __init__(self, max_concurrency: int, rpm: float | None = None, tpm: float | None = None):
+        self.max_concurrency = max(1, max_concurrency)
+        self.limit = float(self.max_concurrency)
+        self.in_flight = 0
+        self.requests = 0
+        self.throttles = 0
+        self.retries = 0
+        self._requests_bucket = _RateBucket(rpm) if rpm else None
+        self._tokens_bucket = _RateBucket(tpm) if tpm else None
+        self._paused_until = 0.0
+        self._last_decrease = 0.0
+        self._condition = asyncio.Condition()
+
+    async def acquire(self, tokens: int):
+        """等待并占用一个请求名额。"""
+        async with self._condition:
+            while True:
+                now = time.monotonic()
+                wait = self._paused_until - now
+                if wait <= 0 and self.in_flight >= int(self.limit):
+                    await self._condition.wait()
                     continue
-                data = line[6:]  # 去掉 "data: "
-                if data == "[DONE]":
+                if wait <= 0:
+                    wait = max(
+                        self._requests_bucket.wait_time(1, now) if self._requests_bucket else 0.0,
+                        self._tokens_bucket.wait_time(tokens, now) if self._tokens_bucket else 0.0,
+                    )
+                if wait <= 0:
                     break
                 try:
-                    parsed = json.loads(data)
-                    content = parsed.get("choices", [{}])[0].get("delta", {}).get("content", "")
-                    if content:
-                        result += content
-                        # 流式输出到终端
-                        print(content, end="", flush=True)
-                except json.JSONDecodeError:
-                    continue
+                    await asyncio.wait_for(self._condition.wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+            if self._requests_bucket:
+                self._requests_bucket.take(1)
+            if self._tokens_bucket:
+                self._tokens_bucket.take(tokens)
+            self.in_flight += 1
+            self.requests += 1
+
+    async def release(self, succeeded: bool, unused_tokens: int = 0):
+        """释放名额；成功时加性增加并发上限，并退回未用完的token。"""
+        async with self._condition:
+            self.in_flight -= 1
+            if succeeded:
+                self.limit = min(self.max_concurrency, self.limit + 1 / self.limit)
+            if self._tokens_bucket and unused_tokens > 0:
+                self._tokens_bucket.refund(unused_tokens)
+            self._condition.notify_all()
+
+    async def throttle(self, retry_after: float | None):
+        """服务端限流：并发上限减半，并在 Retry-After 期间暂停新请求。"""
+        async with self._condition:
+            now = time.monotonic()
+            self.throttles += 1
+            if now - self._last_decrease >= 1.0:
+                self.limit = max(1.0, self.limit / 2)
+                self._last_decrease = now
+            if retry_after:
+                self._paused_until = max(self._paused_until, now + retry_after)
+            self._condition.notify_all()
+
+
+def create_async_client(max_connections: int, timeout: float = 120) -> httpx.AsyncClient:
+    """创建整个运行共享的连接池客户端；安装了 h2 时启用 HTTP/2。"""
+    limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+    return httpx.AsyncClient(timeout=httpx.Timeout(timeout, connect=10), limits=limits, http2=HTTP2_AVAILABLE)
+
+
+_sync_client: httpx.Client | None = None
+
+
+def get_sync_client() -> httpx.Client:
+    """返回进程内共享的同步客户端，在多次调用间复用连接。"""
+    global _sync_client
+    if _sync_client is None:
+        _sync_client = httpx.Client(timeout=httpx.Timeout(120, connect=10), http2=HTTP2_AVAILABLE)
+    return _sync_client
 
-    # 清除 <think>...</think> 标签
-    think_match = re.search(r"<think>[\s\S]*?</think>\s*", result)
-    if think_match:
-        result = re.sub(r"<think>[\s\S]*?</think>\s*", "", result).strip()
 
-    return result
+def translate_block_streaming(
+    text: str,
+    prompt: str,
+    api_key: str,
+    endpoint: str,
+    model: str,
+    temperature: float | None = None,
+    max_tokens: int = 2000,
+) -> str:
+    """调用OpenAI兼容的流式API翻译单个文本块。"""
+    headers = {
+        "Content-Type": "application/json",
+        "Authorization": f"Bearer {api_key}",
+    }
+    body = build_request_body(text, prompt, model, temperature, max_tokens)
+
+    result = ""
+    with get_sync_client().stream("POST", endpoint, headers=headers, json=body) as response:
+        if response.status_code != 200:
+            error_body = response.read().decode()
+            raise TranslationAPIError(response.status_code, error_body,
+                                      parse_retry_after(response.headers.get("Retry-After")))
+        for line in response.iter_lines():
+            content = parse_stream_line(line)
+            if content is None:
+                break
+            if content:
+                result += content
+                # 流式输出到终端
+                print(content, end="", flush=True)
+
+    return strip_think(result)
+
+
+async def _stream_translation(
+    client: httpx.AsyncClient, endpoint: str, headers: dict, body: dict, echo: bool
+) -> tuple[str, str | None]:
+    """发送一次流式请求，返回 (完整输出, finish_reason)。"""
+    parts: list[str] = []
+    finish_reason = None
+    async with client.stream("POST", endpoint, headers=headers, json=body) as response:
+        if response.status_code != 200:
+            error_body = (await response.aread()).decode()
+            raise TranslationAPIError(response.status_code, error_body,
+                                      parse_retry_after(response.headers.get("Retry-After")))
+        async for line in response.aiter_lines():
+            event = parse_stream_event(line)
+            if event is None:
+                break
+            content, finish_reason = event[0], event[1] or finish_reason
+            if content:
+                parts.append(content)
+                if echo:
+                    print(content, end="", flush=True)
+    return "".join(parts), finish_reason
+
+
+async def _request_with_retries(
+    client: httpx.AsyncClient,
+    endpoint: str,
+    headers: dict,
+    body: dict,
+    echo: bool,
+    controller: RateController | None,
+    max_retries: int,
+) -> tuple[str, str | None]:
+    """发送请求，连接错误、超时、429和5xx按 Retry-After（没有时按指数退避）重试。"""
+    max_tokens = body["max_tokens"]
+    reserved = sum(estimate_tokens(m["content"]) for m in body["messages"]) + max_tokens
+
+    for attempt in range(max_retries + 1):
+        if controller:
+            await controller.acquire(reserved)
+        succeeded = False
+        used = reserved
+        try:
+            result, finish_reason = await _stream_translation(client, endpoint, headers, body, echo)
+            succeeded = True
+            used = reserved - max_tokens + estimate_tokens(result)
+            return result, finish_reason
+        except TranslationAPIError as e:
+            used = 0  # 被拒绝的请求不计入token用量
+            if not e.retryable or attempt == max_retries:
+                raise
+            if e.throttled and controller:
+                await controller.throttle(e.retry_after)
+            delay = e.retry_after if e.retry_after is not None else backoff_delay(attempt)
+            error = str(e.status_code)
+        except httpx.TransportError as e:
+            if attempt == max_retries:
+                raise
+            delay = backoff_delay(attempt)
+            error = type(e).__name__
+        finally:
+            if controller:
+                await controller.release(succeeded, reserved - used)
+        if controller:
+            controller.retries += 1
+        print(f"  请求失败（{error}），{delay:.1f} 秒后重试（{attempt + 1}/{max_retries}）", file=sys.stderr)
+        await asyncio.sleep(delay)
+    raise AssertionError("unreachable")
+
+
+async def translate_block_async(
+    client: httpx.AsyncClient,
+    text: str,
+    prompt: str,
+    api_key: str,
+    endpoint: str,
+    model: str,
+    temperature: float | None = None,
+    max_tokens: int = 2000,
+    echo: bool = False,
+    controller: RateController | None = None,
+    max_retries: int = 5,
+    system: str | None = None,
+    max_tokens_limit: int | None = None,
+) -> str:
+    """translate_block_streaming 的异步版本，使用调用方共享的连接池。
+
+    连接错误、超时、429和5xx会按 Retry-After（没有时按指数退避）重试，
+    最多 max_retries 次；controller 控制并发和速率。echo 为真时流式输出到终端。
+
+    输出因 max_tokens 被截断（finish_reason 为 length）时，max_tokens 加倍后
+    重新请求，直到 max_tokens_limit（默认等于 max_tokens）；仍被截断时抛出
+    TranslationTruncated。
+    """
+    headers = {
+        "Content-Type": "application/json",
+        "Authorization": f"Bearer {api_key}",
+    }
+    limit = max(max_tokens, max_tokens_limit or 0)
+    while True:
+        body = build_request_body(text, prompt, model, temperature, max_tokens, system)
+        result, finish_reason = await _request_with_retries(
+            client, endpoint, headers, body, echo, controller, max_retries
+        )
+        if finish_reason != "length":
+            return strip_think(result)
+        if max_tokens >= limit:
+            raise TranslationTruncated(strip_think(result), max_tokens)
+        max_tokens = min(limit, max_tokens * 2)
+        print(f"  译文被截断，max_tokens 提高到 {max_tokens} 后重试", file=sys.stderr)
+
+
+async def translate_splitting(
+    text: str,
+    request: Callable[[str], Awaitable[str]],
+    split_tokens: int,
+    stats: dict[str, int] | None = None,
+) -> tuple[str, bool]:
+    """翻译一个段落，过长或译文被截断的段落拆分后翻译。
+
+    估计token数超过 split_tokens 的段落先按 split_block 拆分；request 抛出
+    TranslationTruncated 时，段落对半拆分后重试。各片段并发翻译后用
+    join_translations 拼接。无法继续拆分时保留截断的译文。
+
+    Args:
+        text: 原文
+        request: 异步翻译单个文本的函数，译文被截断时抛出 TranslationTruncated
+        split_tokens: 拆分阈值
+        stats: 统计 split_blocks（拆分次数）、parts（片段数）、truncated（未能恢复的截断数）
+
+    Returns:
+        (译文, 是否完整)
+    """
+    stats = {} if stats is None else stats
+
+    def count(key: str, n: int = 1):
+        stats[key] = stats.get(key, 0) + n
+
+    async def translate_parts(part_text: str, max_part_tokens: int) -> tuple[str, bool] | None:
+        parts, sep = split_block(part_text, max_part_tokens)
+        if len(parts) < 2:
+            return None
+        count("split_blocks")
+        count("parts", len(parts))
+        results = await asyncio.gather(*(translate_text(p) for p in parts))
+        return join_translations([t for t, _ in results], sep), all(complete for _, complete in results)
+
+    async def translate_text(part_text: str) -> tuple[str, bool]:
+        if estimate_tokens(part_text) > split_tokens:
+            result = await translate_parts(part_text, split_tokens)
+            if result is not None:
+                return result
+        try:
+            return await request(part_text), True
+        except TranslationTruncated as e:
+            # 达到 max_tokens 上限仍被截断，拆成更小的片段重新翻译
+            result = await translate_parts(part_text, max(1, estimate_tokens(part_text) // 2))
+            if result is not None:
+                return result
+            print(f"  警告：{e}，且无法继续拆分，保留截断的译文", file=sys.stderr)
+            count("truncated")
+            return e.partial, False
+
+    return await translate_text(text)
+
+
+async def translate_all_blocks(
+    blocks: list[str],
+    text_cache: dict[str, str],
+    translate: Callable[[str, int], Awaitable[str]],
+    concurrency: int = 4,
+    on_progress: Callable[[dict[int, str]], None] | None = None,
+    translate_packed: Callable[[list[str], int], Awaitable[list[str] | None]] | None = None,
+    pack_tokens: int = 0,
+) -> list[str]:
+    """并发翻译所有段落，返回与 blocks 顺序一致的译文列表。
+
+    命中缓存的段落和无需翻译的段落不发请求；相同原文的段落只请求一次，
+    按首次出现的顺序由 concurrency 个协程分发。每完成一个请求调用一次
+    on_progress，参数为 {段落序号: 译文}。
+
+    提供 translate_packed 且 pack_tokens 大于0时，相邻的短段落按 pack_groups
+    合并为一个请求；translate_packed 返回 None（译文无法拆分）时，该组
+    改为逐段请求。
+
+    Args:
+        blocks: parse_blocks 得到的段落
+        text_cache: {原文: 译文} 缓存
+        translate: 异步翻译函数，参数为 (原文, 首次出现的段落序号)
+        concurrency: 同时进行的请求数上限
+        on_progress: 进度回调
+        translate_packed: 异步合并翻译函数，参数为 (原文列表, 首段的段落序号)
+        pack_tokens: 每个合并请求的输入token预算
+    """
+    translations: dict[int, str] = {}
+    pending: dict[str, list[int]] = {}  # 原文 -> 所有相同段落的序号
+    for i, block in enumerate(blocks):
+        if block in text_cache:
+            translations[i] = text_cache[block]
+        elif is_skip_block(block):
+            translations[i] = block
+        else:
+            pending.setdefault(block, []).append(i)
+
+    queue: asyncio.Queue[list[str]] = asyncio.Queue()
+    for group in pack_groups(list(pending), pack_tokens if translate_packed else 0):
+        queue.put_nowait(group)
+
+    async def process(group: list[str]):
+        if len(group) == 1:
+            results: list[str] | None = [await translate(group[0], pending[group[0]][0])]
+        else:
+            results = await translate_packed(group, pending[group[0]][0])
+            if results is None:
+                # 拆分失败，逐段重新请求；放回队列后才标记本组完成，queue.join 不会提前返回
+                for text in group:
+                    queue.put_nowait([text])
+                return
+        for text, translation in zip(group, results):
+            for i in pending[text]:
+                translations[i] = translation
+        if on_progress:
+            on_progress(translations)
+
+    async def worker():
+        while True:
+            group = await queue.get()
+            try:
+                await process(group)
+            finally:
+                queue.task_done()
+
+    if queue.empty():
+        return [translations[i] for i in range(len(blocks))]
+
+    # 协程数固定为 concurrency，合并失败后放回队列的单段请求同样并发处理
+    workers = [asyncio.create_task(worker()) for _ in range(max(1, concurrency))]
+    joined = asyncio.create_task(queue.join())
+    try:
+        finished, _ = await asyncio.wait([joined, *workers], return_when=asyncio.FIRST_COMPLETED)
+        for task in finished:
+            if task is not joined:
+                task.result()  # 协程只会因请求失败而结束，抛出该异常
+    finally:
+        # 任一请求失败时取消其余请求，已完成的译文由调用方保存
+        joined.cancel()
+        for task in workers:
+            task.cancel()
+    return [translations[i] for i in range(len(blocks))]
 
 
 def get_progress_path(input_path: str) -> Path:
@@ -188,8 +760,22 @@ def main():
     parser.add_argument("--model", default="warrenwjk/HY-MT1.5-7B:latest", help="模型名称")
     parser.add_argument("--prompt", default=DEFAULT_PROMPT, help="翻译提示词，用ORIGTEXT代替原文")
     parser.add_argument("--temperature", type=float, default=None, help="Temperature参数")
-    parser.add_argument("--max-tokens", type=int, default=2000, help="最大token数")
-    parser.add_argument("--no-cache", action="store_true", help="忽略缓存，强制重新翻译所有段落")
+    parser.add_argument("--max-tokens", type=int, default=2000,
+                        help="单个请求的最大输出token数（默认2000；实际按原文长度设置，被截断时逐步提高到该值）")
+    parser.add_argument("--split-tokens", type=int, default=None,
+                        help="估计token数超过该值的段落按句拆分后并发翻译（默认由--max-tokens推算）")
+    parser.add_argument("--no-cache", action="store_true", help="忽略缓存和翻译记忆，强制重新翻译所有段落")
+    parser.add_argument("--memory", default=str(DEFAULT_MEMORY_PATH),
+                        help="跨文档共享的翻译记忆数据库路径（按规范化原文、模型和提示词复用译文）")
+    parser.add_argument("--memory-max-mb", type=int, default=256, help="翻译记忆的大小上限（MB），超过时淘汰最久未用的记录")
+    parser.add_argument("--no-memory", action="store_true", help="不使用翻译记忆")
+    parser.add_argument("--concurrency", type=int, default=4,
+                        help="同时翻译的段落数上限（默认4；遇到限流时自动降低；为1时流式输出译文到终端）")
+    parser.add_argument("--max-retries", type=int, default=5, help="单个请求失败（连接错误、429、5xx）后的最大重试次数")
+    parser.add_argument("--pack-tokens", type=int, default=0,
+                        help="将相邻的短段落合并为一个请求，每个请求的输入token预算（如800；默认0不合并）")
+    parser.add_argument("--rpm", type=float, default=None, help="每分钟最多请求数（默认不限制）")
+    parser.add_argument("--tpm", type=float, default=None, help="每分钟最多token数（按输入估计值加max-tokens计，默认不限制）")
     args = parser.parse_args()
 
     # API Key: 命令行参数 > 环境变量
@@ -220,36 +806,118 @@ def main():
     total = len(blocks)
     print(f"共 {total} 个段落\n", file=sys.stderr)
 
-    translated_blocks: list[str] = []
-    blocks_data: list[dict] = []
-
-    for i, block in enumerate(blocks):
-        # 检查缓存（按原文内容匹配）
-        if block in text_cache:
-            # print(f"[{i + 1}/{total}] 使用缓存", file=sys.stderr)
-            translation = text_cache[block]
-        else:
-            if is_skip_block(block):
-                translation = block
-            else:
-                print(f"[{i + 1}/{total}] 翻译中...", file=sys.stderr)
-                translation = translate_block_streaming(
-                    text=block,
-                    prompt=args.prompt,
-                    api_key=api_key,
-                    endpoint=args.endpoint,
-                    model=args.model,
-                    temperature=args.temperature,
-                    max_tokens=args.max_tokens,
-                )
-                print("\n", file=sys.stderr)
-
-        assert(len(translated_blocks) == i)
-        translated_blocks.append(translation)
-        blocks_data.append({"original_text": block, "translated_text": translation})
-
-        # 每翻译完一段就保存进度
+    # 翻译记忆：进度文件中没有的段落从记忆中查找，新译文写回记忆
+    memory = None if args.no_memory else TranslationMemory(args.memory, args.memory_max_mb * 1024 * 1024)
+    if memory and not args.no_cache:
+        for block in blocks:
+            if block not in text_cache and not is_skip_block(block):
+                translation = memory.get(block, args.model, args.prompt)
+                if translation is not None:
+                    text_cache[block] = translation
+        if memory.hits:
+            print(f"翻译记忆命中 {memory.hits} 个段落（{memory.path}）\n", file=sys.stderr)
+
+    def remember(text: str, translation: str):
+        if memory:
+            memory.put(text, translation, args.model, args.prompt)
+
+    concurrency = max(1, args.concurrency)
+    # 默认拆分阈值：使估计的译文长度不超过 --max-tokens
+    split_tokens = args.split_tokens or max(
+        1, int((args.max_tokens - OUTPUT_TOKEN_MARGIN) / OUTPUT_TOKEN_RATIO)
+    )
+    # 并发时多个译文同时到达，只在单并发时流式输出到终端
+    echo = concurrency == 1
+    done: dict[int, str] = {i: text_cache[b] for i, b in enumerate(blocks) if b in text_cache}
+    last_save = 0.0
+
+    def save_done(force: bool = False):
+        """按原始段落顺序保存已完成的译文；并发时每秒至多保存一次。"""
+        nonlocal last_save
+        if not force and time.monotonic() - last_save < 1.0:
+            return
+        blocks_data = [
+            {"original_text": blocks[i], "translated_text": done[i]} for i in sorted(done)
+        ]
         save_progress(progress_path, args.input, blocks_data)
+        last_save = time.monotonic()
+
+    def on_progress(translations: dict[int, str]):
+        done.update(translations)
+        save_done(force=echo)
+
+    async def request(text: str, system: str | None = None) -> str:
+        """按原文长度设置 max_tokens 发送一个请求，截断时最多提高到 --max-tokens。"""
+        translation = await translate_block_async(
+            client,
+            text=text,
+            prompt=args.prompt,
+            api_key=api_key,
+            endpoint=args.endpoint,
+            model=args.model,
+            temperature=args.temperature,
+            max_tokens=output_token_budget(text, args.max_tokens),
+            echo=echo,
+            controller=controller,
+            max_retries=args.max_retries,
+            system=system,
+            max_tokens_limit=args.max_tokens,
+        )
+        if echo:
+            print("\n", file=sys.stderr)
+        return translation
+
+    async def translate(text: str, index: int) -> str:
+        print(f"[{index + 1}/{total}] 翻译中...", file=sys.stderr)
+        translation, complete = await translate_splitting(text, request, split_tokens, stats)
+        if complete:
+            remember(text, translation)
+        return translation
+
+    stats = {"packed_requests": 0, "packed_blocks": 0, "fallbacks": 0, "split_blocks": 0, "parts": 0, "truncated": 0}
+
+    async def translate_packed(texts: list[str], index: int) -> list[str] | None:
+        print(f"[{index + 1}/{total}] 翻译中（合并 {len(texts)} 个段落）...", file=sys.stderr)
+        stats["packed_requests"] += 1
+        try:
+            translations = unpack_blocks(await request(pack_blocks(texts), PACK_INSTRUCTION), len(texts))
+        except TranslationTruncated:
+            translations = None
+        if translations is None:
+            stats["fallbacks"] += 1
+            print(f"  合并译文无法按分隔行拆分，改为逐段翻译 {len(texts)} 个段落", file=sys.stderr)
+        else:
+            stats["packed_blocks"] += len(texts)
+            for text, translation in zip(texts, translations):
+                remember(text, translation)
+        return translations
+
+    async def run() -> list[str]:
+        nonlocal client, controller
+        controller = RateController(concurrency, args.rpm, args.tpm)
+        async with create_async_client(concurrency) as client:
+            return await translate_all_blocks(blocks, text_cache, translate, concurrency, on_progress,
+                                              translate_packed, args.pack_tokens)
+
+    client: httpx.AsyncClient | None = None
+    controller: RateController | None = None
+    try:
+        translated_blocks = asyncio.run(run())
+        done.update(enumerate(translated_blocks))
+    finally:
+        # 中断或失败时也保存已完成的段落，下次运行从缓存继续
+        save_done(force=True)
+        if memory:
+            memory.close()
+        if controller and controller.requests:
+            print(f"共 {controller.requests} 次请求，限流 {controller.throttles} 次，重试 {controller.retries} 次，"
+                  f"最终并发上限 {int(controller.limit)}", file=sys.stderr)
+        if stats["packed_requests"]:
+            print(f"合并请求 {stats['packed_requests']} 次，覆盖 {stats['packed_blocks']} 个段落，"
+                  f"拆分失败回退 {stats['fallbacks']} 次", file=sys.stderr)
+        if stats["split_blocks"] or stats["truncated"]:
+            print(f"拆分长段落 {stats['split_blocks']} 次（共 {stats['parts']} 个片段），"
+                  f"截断未能恢复 {stats['truncated']} 个", file=sys.stderr)
 
     footnote_map: dict[str, str] = {}  # 交替模式下的脚标映射: 原名 -> 原名trans
 
@@ -0,0 +1,185 @@
+"""
+跨文档共享的翻译记忆。
+
+译文按规范化后的原文加模型和提示词（提示词决定目标语言）作为键存储，
+因此同一段落无论出现在哪个文档、哪次运行中都只翻译一次。规范化会：
+
+- 统一Unicode形式和换行符，合并行内连续空白，去掉行尾空白；行首缩进
+  保留不变，嵌套列表、缩进的代码和续行与不缩进的文本不会共用译文；
+  行尾的硬换行（两个以上空格规范为两个空格，或反斜杠）保留，硬换行与
+  普通换行不会共用译文；
+- 将脚标名按出现顺序替换为占位符（[^1] -> [^#1]），重新OCR导致脚标
+  重新编号时仍能命中，取出译文时再换回当前段落的脚标名。
+
+记录存放在可由多个进程共享的SQLite数据库中，超过大小上限时按最近最少
+使用的顺序淘汰。
+"""
+
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from pathlib import Path
+
+DEFAULT_MEMORY_PATH = Path.home() / ".cache" / "translate_markdown" / "translation_memory.sqlite"
+
+FOOTNOTE_PATTERN = re.compile(r"\[\^([^\]]+)\]")
+WHITESPACE_PATTERN = re.compile("[ \t\u00a0\u3000]+")
+
+
+def _normalize_line(line: str) -> str:
+    """合并行内连续空白并去掉行尾空白，保留行首缩进和行尾的硬换行。"""
+    content = line.lstrip(" \t\u00a0\u3000")
+    if not content:
+        return ""
+    indent = line[:len(line) - len(content)]
+    # Markdown中行尾两个以上空格表示硬换行，规范为正好两个空格
+    hard_break = "  " if line.endswith("  ") else ""
+    return indent + WHITESPACE_PATTERN.sub(" ", content).rstrip() + hard_break
+
+
+def normalize_text(text: str) -> tuple[str, list[str]]:
+    """规范化原文，返回 (规范化文本, 按出现顺序排列的脚标名)。"""
+    text = unicodedata.normalize("NFC", text.replace("\r\n", "\n"))
+    lines = (_normalize_line(line) for line in text.split("\n"))
+    # 段落最后一行的行尾空格不是硬换行
+    text = "\n".join(line for line in lines if line).rstrip(" ")
+
+    names: list[str] = []
+
+    def mask(m: re.Match) -> str:
+        if m.group(1) not in names:
+            names.append(m.group(1))
+        return f"[^#{names.index(m.group(1)) + 1}]"
+
+    return FOOTNOTE_PATTERN.sub(mask, text), names
+
+
+def _replace_footnotes(text: str, mapping: dict[str, str]) -> str:
+    return FOOTNOTE_PATTERN.sub(lambda m: f"[^{mapping.get(m.group(1), m.group(1))}]", text)
+
+
+class TranslationMemory:
+    """SQLite存储的LRU翻译记忆，键为规范化原文、模型和提示词"""
+
+    def __init__(self, path=DEFAULT_MEMORY_PATH, max_bytes: int = 256 * 1024 * 1024):
+        """
+        打开（或创建）翻译记忆
+
+        Args:
+            path: SQLite数据库文件
+            max_bytes: 存储的原文和译文的大小上限，超过时淘汰最近最少使用的记录
+        """
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS translations (
+                key TEXT PRIMARY KEY,
+                source TEXT NOT NULL,
+                translation TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created REAL NOT NULL,
+                last_access REAL NOT NULL
+            )
+        """)
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS translations_last_access ON translations (last_access)"
+        )
+        self._conn.commit()
+        self._total_bytes = self._stored_bytes()
+
+    @staticmethod
+    def make_key(normalized: str, model: str, prompt: str) -> str:
+        """对规范化原文、模型和提示词计算哈希"""
+        digest = hashlib.sha256()
+        digest.update(json.dumps({"model": model, "prompt": prompt}, sort_keys=True).encode("utf-8"))
+        digest.update(b"\0")
+        digest.update(normalized.encode("utf-8"))
+        return digest.hexdigest()
+
+    def get(self, text: str, model: str, prompt: str) -> str | None:
+        """返回原文的译文（脚标已换成 text 中的脚标名），没有记录时返回 None"""
+        normalized, names = normalize_text(text)
+        key = self.make_key(normalized, model, prompt)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT translation FROM translations WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._conn.execute(
+                "UPDATE translations SET last_access = ? WHERE key = ?", (time.time(), key)
+            )
+            self._conn.commit()
+        return _replace_footnotes(row[0], {f"#{i}": name for i, name in enumerate(names, 1)})
+
+    def put(self, text: str, translation: str, model: str, prompt: str):
+        """保存译文，必要时淘汰旧记录"""
+        normalized, names = normalize_text(text)
+        key = self.make_key(normalized, model, prompt)
+        masked = _replace_footnotes(translation, {name: f"#{i}" for i, name in enumerate(names, 1)})
+        size = len(normalized.encode("utf-8")) + len(masked.encode("utf-8"))
+        now = time.time()
+        with self._lock:
+            old = self._conn.execute("SELECT size FROM translations WHERE key = ?", (key,)).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO translations (key, source, translation, size, created, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, normalized, masked, size, now, now))
+            self._conn.commit()
+            self._total_bytes += size - (old[0] if old else 0)
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+
+    def _stored_bytes(self) -> int:
+        return self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM translations").fetchone()[0]
+
+    def _evict(self):
+        """按最近最少使用的顺序删除记录，直到满足大小上限"""
+        # 其他进程可能同时增加或淘汰了记录
+        self._total_bytes = self._stored_bytes()
+        excess = self._total_bytes - self.max_bytes
+        if excess <= 0:
+            return
+
+        freed = 0
+        victims = []
+        for key, size in self._conn.execute("SELECT key, size FROM translations ORDER BY last_access"):
+            victims.append((key,))
+            freed += size
+            if freed >= excess:
+                break
+        self._conn.executemany("DELETE FROM translations WHERE key = ?", victims)
+        self._conn.commit()
+        self._total_bytes -= freed
+
+    def stats(self) -> dict:
+        """本对象的命中率和共享存储的大小"""
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM translations").fetchone()[0]
+            lookups = self.hits + self.misses
+            return {
+                "path": str(self.path),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "entries": entries,
+                "bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()